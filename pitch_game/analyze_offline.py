@@ -0,0 +1,200 @@
+# analyze_offline.py
+"""
+Batch pitch analysis of recordings.
+
+Every audio file in a directory is streamed hop by hop (never loaded whole)
+through the configured detector (PITCH_METHOD / WIN_SIZE / HOP_SIZE) on a
+process pool with one detector per worker. Voicing is decided as in the
+game: by the post-filter when config POSTFILTER is on (its range from the
+level, if --level has one), otherwise by CONF_THRESH. Each file gets a
+compact pitch track <name>.pitch.npz; with --level it is also scored
+against that level.
+
+Usage:
+  python analyze_offline.py recordings/ -o tracks/
+  python analyze_offline.py recordings/ -o tracks/ --level level.json --offset 0.5 -j 8
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import aubio
+
+from config import SR, HOP_SIZE, WIN_SIZE, PITCH_METHOD, CONF_THRESH, POSTFILTER
+from detectors import make_detector
+from postfilter import PitchPostFilter
+from utils_music import midi_to_hz
+
+AUDIO_EXTS = (".wav", ".flac", ".ogg", ".mp3", ".aif", ".aiff", ".m4a")
+TRACK_SUFFIX = ".pitch.npz"
+GROW_HOPS = 8192   # track buffers grow in steps of this many hops
+
+# per-worker state, built once by _init_worker
+_detector = None
+_postfilter = None  # PitchPostFilter when config POSTFILTER is on
+_target = None     # (t_target, hz_target) when scoring
+
+
+def _init_worker(level_path):
+    global _detector, _postfilter, _target
+    _detector = make_detector(PITCH_METHOD, WIN_SIZE, HOP_SIZE, SR)
+    if POSTFILTER:
+        _postfilter = PitchPostFilter()
+    if level_path:
+        from levels import load_level
+        from game_core import Level
+        events, bpm, meta = load_level(level_path)
+        level = Level(events, bpm, tempo=meta.get("tempo"))
+        _target = (level.t_target, level.hz_target)
+        if _postfilter is not None and "midi_min" in meta and "midi_max" in meta:
+            # the game uses the calibrated range; the level was generated from it
+            _postfilter.set_range(midi_to_hz(meta["midi_min"]), midi_to_hz(meta["midi_max"]))
+
+
+def _reset_detector():
+    # the detector keeps its last window; flush it so files don't bleed into each other
+    silence = np.zeros(HOP_SIZE, dtype=np.float32)
+    for _ in range(WIN_SIZE // HOP_SIZE + 1):
+        _detector(silence)
+
+
+def analyze_file(path, out_path, offset_s=0.0):
+    """Runs in a worker. Returns a small summary dict (the track itself goes to disk)."""
+    t_start = time.perf_counter()
+    _reset_detector()
+    if _postfilter is not None:
+        _postfilter.reset()
+
+    hz = np.empty(GROW_HOPS, dtype=np.float32)
+    conf = np.empty(GROW_HOPS, dtype=np.float16)
+    n = 0
+
+    src = aubio.source(path, SR, HOP_SIZE)   # resamples + downmixes, reads one hop at a time
+    try:
+        while True:
+            samples, read = src()
+            if read < HOP_SIZE:
+                samples[read:] = 0.0
+            f0, c = _detector(samples)
+
+            if n == len(hz):
+                hz = np.resize(hz, n + GROW_HOPS)
+                conf = np.resize(conf, n + GROW_HOPS)
+            if _postfilter is not None:
+                hz[n], c, _ = _postfilter(f0, c, n * HOP_SIZE / SR)
+            else:
+                hz[n] = f0 if (c >= CONF_THRESH and 20.0 < f0 < 2000.0) else np.nan
+            conf[n] = c
+            n += 1
+
+            if read < HOP_SIZE:
+                break
+    finally:
+        src.close()
+
+    hz, conf = hz[:n], conf[:n]
+    np.savez_compressed(
+        out_path, hz=hz, conf=conf,
+        sr=SR, hop=HOP_SIZE, win=WIN_SIZE, method=PITCH_METHOD,
+    )
+
+    summary = {
+        "file": path,
+        "track": out_path,
+        "hops": n,
+        "duration_s": n * HOP_SIZE / SR,
+        "voiced_pct": float(100.0 * np.isfinite(hz).mean()) if n else 0.0,
+        "analysis_s": time.perf_counter() - t_start,
+    }
+    if _target is not None:
+        from scoring import score_track
+        t_user = track_times(n, offset_s)
+        summary["score"] = score_track(t_user, hz, *_target)
+    return summary
+
+
+def track_times(n_hops, offset_s=0.0, sr=SR, hop=HOP_SIZE):
+    """Level time of each hop: hop start, shifted so the level starts `offset_s` into the file."""
+    return np.arange(n_hops) * (hop / sr) - offset_s
+
+
+def load_track(path):
+    """Returns (t, hz, conf, meta) for a .pitch.npz written by analyze_file."""
+    with np.load(path) as z:
+        meta = {k: z[k].item() for k in ("sr", "hop", "win", "method")}
+        hz = z["hz"]
+        conf = z["conf"].astype(np.float32)
+    t = track_times(len(hz), sr=meta["sr"], hop=meta["hop"])
+    return t, hz, conf, meta
+
+
+def track_path(audio_path, input_dir, out_dir):
+    """tracks/<sub>__<name>.pitch.npz, so equal names in subfolders don't collide."""
+    rel = os.path.splitext(os.path.relpath(audio_path, input_dir))[0]
+    return os.path.join(out_dir, rel.replace(os.sep, "__") + TRACK_SUFFIX)
+
+
+def find_audio_files(root):
+    out = []
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            if name.lower().endswith(AUDIO_EXTS):
+                out.append(os.path.join(dirpath, name))
+    # biggest first, so one long file doesn't end up last on a single core
+    return sorted(out, key=os.path.getsize, reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze a directory of recordings in parallel")
+    parser.add_argument("input_dir")
+    parser.add_argument("-o", "--out-dir", default="tracks")
+    parser.add_argument("--level", default=None, help="level JSON (main.py --save-level) to score against")
+    parser.add_argument("--offset", type=float, default=0.0,
+                        help="seconds into each recording where the level starts")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    files = find_audio_files(args.input_dir)
+    if not files:
+        print(f"No audio files found in {args.input_dir}")
+        return
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    print(f"Analyzing {len(files)} files on {args.jobs} workers "
+          f"({PITCH_METHOD}, win {WIN_SIZE}, hop {HOP_SIZE} @ {SR} Hz)")
+    t0 = time.perf_counter()
+    results, failed = [], []
+
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=_init_worker,
+                             initargs=(args.level,)) as pool:
+        futures = {
+            pool.submit(analyze_file, f, track_path(f, args.input_dir, args.out_dir), args.offset): f
+            for f in files
+        }
+        for fut in as_completed(futures):
+            path = futures[fut]
+            try:
+                r = fut.result()
+            except Exception as e:   # unreadable file: report and keep going
+                failed.append({"file": path, "error": str(e)})
+                print(f"  FAILED {path}: {e}")
+                continue
+            results.append(r)
+            line = f"  {os.path.basename(path)}: {r['duration_s']:.1f}s, {r['voiced_pct']:.0f}% voiced"
+            if "score" in r:
+                line += f", accuracy {100 * r['score']['accuracy']:.0f}%"
+            print(line)
+
+    wall = time.perf_counter() - t0
+    audio_s = sum(r["duration_s"] for r in results)
+    print(f"Done: {audio_s:.0f}s of audio in {wall:.1f}s ({audio_s / wall:.0f}x realtime)")
+
+    with open(os.path.join(args.out_dir, "summary.json"), "w") as f:
+        json.dump({"results": results, "failed": failed, "wall_s": wall}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,106 +1,144 @@
 # audio_pitch.py
 import numpy as np
-import sounddevice as sd
-import aubio
 import threading
 import queue
-import time
-from collections import deque
+from collections import namedtuple
 
-from config import SR, HOP_SIZE, WIN_SIZE, PITCH_METHOD, SILENCE_DB, TOLERANCE, CONF_THRESH
+import clock
+from profiler import PROFILER
+from governor import QualityGovernor, level_params
+from detectors import make_detector, YinBatch
+from postfilter import PitchPostFilter
+from echo_cancel import EchoCanceller
+from results_ring import ResultRing, FLAG_VOICED, FLAG_REDUCED, FLAG_AFTER_DROP
+from config import SR, HOP_SIZE, WIN_SIZE, PITCH_METHOD, CONF_THRESH
+from config import GOVERNOR, POSTFILTER, ECHO_CANCEL
 
-class PitchStream:
-    def __init__(self):
-        # aubio pitch object (used ONLY in worker thread)
-        self.pitch_o = aubio.pitch(PITCH_METHOD, WIN_SIZE, HOP_SIZE, SR)
-        self.pitch_o.set_unit("Hz")
-        self.pitch_o.set_silence(SILENCE_DB)
-        self.pitch_o.set_tolerance(TOLERANCE)
+# One detector result. All times are on clock.now():
+#   t_adc: capture time of the hop's first sample (from PortAudio time_info)
+#   t_enq: audio callback handed the hop to the worker
+#   t_det: detector finished
+# The stream keeps results as records of the same fields (+ flags) in a
+# ResultRing; PitchSample is the per-sample form of the older list API.
+PitchSample = namedtuple("PitchSample", ["t_adc", "t_enq", "t_det", "hz", "conf"])
+
+
+class _PitchStreamBase:
+    """
+    What PitchStream and MultiPitchStream share: the audio stream and
+    worker thread life cycle (open_stream), the hop queue between them,
+    and the result ring with its readers. Subclasses do the detection:
+    _callback(indata, frames, time_info, status) turns a block into a
+    queue item (through _enqueue) and _process(*item) analyses it on the
+    worker thread and publishes the result.
+    """
+    def __init__(self, n_channels=1, stream_factory=None, duplex=False):
+        self.n_channels = n_channels
+        # duplex: one sd.Stream for mic and output (add_output), so both run
+        # on the same device clock and callback; otherwise input only
+        self.duplex = duplex
+        # sd.InputStream / sd.Stream, or a stand-in with the same signature
+        # (latency_probe.SimulatedLoopback); sounddevice is only imported
+        # when it is needed, so simulations run without PortAudio
+        if stream_factory is None:
+            import sounddevice as sd
+            stream_factory = sd.Stream if duplex else sd.InputStream
+        self.stream_factory = stream_factory
 
         # hop queue from audio callback -> worker
         self._hop_q = queue.Queue(maxsize=12)
+        self._dropped = 0
+        self._dropped_seen = 0
 
-        # pitch results buffer from worker -> main
-        # stores tuples (timestamp, hz)
-        self._pitch_buf = deque()
-        self._buf_lock = threading.Lock()
+        # pitch results from worker -> consumers: structured ring, read as
+        # array views through cursors; _cursor is the one pop_* use
+        self.results = ResultRing(n_channels=n_channels)
+        self._cursor = self.results.subscribe()
 
-        # latest pitch (still handy)
-        self._latest_hz = np.nan
-        self._latest_conf = 0.0
-        self._latest_t = 0.0
-        self._latest_lock = threading.Lock()
+        # optional SessionRecorder: gets every raw hop and every result
+        self.recorder = None
 
         self._stop = threading.Event()
         self._worker = None
         self._stream = None
 
     # ---------- public properties ----------
-    @property
-    def latest_hz(self):
-        with self._latest_lock:
-            return float(self._latest_hz)
-
-    @property
-    def latest_conf(self):
-        with self._latest_lock:
-            return float(self._latest_conf)
+    def latest_sample(self):
+        """Newest result record, all fields from the same hop (None before the first)."""
+        return self.results.latest()
 
     @property
     def latest_t(self):
-        with self._latest_lock:
-            return float(self._latest_t)
+        rec = self.results.latest()
+        return 0.0 if rec is None else float(rec["t_det"])
 
-    # ---------- pull all new pitch samples ----------
-    def pop_all_pitches(self):
+    # ---------- pull new pitch samples ----------
+    def pop_results(self):
         """
-        Returns a list of (t, hz) for all pitch samples since last call.
-        Thread-safe. Main thread should call this every frame.
+        All results since the last pop, as a structured array (t_adc, t_enq,
+        t_det, hz, conf, flags; see results_ring). A view into the ring, no
+        copy: use it this frame, or copy what you keep. Main thread should
+        call this (or one of the pop_all_* wrappers) every frame; other
+        consumers read through their own subscribe() cursor.
         """
-        with self._buf_lock:
-            out = list(self._pitch_buf)
-            self._pitch_buf.clear()
-        return out
+        t_prof = PROFILER.start()
+        recs, lost = self._cursor.read()
+        if lost:
+            PROFILER.count("main.lost_results", lost)
+        PROFILER.stop("main.pop_pitches", t_prof)
+        return recs
 
-    # ---------- audio callback ----------
-    def _callback(self, indata, frames, time_info, status):
-        if status:
-            pass  # keep RT thread quiet
+    def wait_for_samples(self, timeout):
+        """
+        Block until there are results pop_results hasn't returned yet, or
+        `timeout` passes. Returns True if there are.
+        """
+        return self._cursor.wait(timeout)
 
-        hop = indata[:, 0].copy()
+    def subscribe(self, from_oldest=False):
+        """
+        An independent reader of the results (results_ring.Cursor): it sees
+        every result from now on (or from the oldest still kept), whatever
+        pop_results and other cursors take.
+        """
+        return self.results.subscribe(from_oldest)
+
+    def recent_results(self, n):
+        """View of the newest n results (for drawing a trace window), not consumed."""
+        return self.results.last(n)
+
+    # ---------- audio callback ----------
+    def _enqueue(self, item, t_enq):
+        """Hand one hop's item to the worker; drops it if the worker is behind."""
         try:
-            self._hop_q.put_nowait(hop)
+            self._hop_q.put_nowait(item)
         except queue.Full:
             # drop hop if worker behind -> bounded latency
-            pass
+            self._dropped += 1
+            PROFILER.count("audio.dropped_hops")
+        PROFILER.stop("audio.callback", t_enq)
 
     # ---------- pitch worker thread ----------
+    def _new_drops(self):
+        """Hops dropped since the last call (worker thread)."""
+        dropped = self._dropped - self._dropped_seen
+        self._dropped_seen += dropped
+        return dropped
+
+    def _worker_reset(self):
+        """Per-run worker state, set up when the worker starts."""
+
     def _worker_loop(self):
+        self._dropped_seen = self._dropped
+        self._worker_reset()
         while not self._stop.is_set():
+            t_prof = PROFILER.start()
             try:
-                hop = self._hop_q.get(timeout=0.1)
+                item = self._hop_q.get(timeout=0.1)
             except queue.Empty:
                 continue
-
-            hop = hop.astype(np.float32)
-            f0 = float(self.pitch_o(hop)[0])
-            conf = float(self.pitch_o.get_confidence())
-            t_now = time.time()
-
-            if conf >= CONF_THRESH and 20.0 < f0 < 2000.0:
-                hz_val = f0
-            else:
-                hz_val = np.nan
-
-            # store in rolling buffer for plotting
-            with self._buf_lock:
-                self._pitch_buf.append((t_now, hz_val))
-
-            # also update latest
-            with self._latest_lock:
-                self._latest_hz = hz_val
-                self._latest_conf = conf
-                self._latest_t = t_now
+            PROFILER.stop("worker.queue_wait", t_prof)
+            self._process(*item)
 
     # ---------- context manager ----------
     def open_stream(self):
@@ -116,9 +154,9 @@ class PitchStream:
                 ps._worker = threading.Thread(target=ps._worker_loop, daemon=True)
                 ps._worker.start()
 
-                ps._stream = sd.InputStream(
-                    channels=1,
-                    callback=ps._callback,
+                ps._stream = ps.stream_factory(
+                    channels=ps.n_channels,
+                    callback=ps._stream_callback(),
                     samplerate=SR,
                     blocksize=HOP_SIZE,
                 )
@@ -137,3 +175,370 @@ class PitchStream:
                     ps._worker = None
 
         return _Ctx(self)
+
+    def _stream_callback(self):
+        return self._callback
+
+
+class PitchStream(_PitchStreamBase):
+    def __init__(self, use_governor=GOVERNOR, stream_factory=None, use_postfilter=POSTFILTER,
+                 duplex=False, use_echo_cancel=ECHO_CANCEL):
+        super().__init__(1, stream_factory, duplex)
+
+        # pitch detector (used ONLY in worker thread)
+        self.detector = make_detector(PITCH_METHOD, WIN_SIZE, HOP_SIZE, SR)
+
+        # quality governor: one detector per level, created on first use
+        self.governor = QualityGovernor() if use_governor else None
+        self._level_detectors = {0: self.detector}
+        # last WIN_SIZE raw samples, to prime a detector after a level switch
+        self._history = np.zeros(WIN_SIZE, dtype=np.float32)
+
+        # optional PitchPostFilter: voicing, octave fix, median and hold on the
+        # detector output (worker only); None = plain CONF_THRESH gate
+        self.postfilter = PitchPostFilter() if use_postfilter else None
+
+        # optional EchoCanceller: our own output taken out of each hop before
+        # detection (worker only); needs the duplex stream for the reference
+        self.echo_canceller = EchoCanceller() if use_echo_cancel and duplex else None
+
+        # optional Spectrogram: one column per hop from _history
+        self.spectrogram = None
+        # optional hop_tap(hop, t_adc), called from the audio callback (keep it cheap)
+        self.hop_tap = None
+        # duplex only: sources whose render(out, t_dac) adds into each output block
+        self._outputs = ()
+        self._outputs_lock = threading.Lock()
+
+        # worker-only state, reset in _worker_reset
+        self._pending = []            # hops collected for the current analysis
+        self._pending_times = None    # (t_adc, t_enq) of the first of them
+        self._aec_delay_set = False
+        self._aec_dropped = 0         # drop count the echo canceller has skipped up to
+
+    # ---------- public properties ----------
+    @property
+    def latest_hz(self):
+        rec = self.results.latest()
+        return np.nan if rec is None else float(rec["hz"])
+
+    @property
+    def latest_conf(self):
+        rec = self.results.latest()
+        return 0.0 if rec is None else float(rec["conf"])
+
+    @property
+    def latest_hz_channels(self):
+        return np.array([self.latest_hz])
+
+    @property
+    def quality_level(self):
+        """(current level, number of levels); (0, 1) without a governor."""
+        if self.governor is None:
+            return 0, 1
+        return self.governor.index, len(self.governor.levels)
+
+    # ---------- pull all new pitch samples ----------
+    def pop_all_samples(self):
+        """Same as pop_results, as a list of PitchSample."""
+        return [PitchSample(*r) for r in self.pop_results()[list(PitchSample._fields)].tolist()]
+
+    def pop_all_pitches(self):
+        """
+        Returns a list of (t, hz) for all pitch samples since last call,
+        t being the detection time on clock.now().
+        """
+        return [(s.t_det, s.hz) for s in self.pop_all_samples()]
+
+    def pop_all_channels(self):
+        """Same as pop_all_samples, as one list per channel (see MultiPitchStream)."""
+        return [self.pop_all_samples()]
+
+    # ---------- output (duplex) ----------
+    def add_output(self, source):
+        """
+        Play `source` on the duplex stream: source.render(out, t_dac) adds
+        one mono float32 block, t_dac being when its first sample leaves
+        the DAC (clock.now() time). Runs on the audio thread.
+        """
+        if not self.duplex:
+            raise RuntimeError("add_output needs PitchStream(duplex=True)")
+        with self._outputs_lock:
+            self._outputs = self._outputs + (source,)
+
+    def remove_output(self, source):
+        with self._outputs_lock:
+            self._outputs = tuple(s for s in self._outputs if s is not source)
+
+    def _drop_finished_outputs(self):
+        """
+        Remove sources that set `finished` (played-out clips) and set their
+        `done` event. Done here on the worker thread, as the audio callback
+        must not wait on _outputs_lock; until then they're still called and
+        render nothing.
+        """
+        finished = [s for s in self._outputs if getattr(s, "finished", False)]
+        for source in finished:
+            self.remove_output(source)
+            source.done.set()
+
+    def play(self, audio):
+        """
+        Play a mono float32 clip (at SR) on the duplex stream, from the next
+        block on. Returns a threading.Event that is set when it has ended
+        (by the worker, a hop or so after its last block).
+        """
+        clip = _Clip(audio)
+        self.add_output(clip)
+        return clip.done
+
+    def _duplex_callback(self, indata, outdata, frames, time_info, status):
+        # output first: with echo cancellation the block is the reference
+        # for this callback's input hop
+        # one callback time for both stamps, so time spent rendering
+        # doesn't push the input's ADC time later than the output's DAC time
+        t_callback = clock.now()
+        t_dac = clock.dac_time(time_info, t_callback)
+        outdata[:] = 0.0
+        sources = self._outputs
+        if sources or self.echo_canceller is not None:
+            t_prof = PROFILER.start()
+            mix = outdata[:, 0]
+            for source in sources:
+                source.render(mix, t_dac)
+            PROFILER.stop("audio.output", t_prof)
+        far = outdata[:, 0].copy() if self.echo_canceller is not None else None
+        self._callback(indata, frames, time_info, status, far, t_dac, t_callback)
+        rec = self.recorder
+        if rec is not None:
+            rec.write_output(outdata[:, 0], t_dac)
+
+    # ---------- audio callback ----------
+    def _callback(self, indata, frames, time_info, status, far=None, t_dac=None, t_callback=None):
+        if status:
+            pass  # keep RT thread quiet
+
+        t_enq = clock.now()
+        t_adc = clock.adc_time(time_info, frames, SR, t_enq if t_callback is None else t_callback)
+
+        hop = indata[:, 0].copy()
+        rec = self.recorder
+        if rec is not None:
+            rec.write_audio(hop, t_adc)
+        tap = self.hop_tap
+        if tap is not None:
+            tap(hop, t_adc)
+        # with the drop count so far: the worker can tell where a gap was
+        self._enqueue((hop, t_adc, t_enq, far, t_dac, self._dropped), t_enq)
+
+    def _stream_callback(self):
+        return self._duplex_callback if self.duplex else self._callback
+
+    # ---------- pitch worker thread ----------
+    def _switch_level(self, index):
+        """Swap in the detector for governor level `index`, primed with recent audio."""
+        detector = self._level_detectors.get(index)
+        if detector is None:
+            win, hop, sr = level_params(self.governor.levels[index])
+            detector = make_detector(PITCH_METHOD, win, hop, sr)
+            self._level_detectors[index] = detector
+        self.detector = detector
+
+        # refill its window so the first results after the switch are valid
+        level = self.governor.levels[index]
+        _, hop, _ = level_params(level)
+        primer = self._history
+        if level.decim > 1:
+            primer = primer.reshape(-1, level.decim).mean(axis=1, dtype=np.float32)
+        for i in range(0, len(primer) - hop + 1, hop):
+            detector(primer[i:i + hop])
+
+    def _worker_reset(self):
+        self._pending = []
+        self._pending_times = None
+        self._aec_delay_set = False
+        self._aec_dropped = self._dropped
+
+    def _process(self, hop, t_adc, t_enq, far, t_dac, dropped_before):
+        if self._outputs:
+            self._drop_finished_outputs()
+
+        hop = hop.astype(np.float32)
+        aec = self.echo_canceller
+        if aec is not None:
+            if not self._aec_delay_set:
+                # output -> input latency is fixed for the stream's life
+                aec.set_delay(t_dac - t_adc)
+                self._aec_delay_set = True
+            if dropped_before != self._aec_dropped:
+                # hops dropped just before this one took their output blocks
+                # along: move the reference on so it stays in step with the mic
+                aec.skip(dropped_before - self._aec_dropped)
+                self._aec_dropped = dropped_before
+            with PROFILER.section("worker.echo_cancel"):
+                hop = aec.process(hop, far)
+        n = len(hop)
+        self._history[:-n] = self._history[n:]
+        self._history[-n:] = hop
+
+        spec = self.spectrogram
+        if spec is not None:
+            # reuses the analysis window; the first thing dropped under overload
+            with PROFILER.section("worker.spectrogram"):
+                spec.push(self._history, t_adc, skip=self.governor is not None and self.governor.index > 0)
+
+        level = self.governor.level if self.governor else None
+        if level is not None and level.hop_mult > 1:
+            pending = self._pending
+            if not pending:
+                # the merged hop is stamped with its first sub-hop's times
+                self._pending_times = (t_adc, t_enq)
+            pending.append(hop)
+            if len(pending) < level.hop_mult:
+                return
+            hop = np.concatenate(pending)
+            pending.clear()
+            t_adc, t_enq = self._pending_times
+        if level is not None and level.decim > 1:
+            # pairwise mean: cheap low-pass + decimation, fine for voice f0
+            hop = hop.reshape(-1, level.decim).mean(axis=1, dtype=np.float32)
+
+        t_start = clock.now()
+        f0, conf = self.detector(hop)
+        t_det = clock.now()
+        if PROFILER.enabled:
+            PROFILER.add("worker.detect", t_det - t_start)
+
+        dropped = self._new_drops()
+        if self.governor is not None:
+            if self.governor.observe(self._hop_q.qsize(), t_det - t_start, dropped):
+                self._pending.clear()
+                self._switch_level(self.governor.index)
+                PROFILER.count("worker.quality_switches")
+
+        flags = FLAG_AFTER_DROP if dropped else 0
+        pf = self.postfilter
+        if pf is not None:
+            hz_val, conf, pf_flags = pf(f0, conf, t_adc)
+            flags |= pf_flags
+        elif conf >= CONF_THRESH and 20.0 < f0 < 2000.0:
+            hz_val = f0
+            flags |= FLAG_VOICED
+        else:
+            hz_val = np.nan
+        if self.governor is not None and self.governor.index > 0:
+            flags |= FLAG_REDUCED
+
+        self.results.publish(t_adc, t_enq, t_det, hz_val, conf, flags)
+
+        rec = self.recorder
+        if rec is not None:
+            rec.write_pitch(t_adc, hz_val, conf)
+
+
+class _Clip:
+    """One-shot output source for PitchStream.play(); the worker removes it once finished."""
+    def __init__(self, audio):
+        self.audio = np.asarray(audio, dtype=np.float32)
+        self.pos = 0
+        self.finished = False
+        self.done = threading.Event()
+
+    def render(self, out, t_dac):
+        chunk = self.audio[self.pos:self.pos + len(out)]
+        out[:len(chunk)] += chunk
+        self.pos += len(chunk)
+        if self.pos >= len(self.audio):
+            self.finished = True
+
+
+class MultiPitchStream(_PitchStreamBase):
+    """
+    One mic per singer on a multi-channel interface.
+
+    Same life cycle and readers as PitchStream (open_stream(),
+    wait_for_samples(), subscribe(); see _PitchStreamBase), but every hop
+    carries all channels and the worker runs a single batched YinBatch
+    pass over them, so CPU grows much slower than the channel count.
+    Results go into one ResultRing with hz/conf per channel:
+
+        pop_results()         records, recs["hz"][:, ch] for one singer
+        pop_all_pitches(ch)   (t_det, hz) list for one singer
+        pop_all_channels()    PitchSample lists for every singer at once
+
+    latest_hz is the median over currently voiced channels (a group
+    estimate, e.g. for calibration). No quality governor, post-filter,
+    duplex output or echo cancellation here (plain CONF_THRESH gate per
+    channel), and a SessionRecorder only gets channel 0.
+    """
+    governor = None
+    postfilter = None
+    echo_canceller = None
+    quality_level = (0, 1)
+
+    def __init__(self, n_channels, stream_factory=None):
+        super().__init__(n_channels, stream_factory)
+        self.detector = YinBatch(n_channels, WIN_SIZE, HOP_SIZE, SR)
+
+    # ---------- public properties ----------
+    @property
+    def latest_hz_channels(self):
+        rec = self.results.latest()
+        return np.full(self.n_channels, np.nan) if rec is None else rec["hz"].astype(float)
+
+    @property
+    def latest_hz(self):
+        hz = self.latest_hz_channels
+        hz = hz[np.isfinite(hz)]
+        return float(np.median(hz)) if len(hz) else np.nan
+
+    @property
+    def latest_conf(self):
+        rec = self.results.latest()
+        return 0.0 if rec is None else float(np.max(rec["conf"]))
+
+    # ---------- pull new pitch samples ----------
+    def pop_all_channels(self):
+        recs = self.pop_results()
+        times = recs[["t_adc", "t_enq", "t_det"]].tolist()
+        hz, conf = recs["hz"].tolist(), recs["conf"].tolist()
+        return [
+            [PitchSample(*t, h[ch], c[ch]) for t, h, c in zip(times, hz, conf)]
+            for ch in range(self.n_channels)
+        ]
+
+    def pop_all_samples(self, ch=0):
+        """Channel ch of the results since the last pop (the other channels are consumed too)."""
+        return self.pop_all_channels()[ch]
+
+    def pop_all_pitches(self, ch=0):
+        return [(s.t_det, s.hz) for s in self.pop_all_samples(ch)]
+
+    # ---------- audio callback ----------
+    def _callback(self, indata, frames, time_info, status):
+        t_enq = clock.now()
+        t_adc = clock.adc_time(time_info, frames, SR, t_enq)
+
+        hops = np.ascontiguousarray(indata.T, dtype=np.float32)   # (channels, frames)
+        rec = self.recorder
+        if rec is not None:
+            rec.write_audio(hops[0], t_adc)
+        self._enqueue((hops, t_adc, t_enq), t_enq)
+
+    # ---------- pitch worker thread ----------
+    def _process(self, hops, t_adc, t_enq):
+        t_prof = PROFILER.start()
+        f0, conf = self.detector(hops)
+        t_det = clock.now()
+        PROFILER.stop("worker.detect", t_prof)
+
+        hz = np.where((conf >= CONF_THRESH) & (f0 > 20.0) & (f0 < 2000.0), f0, np.nan)
+        flags = FLAG_VOICED if np.isfinite(hz).any() else 0
+        if self._new_drops():
+            flags |= FLAG_AFTER_DROP
+
+        self.results.publish(t_adc, t_enq, t_det, hz, conf, flags)
+
+        rec = self.recorder
+        if rec is not None:
+            rec.write_pitch(t_adc, hz[0], conf[0])
@@ -0,0 +1,151 @@
+# bench_music.py
+"""
+Microbenchmark of the music-math kernels in utils_music against the
+inline float64 code they replaced in the renderer, scoring, level
+building and scale snapping. Reports microseconds per call (best of
+several repeats) and checks both versions agree.
+
+Usage:
+  python bench_music.py
+  python bench_music.py -n 4096 --repeat 9
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+
+from utils_music import hz_to_midi, midi_to_hz, cents_error, midi_names, quantize_to_scale, NOTE_NAMES
+from melody_generator import MODES
+from target_trace import events_to_target_trace
+from config import SR, HOP_SIZE, DY_SEMITONES, Y_STEP_SEMITONE
+
+
+# ---------- the code before the kernels ----------
+def legacy_hz_to_midi(hz):
+    hz = np.asarray(hz, float)
+    return 69 + 12 * np.log2(hz / 440.0)
+
+
+def legacy_cents(hz_sung, hz_target):
+    both = np.isfinite(hz_target) & np.isfinite(hz_sung)
+    cents = np.full(len(hz_target), np.nan)
+    cents[both] = 1200 * np.log2(hz_sung[both] / hz_target[both])
+    return cents
+
+
+def legacy_lane(y_bins, midi_q, dy):
+    rgba = np.zeros((len(y_bins), len(midi_q), 4), dtype=np.float32)
+    for k in range(len(midi_q)):
+        m = midi_q[k]
+        if not np.isfinite(m):
+            continue
+        mask = np.abs(y_bins - m) <= dy
+        rgba[mask, k] = (0.0, 1.0, 0.0, 1.0)
+    return rgba
+
+
+def lane(y_bins, midi_q, dy):
+    rgba = np.zeros((len(y_bins), len(midi_q), 4), dtype=np.float32)
+    with np.errstate(invalid="ignore"):
+        mask = np.abs(y_bins[:, None] - midi_q[None, :]) <= dy
+    rgba[mask] = (0.0, 1.0, 0.0, 1.0)
+    return rgba
+
+
+def legacy_trace(events, bpm, hop_size, sr):
+    dt = hop_size / sr
+    t_list, hz_list, t = [], [], 0.0
+    for dur_beats, note_midi in events:
+        n_frames = int(np.round(dur_beats * 60.0 / bpm / dt))
+        hz_val = np.nan if note_midi is None else float(midi_to_hz(note_midi))
+        for _ in range(n_frames):
+            t_list.append(t)
+            hz_list.append(hz_val)
+            t += dt
+    return np.array(t_list, float), np.array(hz_list, float)
+
+
+def legacy_snap(midi, tonic, offsets):
+    out = []
+    for m in midi:
+        if not np.isfinite(m):
+            out.append(np.nan)
+            continue
+        base = tonic + 12 * math.floor((m - tonic) / 12)
+        notes = [base + o for o in offsets] + [base + 12 + min(offsets)]
+        out.append(min(notes, key=lambda c: (abs(m - c), c)))
+    return out
+
+
+def legacy_names(midi):
+    return [f"{NOTE_NAMES[int(round(m)) % 12]}{int(round(m)) // 12 - 1}" for m in midi]
+
+
+# ---------- harness ----------
+def _time(fn, repeat, number):
+    best = math.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - t0) / number)
+    return best * 1e6
+
+
+def _check(name, a, b, atol):
+    a, b = np.asarray(a), np.asarray(b)
+    if a.dtype == object or b.dtype == object:
+        ok = np.array_equal(a, b)
+    else:
+        ok = np.allclose(a, b, atol=atol, equal_nan=True)
+    if not ok:
+        raise SystemExit(f"{name}: kernel and legacy results differ")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the utils_music kernels")
+    parser.add_argument("-n", type=int, default=2048, help="trace length (samples)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    n = args.n
+    hz = rng.uniform(100, 800, n)
+    hz[rng.random(n) < 0.2] = np.nan            # unvoiced gaps
+    hz32 = hz.astype(np.float32)
+    buf = np.empty(n, dtype=np.float32)
+    target = np.where(rng.random(n) < 0.1, np.nan, rng.uniform(100, 800, n))
+
+    events = [(float(rng.choice([0.5, 1.0, 2.0])), None if rng.random() < 0.15 else int(rng.integers(48, 72)))
+              for _ in range(64)]
+    _, hz_t = events_to_target_trace(events, 90, HOP_SIZE, SR)
+    midi_q = np.round(legacy_hz_to_midi(hz_t))
+    y_bins = np.arange(45.0, 76.0, Y_STEP_SEMITONE)
+    midi_int = rng.integers(36, 84, 512).astype(float)
+    midi_sung = legacy_hz_to_midi(hz[:512])
+
+    cases = [
+        ("hz_to_midi trace", lambda: legacy_hz_to_midi(hz), lambda: hz_to_midi(hz32, out=buf), 1e-3),
+        ("cents vs target", lambda: legacy_cents(hz, target), lambda: cents_error(hz, target), 1e-9),
+        (f"lane map {len(y_bins)}x{len(midi_q)}", lambda: legacy_lane(y_bins, midi_q, DY_SEMITONES),
+         lambda: lane(y_bins, midi_q, DY_SEMITONES), 0.0),
+        (f"target trace {len(hz_t)} hops", lambda: legacy_trace(events, 90, HOP_SIZE, SR)[1],
+         lambda: events_to_target_trace(events, 90, HOP_SIZE, SR)[1], 1e-9),
+        ("note names x512", lambda: legacy_names(midi_int), lambda: midi_names(midi_int), 0.0),
+        ("scale snap x512", lambda: legacy_snap(midi_sung, 62, MODES["dorian"]),
+         lambda: quantize_to_scale(midi_sung, 62, MODES["dorian"]), 0.0),
+    ]
+
+    print(f"{'':28}{'legacy us':>12}{'kernel us':>12}{'speedup':>10}")
+    for name, old, new, atol in cases:
+        _check(name, old(), new(), atol)
+        number = max(1, int(0.05 / max(1e-7, _time(old, 1, 1) * 1e-6)))
+        t_old = _time(old, args.repeat, number)
+        t_new = _time(new, args.repeat, number)
+        print(f"{name:<28}{t_old:12.1f}{t_new:12.1f}{t_old / t_new:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
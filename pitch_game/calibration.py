@@ -7,14 +7,19 @@ from config import (
 )
 
 def _collect_pitches(pitch_stream, seconds):
-    pitches = []
+    # every result of the next `seconds`, through our own cursor; with one
+    # mic per singer, each hop counts as the median of the voiced singers
+    cursor = pitch_stream.subscribe()
+    chunks = []
     t_end = time.time() + seconds
     while time.time() < t_end:
-        hz = pitch_stream.latest_hz
-        if np.isfinite(hz):
-            pitches.append(hz)
-        time.sleep(0.01)
-    return np.array(pitches)
+        cursor.wait(t_end - time.time())
+        recs, _ = cursor.read()
+        hz = recs["hz"].reshape(len(recs), -1)
+        voiced = np.isfinite(hz).any(axis=1)
+        if voiced.any():
+            chunks.append(np.nanmedian(hz[voiced], axis=1))
+    return np.concatenate(chunks) if chunks else np.array([])
 
 def run_calibration(pitch_stream, truncate_frac=0.05):
     """
@@ -0,0 +1,39 @@
+# clock.py
+import time
+
+
+def now():
+    """
+    Current time on the shared monotonic clock.
+    Every pipeline timestamp (capture, enqueue, detection, frame) uses this,
+    so differences between stages are meaningful.
+    """
+    return time.perf_counter()
+
+
+def adc_time(time_info, frames, sr, t_callback):
+    """
+    Convert a PortAudio callback's input ADC time to our clock.
+
+    PortAudio reports `inputBufferAdcTime` and `currentTime` on the stream's
+    own clock; only their difference is meaningful to us. Some host APIs
+    report zeros, in which case we assume the buffer was just captured.
+    """
+    adc = getattr(time_info, "inputBufferAdcTime", 0.0) or 0.0
+    cur = getattr(time_info, "currentTime", 0.0) or 0.0
+    if adc > 0.0 and cur > 0.0:
+        return t_callback - max(0.0, cur - adc)
+    return t_callback - frames / sr
+
+
+def dac_time(time_info, t_callback):
+    """
+    Output counterpart of adc_time: when the first sample of an output
+    callback's buffer leaves the DAC, on our clock. Without PortAudio
+    times, assume it plays right away.
+    """
+    dac = getattr(time_info, "outputBufferDacTime", 0.0) or 0.0
+    cur = getattr(time_info, "currentTime", 0.0) or 0.0
+    if dac > 0.0 and cur > 0.0:
+        return t_callback + (dac - cur)
+    return t_callback
@@ -5,15 +5,41 @@ HOP_SIZE = 512
 WIN_SIZE = 4096
 
 # Pitch detection
+INPUT_CHANNELS = 1     # >1: one mic per singer, batched detection on every channel
 PITCH_METHOD = "yin"
 SILENCE_DB = -60
 TOLERANCE = 0.8
 CONF_THRESH = 0.6
+RESULT_RING_SIZE = 4096   # pitch results kept for readers (~47 s of hops)
+
+# Post-filter on the detector output (postfilter.py): median, octave fix, hold.
+# Off: in bench_detectors it has not beaten the raw detector (more lag on
+# moving pitch, no octave errors fixed that calibration doesn't share)
+POSTFILTER = False
+POSTFILTER_MEDIAN = 3              # hops in the running median (odd; each 2 add a hop of lag)
+POSTFILTER_CONF_HYST = 0.1         # a note continues down to CONF_THRESH minus this
+POSTFILTER_OCTAVE_HISTORY = 15     # octave reference = median of this many recent outputs
+POSTFILTER_OCTAVE_ACCEPT_S = 0.12  # an octave jump that lasts this long is real
+POSTFILTER_HOLD_S = 0.06           # longest dropout bridged inside a note (at confidence 1)
+POSTFILTER_RANGE_MARGIN = 4.0      # semitones beyond the calibrated range taken as is
+
+# Quality governor: coarser analysis instead of dropped hops under CPU overload
+GOVERNOR = True
+GOV_BACKLOG_HIGH = 4     # queued hops that count as falling behind
+GOV_LOAD_HIGH = 0.7      # detector time / hop period
+GOV_LOAD_LOW = 0.3
+GOV_DOWN_AFTER = 3       # overloaded analyses in a row before stepping down
+GOV_UP_AFTER_SEC = 3.0   # seconds of headroom before stepping back up
 
 # Game / melody
 DEFAULT_BPM = 70
 MODE_NAME = "ionian"   # ionian, dorian, aeolian, mixolydian
 PHRASES = 4
+STYLE_PRESET = None    # trained melody style (python style_trainer.py <midi folder> --style NAME); None = built-in generator
+STYLES_DIR = "styles"  # where style_trainer.py writes presets
+LEVEL_SPEED = 1.0      # practice slow-down: play levels at this x their tempo (0.8 = 80%)
+TEMPO_KEY_STEP = 0.05  # Up/Down during a level: speed change per key press
+TEMPO_SPEED_RANGE = (0.5, 1.5)
 DY_SEMITONES = 0.5     # green lane half-width (semitones)
 
 # NEW DIFFICULTY KNOBS
@@ -27,6 +53,8 @@ CALIB_PERCENTILE_LOW = 10
 CALIB_PERCENTILE_HIGH = 90
 
 # Renderer
+RENDERER = "matplotlib"   # "matplotlib", or "pygame" (pip install pygame) for much lower CPU
+PYGAME_WINDOW_SIZE = (1000, 600)
 WINDOW_SECONDS = 5.0
 Y_STEP_SEMITONE = 0.1
 ALPHA_GREEN = 0.25
@@ -34,11 +62,73 @@ ALPHA_BLUE = 0.06
 
 LOOKAHEAD_SECONDS = 1   # how far ahead to show next target note
 
+# Live spectrogram under the lane (harmonics, breathiness); matplotlib renderer only
+SHOW_SPECTROGRAM = False
+SPECTROGRAM_DB_RANGE = (-50.0, -10.0)   # dBFS mapped to white..black
+SPECTROGRAM_ALPHA = 0.5
+
+# Latency
+LATENCY_COMPENSATION = True  # plot/score your trace at its capture time, not detection time
+SHOW_LATENCY_STATS = True    # live per-stage latency overlay
+LATENCY_HISTORY = 500        # samples kept per stage for percentiles/histograms
+LATENCY_HIST_BINS = 8
+LATENCY_HIST_MAX_MS = 200.0
+
+# Latency probe (latency_probe.py)
+PROBE_HZ = 880.0
+PROBE_TONE_S = 0.3
+PROBE_GAP_S = 0.5
+PROBE_COUNT = 20
+PROBE_AMPLITUDE = 0.3
+
+# Frame scheduling
+FRAME_MAX_FPS = 60       # cap while your trace is changing
+FRAME_QUIET_FPS = 20     # only the lane scrolls (no new voiced pitch)
+FRAME_MIN_FPS = 10       # floor on a slow machine
+FRAME_CPU_BUDGET = 0.5   # max fraction of main-thread time spent drawing
+IDLE_POLL_HZ = 10        # window-event polling once the level is over
+
 
 PLAY_SCALE_WARMUP = True   # turn off if you want
 WARMUP_NOTE_BEATS = 0.2    # scale note length in beats
 WARMUP_PAUSE_BEATS = 0.05  # pause between notes in beats
 WARMUP_REPEATS = 1
 
+# Guide voice: the target played softly during the level (guide_tone.py).
+# Use headphones, or the mic hears the guide instead of you.
+GUIDE_TONE = False
+GUIDE_VOLUME = 0.15                  # peak amplitude
+GUIDE_HARMONICS = (1.0, 0.4, 0.15)   # relative partial amplitudes (soft, a little reedy)
+GUIDE_FADE_S = 0.015                 # attack/release at note edges
+DUPLEX_AUDIO = True                  # guide on the mic's stream (one device clock); False = own output stream
+
+# Echo cancellation: subtract our own output from the mic (echo_cancel.py).
+# Needs DUPLEX_AUDIO (the output is the reference); for playing through speakers.
+ECHO_CANCEL = False
+AEC_FILTER_S = 0.1          # room echo tail the filter covers (one partition per hop)
+AEC_STEP = 0.5              # NLMS step (0..1): lower adapts slower, steadier under singing
+AEC_DELAY_MARGIN_S = 0.005  # reported output->input latency minus this goes into a delay line
+
+# Session recording (raw audio + pitch samples, see recorder.py)
+RECORD_SESSIONS = False
+SESSIONS_DIR = "sessions"
+RECORD_AUDIO_CHUNK = 16384   # samples per write chunk (~0.37 s)
+RECORD_PITCH_CHUNK = 256     # pitch records per write chunk
+RECORD_BUFFERS = 16          # chunks in flight before data is dropped
+
+# Headless multi-client server (game_server.py)
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+SERVER_TICK_HZ = 20              # state messages per client per second
+SERVER_WORKERS = 0               # scoring processes (shards); 0 = one per CPU
+SERVER_MAX_BUFFER = 256 * 1024   # bytes queued to a slow client before its states are dropped
+SERVER_MAX_EVENTS = 2000         # notes + rests in a client-sent level (and tempo segments)
+SERVER_MAX_LEVEL_S = 900.0       # longest client-sent level, seconds
+SERVER_BPM_RANGE = (20.0, 400.0) # tempos a client-sent level may use
+
+# Progress history (SQLite, see history.py)
+SAVE_HISTORY = True
+HISTORY_DB = "history.sqlite"
+
 TONIC_NAME = "C"      # pitch class: C, C#, D, Eb, E, F, F#, G, Ab, A, Bb, B
 FORCE_TONIC_KEY = True  # if False, tonic is auto-chosen from tessitura center
\ No newline at end of file
@@ -0,0 +1,146 @@
+# detectors.py
+import aubio
+import numpy as np
+
+from config import SILENCE_DB, TOLERANCE
+
+AUBIO_METHODS = ("yin", "yinfast", "yinfft", "specacf", "mcomb", "fcomb", "schmitt")
+
+# aubio only computes a confidence for these; the others always report 0
+# (so does yinfft in aubio 0.4.x)
+_HAS_CONFIDENCE = {"yin", "yinfast", "specacf"}
+
+
+class AubioDetector:
+    """
+    One aubio pitch object behind a uniform interface:
+        hz, conf = detector(hop)      # hop: float32 array of hop_size samples
+    Methods without a confidence get conf = 1.0 whenever they return a pitch,
+    so the usual CONF_THRESH gate still works for them.
+    """
+    def __init__(self, method, win_size, hop_size, sr,
+                 silence_db=SILENCE_DB, tolerance=TOLERANCE):
+        self.name = f"aubio-{method}"
+        self.method = method
+        self.win_size = win_size
+        self.hop_size = hop_size
+        self.sr = sr
+
+        self._o = aubio.pitch(method, win_size, hop_size, sr)
+        self._o.set_unit("Hz")
+        self._o.set_silence(silence_db)
+        self._o.set_tolerance(tolerance)
+        self._has_conf = method in _HAS_CONFIDENCE
+
+    def __call__(self, hop):
+        f0 = float(self._o(hop)[0])
+        if self._has_conf:
+            conf = float(self._o.get_confidence())
+        else:
+            conf = 1.0 if f0 > 0.0 else 0.0
+        return f0, conf
+
+
+class YinBatch:
+    """
+    YIN on several channels at once, in NumPy:
+        hz, conf = yin(hops)      # hops: (n_channels, hop_size) float32
+    Each channel keeps its own win_size window. The difference function of
+    all channels comes out of one batched rfft/irfft pair, so adding a
+    channel costs far less than another detector call; silent channels
+    (below silence_db) are skipped entirely and report hz = 0.
+    Threshold/confidence follow aubio's yin: first dip below `tolerance`,
+    else the global minimum, conf = 1 - cmndf at the chosen lag.
+    """
+    def __init__(self, n_channels, win_size, hop_size, sr,
+                 silence_db=SILENCE_DB, tolerance=TOLERANCE, fmax_hz=2000.0):
+        self.n_channels = n_channels
+        self.win_size = win_size
+        self.hop_size = hop_size
+        self.sr = sr
+        self.silence_db = silence_db
+        self.tolerance = tolerance
+        self.tau_min = max(2, int(sr / fmax_hz))
+
+        self._win = np.zeros((n_channels, win_size), dtype=np.float32)
+        self._half = win_size // 2
+        self._tau = np.arange(self._half, dtype=np.float32)
+
+    def __call__(self, hops):
+        hops = np.asarray(hops, dtype=np.float32).reshape(self.n_channels, -1)
+        n = hops.shape[1]
+        win = self._win
+        win[:, :-n] = win[:, n:]
+        win[:, -n:] = hops
+
+        hz = np.zeros(self.n_channels, dtype=np.float32)
+        conf = np.zeros(self.n_channels, dtype=np.float32)
+
+        with np.errstate(divide="ignore"):
+            level_db = 10.0 * np.log10(np.mean(hops * hops, axis=1))
+        active = np.flatnonzero(level_db >= self.silence_db)
+        if len(active) == 0:
+            return hz, conf
+        x = win[active]
+        H = self._half
+
+        # d(tau) = e(0) + e(tau) - 2 r(tau), r from one batched FFT
+        spec = np.fft.rfft(x, axis=1)
+        head = np.fft.rfft(x[:, :H], n=self.win_size, axis=1)
+        r = np.fft.irfft(np.conj(head) * spec, n=self.win_size, axis=1)[:, :H]
+        cs = np.concatenate([np.zeros((len(active), 1)), np.cumsum(x.astype(np.float64) ** 2, axis=1)], axis=1)
+        energy = cs[:, H:H + H] - cs[:, :H]
+        d = np.maximum(energy[:, :1] + energy - 2.0 * r, 0.0)
+
+        # cumulative mean normalized difference
+        cum = np.cumsum(d[:, 1:], axis=1)
+        cmndf = np.ones_like(d)
+        cmndf[:, 1:] = d[:, 1:] * self._tau[1:] / np.where(cum > 0, cum, 1.0)
+
+        lo = self.tau_min
+        mid = cmndf[:, lo:-1]
+        dips = (mid < self.tolerance) & (mid < cmndf[:, lo + 1:])
+        has_dip = dips.any(axis=1)
+        tau = np.where(has_dip, dips.argmax(axis=1), mid.argmin(axis=1)) + lo
+
+        # parabolic interpolation around the chosen lag
+        rows = np.arange(len(active))
+        a, b, c = cmndf[rows, tau - 1], cmndf[rows, tau], cmndf[rows, tau + 1]
+        denom = a - 2.0 * b + c
+        shift = np.where(denom > 0, 0.5 * (a - c) / np.where(denom > 0, denom, 1.0), 0.0)
+        hz[active] = self.sr / (tau + np.clip(shift, -0.5, 0.5))
+        conf[active] = np.clip(1.0 - b, 0.0, 1.0)
+        return hz, conf
+
+
+class NumpyYinDetector:
+    """Single-channel YinBatch behind the usual detector interface."""
+    def __init__(self, win_size, hop_size, sr, silence_db=SILENCE_DB, tolerance=TOLERANCE):
+        self.name = "numpy-yin"
+        self.win_size = win_size
+        self.hop_size = hop_size
+        self.sr = sr
+        self._yin = YinBatch(1, win_size, hop_size, sr, silence_db, tolerance)
+
+    def __call__(self, hop):
+        hz, conf = self._yin(hop[None, :])
+        return float(hz[0]), float(conf[0])
+
+
+# backend name -> factory(win_size, hop_size, sr, **options)
+BACKENDS = {
+    f"aubio-{m}": (lambda win, hop, sr, m=m, **kw: AubioDetector(m, win, hop, sr, **kw))
+    for m in AUBIO_METHODS
+}
+BACKENDS["numpy-yin"] = NumpyYinDetector
+
+
+def make_detector(name, win_size, hop_size, sr, **options):
+    """Build a detector by backend name ("aubio-yin") or bare aubio method ("yin")."""
+    if name in AUBIO_METHODS:
+        name = f"aubio-{name}"
+    try:
+        factory = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown pitch detector '{name}'. Known: {', '.join(BACKENDS)}")
+    return factory(win_size, hop_size, sr, **options)
@@ -0,0 +1,391 @@
+# echo_cancel.py
+"""
+Adaptive echo cancellation: take what we play (warm-up, guide voice) back
+out of the mic signal before pitch detection.
+
+From speakers, our own output reaches the mic through the room and YIN
+locks onto it instead of the singer. With a duplex PitchStream every
+output block is known exactly, so EchoCanceller learns the speaker -> mic
+path from it and subtracts the predicted echo from each input hop:
+
+    aec = EchoCanceller()
+    aec.set_delay(t_dac - t_adc)          # fixed output -> input latency, once
+    clean = aec.process(mic_hop, out_hop) # both HOP_SIZE, per hop, in order
+    aec.skip(n)                           # n hops (mic + output) were dropped
+
+The filter is a partitioned-block frequency-domain NLMS (overlap-save,
+one partition per hop, AEC_FILTER_S of echo tail). A hop costs the same
+whatever is playing (less while nothing is): 7 FFTs of 2 * HOP_SIZE, two filters' worth of complex
+multiplies, and one partition of the gradient constraint (rotating, as
+in Speex's MDF). Output -> input latency beyond the room itself goes into
+a plain delay line, so the taps are spent on the room.
+
+Singing over the playback ("double talk") pulls an adaptive filter off
+the echo path, worst when the singer matches the guide, since their
+voice then correlates with the reference. Two guards:
+
+  per bin   adaptation stops in frequency bins where the mic has far more
+            energy than the playback there can explain (the echo gain is
+            learned while nobody sings), i.e. where the singer is
+  two-path  a background filter adapts, the foreground filter is the one
+            used; it takes the background's taps only when its error has
+            been clearly lower, and a background that does clearly worse
+            is reset to the foreground
+
+The filter learns each note's echo the first few times it is played (the
+warm-up plays the scale of the level) and holds through the singing.
+
+Offline test, on simulated rooms or a session recorded with a duplex
+stream (RECORD_SESSIONS, recorder.OUTPUT_FILE):
+
+  python echo_cancel.py
+  python echo_cancel.py --delay 0.08 --rt60 0.4 --gain 0.8
+  python echo_cancel.py --session sessions/20240101-120000
+
+It reports ERLE (echo return loss enhancement, dB) before, during and
+after someone sings over the playback, which pitch the detector follows
+with and without the canceller, and the cost per hop. The residual of a
+tone is still a tone: with nobody singing, the detector can still pick
+the playback up, only quieter.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from config import SR, HOP_SIZE, AEC_FILTER_S, AEC_STEP, AEC_DELAY_MARGIN_S
+
+ERROR_SMOOTHING = 0.8      # per hop, the two filters' error energies
+COPY_RATIO = 0.8           # background error below this x foreground -> foreground takes its taps
+RESET_RATIO = 4.0          # background error above this x foreground -> background reset
+MIC_SMOOTHING = 0.5        # per hop, mic power per bin
+ECHO_GAIN_FALL = 0.02      # per hop, echo gain (mic / reference power) update while nobody sings...
+ECHO_GAIN_RISE = 0.002     # ...much slower upwards, so a singer below DOUBLE_TALK_DB doesn't pass for echo
+DOUBLE_TALK_DB = 10.0      # mic this far above the expected echo over the whole hop: someone sings
+BIN_DOUBLE_TALK_DB = 8.0   # same per frequency bin: no adaptation in that bin
+DOUBLE_TALK_HOLD_S = 0.1   # a whole-hop detection holds the echo gain this long
+FAR_ACTIVE_RMS = 1e-4      # reference quieter than this: nothing to learn from
+REGULARIZATION = 1.0       # NLMS power floor per bin, x the mean over bins
+
+
+class EchoCanceller:
+    """Two-path partitioned-block frequency-domain NLMS echo canceller, one call per hop."""
+    def __init__(self, block=HOP_SIZE, filter_s=AEC_FILTER_S, step=AEC_STEP, sr=SR):
+        self.block = block
+        self.sr = sr
+        self.step = step
+        self.partitions = max(1, int(np.ceil(filter_s * sr / block)))
+        bins = block + 1
+        self._X = np.zeros((self.partitions, bins), np.complex128)   # reference spectra, newest first
+        self._W_bg = np.zeros_like(self._X)                           # adapting filter
+        self._W_fg = np.zeros_like(self._X)                           # filter in use
+        self._far_prev = np.zeros(block)
+        self._zeros = np.zeros(block)
+        self._delay_line = None    # set_delay(); None = reference already aligned
+        self._k = 0
+        self._stale = 0            # hops left until a dropped block has left the filter span
+
+        self._err_bg = 0.0
+        self._err_fg = 0.0
+        self._mic_power = np.zeros(bins)
+        self._echo_gain_db = None  # mic / reference power while only the playback sounds
+        self._active = 0           # hops with the reference active
+        self._hold = 0
+        self._hold_hops = int(round(DOUBLE_TALK_HOLD_S * sr / block))
+        self._bin_dt_ratio = 10.0 ** (BIN_DOUBLE_TALK_DB / 10.0)
+
+        self.mic_energy = 0.0      # smoothed mic / output energy while only the playback sounds,
+        self.out_energy = 0.0      # for erle_db
+        self.double_talk_hops = 0
+        self.copies = 0            # foreground updates
+        self.resets = 0            # background resets
+
+    def set_delay(self, latency_s, margin_s=AEC_DELAY_MARGIN_S):
+        """
+        Output -> input latency (output DAC time - input ADC time of the same
+        callback), taken out of the reference by a delay line. margin_s of it
+        is left to the filter, in case the reported latency runs long.
+        """
+        n = max(0, int(round((latency_s - margin_s) * self.sr)))
+        self._delay_line = np.zeros(n, np.float32)
+
+    def skip(self, hops=1):
+        """
+        Keep the reference in step with the mic over hops the stream
+        dropped. Each lost hop took its output block with it, so the
+        reference moves on by a block of silence, and the filters stop
+        learning until that hole has passed through the delay line and the
+        filter span (the mic still hears the lost block's echo).
+        """
+        lag = -(-len(self._delay_line) // self.block) if self._delay_line is not None else 0
+        span = lag + self.partitions
+        for _ in range(min(hops, span)):     # past that it's all silence anyway
+            self._push_reference(self._zeros)
+        self._stale = span
+
+    def _push_reference(self, far):
+        """Next output block through the delay line into the partition history; returns the aligned block."""
+        B = self.block
+        if self._delay_line is not None and len(self._delay_line):
+            line = np.concatenate([self._delay_line, far])
+            far, self._delay_line = line[:B], line[B:]
+
+        # reference spectrum of the last 2B samples, newest partition first
+        X = self._X
+        X[1:] = X[:-1]
+        X[0] = np.fft.rfft(np.concatenate([self._far_prev, far]))
+        self._far_prev = np.asarray(far, float)
+        return far
+
+    @property
+    def erle_db(self):
+        """Smoothed mic / output energy while only the playback sounds: how much echo is taken out."""
+        if self.out_energy <= 0.0:
+            return 0.0
+        return 10.0 * np.log10(self.mic_energy / self.out_energy)
+
+    def process(self, near, far):
+        """Mic hop `near` with the echo of `far` (the same callback's output block) removed."""
+        B = self.block
+        far = self._push_reference(far)
+        X = self._X
+
+        # echo estimates and errors, both filters (overlap-save: last B samples)
+        near = np.asarray(near, float)
+        e_fg = near - np.fft.irfft(np.einsum("pk,pk->k", self._W_fg, X))[B:]
+        if self._stale:
+            # a dropped block is still in the history: filter, don't learn
+            self._stale -= 1
+            return e_fg.astype(np.float32)
+        e_bg = near - np.fft.irfft(np.einsum("pk,pk->k", self._W_bg, X))[B:]
+        if np.sqrt(np.mean(far * far)) <= FAR_ACTIVE_RMS:
+            return e_fg.astype(np.float32)
+
+        # reference power per bin over the filter span (NLMS normalization),
+        # against the mic's: who is making the sound?
+        power = (X.real ** 2 + X.imag ** 2).sum(axis=0)
+        D = np.fft.rfft(np.concatenate([self._zeros, near]))
+        self._mic_power *= MIC_SMOOTHING
+        self._mic_power += (1.0 - MIC_SMOOTHING) * (D.real ** 2 + D.imag ** 2)
+        mu = self.step / (power + REGULARIZATION * power.mean() + 1e-10 * B)
+
+        gain_db = 10.0 * np.log10((self._mic_power.sum() + 1e-12) / (power.sum() + 1e-12))
+        self._active += 1
+        if self._active == self.partitions:
+            self._echo_gain_db = gain_db    # the span is full of reference: first estimate
+        if self._echo_gain_db is not None:
+            if gain_db > self._echo_gain_db + DOUBLE_TALK_DB:
+                self._hold = self._hold_hops
+            if self._hold:
+                self._hold -= 1
+                self.double_talk_hops += 1
+            else:
+                d = gain_db - self._echo_gain_db
+                self._echo_gain_db += (ECHO_GAIN_RISE if d > 0.0 else ECHO_GAIN_FALL) * d
+                self.mic_energy = 0.9 * self.mic_energy + 0.1 * float(near @ near)
+                self.out_energy = 0.9 * self.out_energy + 0.1 * float(e_fg @ e_fg)
+            # no learning where the singer is
+            echo_max = self._bin_dt_ratio * 10.0 ** (self._echo_gain_db / 10.0) * power
+            mu[self._mic_power > echo_max] = 0.0
+
+        E = np.fft.rfft(np.concatenate([self._zeros, e_bg]))
+        self._W_bg += (mu * E) * X.conj()
+
+        # gradient constraint (linear, not circular convolution), one partition per hop
+        p = self._k % self.partitions
+        w = np.fft.irfft(self._W_bg[p])
+        w[B:] = 0.0
+        self._W_bg[p] = np.fft.rfft(w)
+        self._k += 1
+
+        # two-path control
+        a = ERROR_SMOOTHING
+        self._err_bg = a * self._err_bg + (1.0 - a) * float(e_bg @ e_bg)
+        self._err_fg = a * self._err_fg + (1.0 - a) * float(e_fg @ e_fg)
+        if self._err_bg < COPY_RATIO * self._err_fg:
+            self._W_fg[:] = self._W_bg
+            self._err_fg = self._err_bg
+            self.copies += 1
+        elif self._err_bg > RESET_RATIO * self._err_fg:
+            self._W_bg[:] = self._W_fg
+            self._err_bg = self._err_fg
+            self.resets += 1
+        return e_fg.astype(np.float32)
+
+
+# ---------- offline test ----------
+def simulated_room(rt60, gain, seed=0, sr=SR):
+    """Speaker -> mic impulse response: 2 ms of air, then a noise tail decaying by 60 dB over rt60; RMS sum = gain."""
+    rng = np.random.default_rng(seed)
+    n = int(rt60 * sr)
+    h = rng.normal(0.0, 1.0, n) * np.exp(-6.9 * np.arange(n) / n)
+    h[:int(0.002 * sr)] = 0.0
+    return gain * h / np.sqrt(np.sum(h * h))
+
+
+def run(aec, mic, far, hop=HOP_SIZE):
+    """Both signals through aec hop by hop -> (output, seconds per hop)."""
+    n = min(len(mic), len(far)) // hop
+    out = np.zeros(n * hop, np.float32)
+    call_s = np.zeros(n)
+    for i in range(n):
+        s = slice(i * hop, (i + 1) * hop)
+        t = time.perf_counter()
+        out[s] = aec.process(mic[s], far[s])
+        call_s[i] = time.perf_counter() - t
+    return out, call_s
+
+
+def _pitch_track(x, hop=HOP_SIZE):
+    """Configured detector, CONF_THRESH gate -> Hz per hop, nan = unvoiced."""
+    from detectors import make_detector
+    from config import PITCH_METHOD, WIN_SIZE, CONF_THRESH
+    detector = make_detector(PITCH_METHOD, WIN_SIZE, hop, SR)
+    n = len(x) // hop
+    hz = np.full(n, np.nan)
+    for i in range(n):
+        f0, conf = detector(np.ascontiguousarray(x[i * hop:(i + 1) * hop], dtype=np.float32))
+        if conf >= CONF_THRESH and 20.0 < f0 < 2000.0:
+            hz[i] = f0
+    return hz
+
+
+def _near(a, b, cents=50.0):
+    """Frames where both are voiced and within `cents` of each other."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.abs(1200.0 * np.log2(a / b)) <= cents
+
+
+def _share(hz, ref):
+    """Share of the voiced frames in `hz` within 50 cents of `ref`."""
+    voiced = np.isfinite(hz)
+    return float(np.mean(_near(hz[voiced], ref[voiced]))) if voiced.any() else 0.0
+
+
+def _erle(echo, residual):
+    return 10.0 * np.log10(np.sum(echo ** 2) / max(np.sum(residual ** 2), 1e-20))
+
+
+def _cost(call_s, hop=HOP_SIZE):
+    p50, p95 = np.percentile(call_s, [50, 95]) * 1e6
+    period = hop / SR * 1e6
+    return f"cost/hop     p50 {p50:.0f} us, p95 {p95:.0f} us ({p95 / period * 100:.1f}% of the {period / 1000:.1f} ms hop)"
+
+
+def simulate(args):
+    """Guide voice through a simulated room, a singer over its second half."""
+    from game_core import Level
+    from guide_tone import GuideVoice
+    from bench_detectors import make_signals
+    from utils_music import midi_to_hz
+    from config import WIN_SIZE
+
+    hop = HOP_SIZE
+    notes = [(1, 60), (1, 64), (1, 67), (0.5, None), (1, 65), (1, 62), (1, 60)] * 3
+    level = Level(notes, 90)
+    n = int(level.duration * SR) // hop * hop
+    far = np.zeros(n, np.float32)
+    guide = GuideVoice(level, 0.0, volume=args.volume)
+    for i in range(n // hop):
+        guide.render(far[i * hop:(i + 1) * hop], i * hop / SR)
+
+    h = simulated_room(args.rt60, args.gain, args.seed)
+    lag = int(round(args.delay * SR))
+    echo = np.zeros(n)
+    echo[lag:] = np.convolve(far, h)[:n - lag]
+
+    sung, f0 = make_signals(SR, seed=args.seed)["sung"]
+    t_sing = n // 2 // hop * hop
+    sing = slice(t_sing, min(n, t_sing + len(sung)))
+    near = np.zeros(n)
+    near[sing] = sung[:sing.stop - sing.start]
+    near *= np.sqrt(np.mean(echo[sing] ** 2) / np.mean(near[sing] ** 2)) * 10.0 ** (args.ser / 20.0)
+    singer_hz = np.zeros(n)
+    singer_hz[sing] = f0[:sing.stop - sing.start]
+    rng = np.random.default_rng(args.seed)
+    mic = (echo + near + rng.normal(0.0, 1e-4, n)).astype(np.float32)
+
+    aec = EchoCanceller(step=args.step)
+    aec.set_delay(args.delay)
+    out, call_s = run(aec, mic, far)
+    residual = out - near
+
+    print(f"Simulated room: {args.delay * 1000:.0f} ms latency, RT60 {args.rt60:.2f} s, echo gain {args.gain:g}, "
+          f"singer {args.ser:+g} dB vs the echo; filter {aec.partitions} x {hop} taps, step {args.step:g}")
+    print(f"ERLE         playback only {_erle(echo[:t_sing], residual[:t_sing]):5.1f} dB, "
+          f"singing over it {_erle(echo[sing], residual[sing]):5.1f} dB, "
+          f"after {_erle(echo[sing.stop:], residual[sing.stop:]):5.1f} dB")
+    print(f"two-path     {aec.copies} copies, {aec.resets} resets, "
+          f"{aec.double_talk_hops * hop / SR:.1f} s held as double talk")
+    print(_cost(call_s))
+
+    # detector view: the playback (as it reaches the mic) and the singer, at
+    # the centre of each analysis window
+    centre = np.clip((np.arange(len(out) // hop) + 1) * hop - WIN_SIZE // 2, 0, None)
+    idx = np.clip(np.searchsorted(level.t0, (centre - lag) / SR, side="right") - 1, 0, len(level.midi) - 1)
+    playback_hz = midi_to_hz(level.midi[idx])
+    playback_hz[centre < lag] = np.nan
+    truth = singer_hz[centre]
+    tracks = [_pitch_track(mic), _pitch_track(out)]
+    print("\nvoiced frames at the pitch of          mic    with AEC")
+    for name, frames, ref in [
+        ("the playback, nobody sings", truth == 0, playback_hz),
+        ("the playback, someone sings", truth > 0, playback_hz),
+        ("the singer, someone sings", truth > 0, truth),
+    ]:
+        share = [_share(t[frames], ref[frames]) for t in tracks]
+        print(f"  {name:34s} {share[0] * 100:5.1f}%   {share[1] * 100:5.1f}%")
+
+
+def replay_session(args):
+    """A session recorded on a duplex stream: its mic and output tracks through the canceller."""
+    from recorder import open_session
+
+    sess = open_session(args.session)
+    meta = sess["meta"]
+    if "output" not in sess or meta.get("output_t_start") is None:
+        raise SystemExit(f"{args.session} has no output track (record with DUPLEX_AUDIO and a guide or ECHO_CANCEL)")
+    latency = meta["output_t_start"] - meta["audio_t_start"]
+    mic = np.asarray(sess["audio"], np.float32)
+    far = np.asarray(sess["output"], np.float32)
+
+    aec = EchoCanceller(step=args.step)
+    aec.set_delay(latency)
+    out, call_s = run(aec, mic, far)
+
+    print(f"{args.session}: {len(out) / SR:.0f} s, output -> input latency {latency * 1000:.1f} ms, step {args.step:g}")
+    print(f"ERLE         {aec.erle_db:5.1f} dB at the end, "
+          f"{aec.double_talk_hops * HOP_SIZE / SR:.0f} s of singing over the playback")
+    print(_cost(call_s))
+
+    # detector on mic / output / cleaned mic; the playback reaches the mic `lag` hops later
+    lag = max(0, int(round(latency * SR / HOP_SIZE)))
+    playback_hz = np.roll(_pitch_track(far[:len(out)]), lag)
+    playback_hz[:lag] = np.nan
+    tracks = [_pitch_track(mic[:len(out)]), _pitch_track(out)]
+    playing = np.isfinite(playback_hz)
+    share = [_share(t[playing], playback_hz[playing]) for t in tracks]
+    print("\nvoiced frames at the pitch of          mic    with AEC")
+    print(f"  the playback, while it plays        {share[0] * 100:5.1f}%   {share[1] * 100:5.1f}%")
+    print("(singing along with the guide counts too)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Echo canceller on simulated rooms or a recorded duplex session")
+    parser.add_argument("--session", default=None, metavar="PATH", help="recorded session dir (default: simulate)")
+    parser.add_argument("--delay", type=float, default=0.03, help="simulated output -> input latency (s)")
+    parser.add_argument("--rt60", type=float, default=0.1, help="simulated room decay time (s)")
+    parser.add_argument("--gain", type=float, default=0.5, help="simulated echo gain (RMS sum of the room response)")
+    parser.add_argument("--volume", type=float, default=0.3, help="simulated playback volume (guide voice peak)")
+    parser.add_argument("--ser", type=float, default=0.0, help="simulated singer level over the echo (dB)")
+    parser.add_argument("--step", type=float, default=AEC_STEP)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.session:
+        replay_session(args)
+    else:
+        simulate(args)
+
+
+if __name__ == "__main__":
+    main()
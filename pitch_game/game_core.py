@@ -0,0 +1,285 @@
+# game_core.py
+"""
+Headless game logic: a level as a note timeline, target lookup and
+running scores. Nothing here touches audio or a display, so the same
+code runs behind the renderers (main.py) and per client in game_server.py.
+
+    level = Level.generate(fmin_hz, fmax_hz)          # or Level(events, bpm, tempo=...)
+    level.set_speed(0.8, at_s=now)                    # live re-tempo, O(notes)
+    session = Session(level)
+    session.add_frames(t, hz)                         # level-relative times
+    session.state()                                   # target, forecast, live score
+
+A level is its notes (onset/end in beats, midi) placed in time by a
+tempo.TempoMap. Target lookups are a searchsorted over the note onsets;
+the hop-grid target the scorers use is sampled from the notes when it is
+needed, so changing tempo only moves note times.
+"""
+import numpy as np
+
+from tempo import TempoMap
+from scoring import MAX_SAMPLE_GAP_S, score_counts, scores_from_counts
+from utils_music import midi_to_hz, cents_error, midi_to_name, interval_label
+from config import SR, HOP_SIZE, DY_SEMITONES, LOOKAHEAD_SECONDS
+
+
+# ---------- target lookup ----------
+def forecast(level, now, lookahead=LOOKAHEAD_SECONDS):
+    """
+    Target `lookahead` seconds ahead of `now`: (midi, label), midi NaN for
+    a pause, (None, "") past the end of the level.
+    """
+    t_look = now + lookahead
+    if level is None or t_look >= level.duration:
+        return None, ""
+    midi_next_q = level.target_midi(t_look)
+    if not np.isfinite(midi_next_q):
+        return np.nan, "Next: pause"
+
+    txt = f"Next: {midi_to_name(midi_next_q)}"
+    midi_curr_q = level.held_midi(now)
+    if np.isfinite(midi_curr_q):
+        int_lbl = interval_label(midi_next_q - midi_curr_q)
+        if int_lbl:
+            txt += f"  |  {int_lbl}"
+    return midi_next_q, txt
+
+
+# ---------- level ----------
+class Level:
+    """
+    A melody as (beats, midi_or_None) events, timed by a TempoMap (default:
+    constant `bpm`). Per note: beat0/beat1, midi (NaN = pause), held (last
+    sung note up to it) and t0/t1 in seconds under the current tempo.
+    `version` goes up whenever note times change, for anything that
+    caches geometry (the renderers' lanes). Readers on another thread
+    (the guide voice in the audio callback) take `times`, the (t0, t1)
+    pair published in one assignment, so they never mix two tempos.
+    """
+    def __init__(self, events, bpm, hop_size=HOP_SIZE, sr=SR, tempo=None, **meta):
+        self.events = [(float(d), None if m is None else int(m)) for d, m in events]
+        self.bpm = bpm
+        self.meta = meta
+        self.dt = hop_size / sr
+        if tempo is None:
+            tempo = TempoMap.constant(bpm)
+        elif not isinstance(tempo, TempoMap):
+            tempo = TempoMap.from_list(tempo)
+        self.tempo = tempo
+        self.speed = 1.0           # live speed relative to the level's own tempo
+
+        dur = np.array([d for d, _ in self.events], float)
+        self.beat1 = np.cumsum(dur)
+        self.beat0 = self.beat1 - dur
+        self.midi = np.array([np.nan if m is None else m for _, m in self.events], float)
+        idx = np.where(np.isfinite(self.midi), np.arange(len(self.midi)), -1)
+        if len(idx):
+            np.maximum.accumulate(idx, out=idx)
+        self.held = np.where(idx >= 0, self.midi[np.maximum(idx, 0)], np.nan)
+
+        self.version = 0
+        self._place()
+
+    def _place(self):
+        """Note times from the tempo map: O(notes), nothing per hop."""
+        t0 = self.tempo.seconds(self.beat0)
+        t1 = self.tempo.seconds(self.beat1)
+        self.times = (t0, t1)
+        self.t0, self.t1 = t0, t1
+        self.duration = float(t1[-1]) if len(t1) else 0.0
+        self._grid = None
+        self.version += 1
+
+    def set_speed(self, speed, at_s=0.0):
+        """
+        Play at `speed` x the level's tempo from time `at_s` on. Everything
+        before at_s keeps its time, so a running level continues from the
+        same beat at the new tempo.
+        """
+        if speed == self.speed:
+            return
+        self.tempo = self.tempo.rescaled(speed / self.speed, from_beat=self.tempo.beats(max(at_s, 0.0)))
+        self.speed = speed
+        self._place()
+
+    @classmethod
+    def generate(cls, fmin_hz, fmax_hz, mode_name=None, **kw):
+        """
+        New random melody for a singer's range; generate_melody_for_range
+        options default to config.py (style=STYLE_PRESET picks a trained
+        preset). meta gets mode, tonic, midi_min/max and style if any.
+        """
+        from melody_generator import generate_melody_for_range
+        from config import (MODE_NAME, DEFAULT_BPM, PHRASES, MIN_NOTE_BEATS,
+                            MAX_JUMP_SEMITONES, TONIC_NAME, FORCE_TONIC_KEY, STYLE_PRESET)
+        mode_name = mode_name or MODE_NAME
+        options = dict(bpm=DEFAULT_BPM, phrases=PHRASES, min_note_beats=MIN_NOTE_BEATS,
+                       max_jump_semitones=MAX_JUMP_SEMITONES, tonic_name=TONIC_NAME,
+                       force_tonic_key=FORCE_TONIC_KEY, style=STYLE_PRESET)
+        options.update(kw)
+        events, bpm, midi_min, midi_max, tonic = generate_melody_for_range(
+            mode_name, fmin_hz, fmax_hz, **options
+        )
+        meta = dict(mode=mode_name, tonic=tonic, midi_min=midi_min, midi_max=midi_max)
+        if options["style"]:
+            meta["style"] = options["style"]
+        return cls(events, bpm, **meta)
+
+    @classmethod
+    def from_dict(cls, data):
+        """The levels.save_level JSON layout: {"bpm", "events", "tempo" (optional), ...meta}."""
+        data = dict(data)
+        events = data.pop("events")
+        bpm = data.pop("bpm")
+        return cls(events, bpm, **data)
+
+    def to_dict(self):
+        data = dict(self.meta)
+        data["bpm"] = self.bpm
+        data["events"] = [[d, m] for d, m in self.events]
+        if self.tempo != TempoMap.constant(self.bpm):
+            data["tempo"] = self.tempo.to_list()
+        return data
+
+    # ---------- lookups (scalar or array times, seconds) ----------
+    def note_index(self, t):
+        """Index of the note sounding at time t; -1 before the start, len(events) from the end on."""
+        i = np.searchsorted(self.t0, t, side="right") - 1
+        return np.where(np.asarray(t) >= self.duration, len(self.events), i)
+
+    def _lookup(self, table, t):
+        i = self.note_index(t)
+        ok = (i >= 0) & (i < len(table))
+        out = np.full(i.shape, np.nan)
+        out[ok] = table[i[ok]]
+        return float(out) if out.ndim == 0 else out
+
+    def target_midi(self, t):
+        """Target note at time t, NaN in pauses and outside the level."""
+        return self._lookup(self.midi, t)
+
+    def held_midi(self, t):
+        """Target note at time t, or during a pause the last one before it."""
+        return self._lookup(self.held, t)
+
+    def target_hz(self, t):
+        return midi_to_hz(self.target_midi(t))
+
+    # ---------- hop grid (scoring) ----------
+    @property
+    def n_hops(self):
+        return int(np.ceil(self.duration / self.dt))
+
+    def grid_target(self, k0, k1):
+        """Hop-grid target for hops k0..k1-1: (times, hz), sampled from the notes."""
+        t = np.arange(k0, k1) * self.dt
+        return t, self.target_hz(t)
+
+    @property
+    def t_target(self):
+        return self._full_grid()[0]
+
+    @property
+    def hz_target(self):
+        return self._full_grid()[1]
+
+    def _full_grid(self):
+        """Whole-level hop grid, built on first use after a tempo change (end-of-level scoring)."""
+        if self._grid is None:
+            self._grid = self.grid_target(0, self.n_hops)
+        return self._grid
+
+
+# ---------- scoring as the level plays ----------
+class LiveScore:
+    """
+    score_track over a level while it is being sung: each call scores the
+    target hops that have gone by since the last one and adds the counts
+    to a running total, so the cost per call does not grow with the level.
+    Once every hop is scored the result equals score_track on the whole
+    track.
+    """
+    def __init__(self, level, dy_semitones=DY_SEMITONES):
+        self.level = level
+        self.dy = dy_semitones
+        self.k = 0                 # next target hop to score
+        self.counts = {"frames": 0, "both": 0, "in_lane": 0, "abs_cents": 0.0}
+
+    def update(self, t_user, hz_user, until):
+        """Score target hops with time <= until (samples after them can no longer change them)."""
+        lv = self.level
+        k_end = lv.n_hops if until >= lv.duration else min(int(until / lv.dt) + 1, lv.n_hops)
+        if k_end <= self.k:
+            return
+        t_target, hz_target = lv.grid_target(self.k, k_end)
+        c = score_counts(t_user, hz_user, t_target, hz_target, self.dy)
+        for key in self.counts:
+            self.counts[key] += c[key]
+        self.k = k_end
+
+    def scores(self):
+        return scores_from_counts(self.counts)
+
+
+class Session:
+    """
+    One singer working through a level: pitch frames in, game state out.
+    Only the samples the unscored hops still need are kept.
+    """
+    def __init__(self, level, dy_semitones=DY_SEMITONES):
+        self.level = level
+        self.score = LiveScore(level, dy_semitones)
+        self._t = np.zeros(0)
+        self._hz = np.zeros(0)
+        self.t_latest = 0.0
+        self.hz_latest = np.nan
+
+    def add_frames(self, t, hz):
+        """Append pitch frames (level-relative times, in order; NaN = unvoiced)."""
+        t = np.asarray(t, float)
+        if len(t) == 0:
+            return
+        hz = np.asarray(hz, float)
+        self._t = np.concatenate([self._t, t])
+        self._hz = np.concatenate([self._hz, hz])
+        self.t_latest = float(t[-1])
+        self.hz_latest = float(hz[-1])
+
+        # target hops up to the newest sample are final now
+        self.score.update(self._t, self._hz, self.t_latest)
+        if self.score.k < self.level.n_hops:
+            t_next = self.score.k * self.level.dt
+            keep = max(0, int(np.searchsorted(self._t, t_next - MAX_SAMPLE_GAP_S, side="left")) - 1)
+            self._t, self._hz = self._t[keep:], self._hz[keep:]
+        else:
+            self._t, self._hz = self._t[-1:], self._hz[-1:]
+
+    @property
+    def done(self):
+        return self.t_latest >= self.level.duration
+
+    def finish(self):
+        """Score the rest of the level (hops nobody sang count as missed)."""
+        self.score.update(self._t, self._hz, np.inf)
+        return self.score.scores()
+
+    def state(self):
+        lv = self.level
+        now = self.t_latest
+        target_midi = lv.target_midi(now)
+        midi_next, label = forecast(lv, now)
+        return {
+            "t": now,
+            "target_midi": _json_num(target_midi),
+            "cents": _json_num(cents_error(self.hz_latest, midi_to_hz(target_midi))),
+            "next_midi": None if midi_next is None else _json_num(midi_next),
+            "next": label,
+            "score": {key: v if isinstance(v, int) else _json_num(v) for key, v in self.score.scores().items()},
+            "done": self.done,
+        }
+
+
+def _json_num(x):
+    """NaN -> None, so states serialize as strict JSON."""
+    x = float(x)
+    return x if np.isfinite(x) else None
@@ -0,0 +1,492 @@
+# game_server.py
+"""
+Headless multi-client game server, for hosting a classroom on one machine.
+
+Clients do their own pitch detection and send the frames; the server runs
+target lookup and scoring (game_core.Session) and publishes every client's
+state at a fixed tick rate. Sessions are sharded over worker processes:
+each shard is a one-process executor that owns its sessions, and a tick
+sends each shard one batch (new frames of all its clients) and gets all
+their encoded states back, so the event loop only moves bytes.
+
+Protocol: newline-delimited JSON over TCP or a Unix socket.
+
+  client  {"type": "hello", "level": {...}}            levels.save_level layout; only
+                                                        events, bpm and tempo are used
+          {"type": "hello", "fmin_hz": 150, "fmax_hz": 400}   server makes one
+  server  {"type": "level", "id": 7, "dt": 0.0058, "level": {...}}
+  client  {"type": "pitch", "frames": [[t, hz], ...]}  t level-relative seconds,
+                                                        hz null when unvoiced
+  server  {"type": "state", "tick": 120, "t": .., "target_midi": .., "cents": ..,
+           "next_midi": .., "next": "Next: E4  |  M3", "score": {..}, "done": false}
+  client  {"type": "bye"}
+  server  {"type": "final", "score": {...}}
+
+Errors come back as {"type": "error", "error": "..."}.
+
+Usage:
+  python game_server.py                           # TCP on SERVER_HOST:SERVER_PORT
+  python game_server.py --unix /tmp/pitch.sock
+  python game_server.py --bench 50 100 200 400    # how many sessions does this box sustain?
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import clock
+from game_core import Level, Session
+from tempo import TempoMap
+from config import (SERVER_HOST, SERVER_PORT, SERVER_TICK_HZ, SERVER_WORKERS,
+                    SERVER_MAX_BUFFER, SERVER_MAX_EVENTS, SERVER_MAX_LEVEL_S, SERVER_BPM_RANGE,
+                    DY_SEMITONES, SR, HOP_SIZE)
+
+
+# ---------- shard side (runs in the worker processes) ----------
+_SESSIONS = {}
+
+
+def _shard_ping():
+    return os.getpid()
+
+
+def _shard_open(cid, level_dict, dy):
+    _SESSIONS[cid] = Session(Level.from_dict(level_dict), dy)
+
+
+def _shard_tick(tick, batch):
+    """batch: [(client id, new frames)] -> ([(client id, encoded state line)], seconds busy)."""
+    t0 = clock.now()
+    out = []
+    for cid, frames in batch:
+        session = _SESSIONS.get(cid)
+        if session is None:
+            continue
+        try:
+            if frames:
+                f = np.array(frames, dtype=float).reshape(-1, 2)   # null -> NaN
+                session.add_frames(f[:, 0], f[:, 1])
+            msg = {"type": "state", "tick": tick}
+            msg.update(session.state())
+        except (ValueError, TypeError) as e:
+            # one client's bad data must not cost the others their tick
+            msg = {"type": "error", "error": f"frames dropped: {e!r}"}
+        except Exception as e:
+            # anything else means the session itself is broken: drop it, keep the shard
+            _SESSIONS.pop(cid, None)
+            msg = {"type": "error", "error": f"session dropped: {e!r}"}
+        out.append((cid, (json.dumps(msg) + "\n").encode()))
+    return out, clock.now() - t0
+
+
+def _shard_close(cid):
+    session = _SESSIONS.pop(cid, None)
+    return None if session is None else session.finish()
+
+
+def _valid_frames(frames):
+    """A list of [t, hz] pairs: t a number, hz a number or null."""
+    if not isinstance(frames, list):
+        return False
+    for f in frames:
+        if not (isinstance(f, list) and len(f) == 2 and _is_number(f[0])
+                and (f[1] is None or _is_number(f[1]))):
+            return False
+    return True
+
+
+def _is_number(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+def _is_finite(v):
+    return _is_number(v) and np.isfinite(v)
+
+
+def _client_level(data):
+    """
+    A client's level, checked and cut down to events, bpm and tempo; other
+    keys (hop_size, sr, meta) are never passed on. Raises ValueError.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("level must be an object")
+    lo, hi = SERVER_BPM_RANGE
+    events = data.get("events")
+    if not isinstance(events, list) or not 0 < len(events) <= SERVER_MAX_EVENTS:
+        raise ValueError(f"events must be a list of 1..{SERVER_MAX_EVENTS} [beats, midi|null] pairs")
+    for e in events:
+        if not (isinstance(e, list) and len(e) == 2 and _is_finite(e[0]) and e[0] > 0
+                and (e[1] is None or (isinstance(e[1], int) and not isinstance(e[1], bool)
+                                      and 0 <= e[1] <= 127))):
+            raise ValueError(f"bad event {e!r}: want [beats > 0, midi 0..127 or null]")
+    bpm = data.get("bpm")
+    if not _is_finite(bpm) or not lo <= bpm <= hi:
+        raise ValueError(f"bpm must be a number in {lo:g}..{hi:g}")
+    level = {"events": events, "bpm": bpm}
+
+    tempo = data.get("tempo")
+    if tempo is None:
+        tempo_map = TempoMap.constant(bpm)
+    else:
+        if _is_finite(tempo):
+            segments = [[0, tempo, tempo]]
+        elif isinstance(tempo, list) and 0 < len(tempo) <= SERVER_MAX_EVENTS:
+            segments = tempo
+        else:
+            raise ValueError("tempo must be a bpm or a list of [beat, bpm, end bpm]")
+        for seg in segments:
+            if not (isinstance(seg, list) and len(seg) == 3 and all(_is_finite(v) for v in seg)
+                    and lo <= seg[1] <= hi and lo <= seg[2] <= hi):
+                raise ValueError(f"bad tempo segment {seg!r}")
+        tempo_map = TempoMap.from_list(tempo)
+        level["tempo"] = tempo
+    if tempo_map.seconds(sum(d for d, _ in events)) > SERVER_MAX_LEVEL_S:
+        raise ValueError(f"level longer than {SERVER_MAX_LEVEL_S:g} s")
+    return level
+
+
+# ---------- server ----------
+class TickStats:
+    def __init__(self, history=1000):
+        self.work = deque(maxlen=history)    # seconds per tick, loop side
+        self.busy = deque(maxlen=history)    # seconds per tick, slowest shard
+        self.ticks = 0
+        self.late = 0                        # ticks that overran their period
+        self.skipped = 0                     # tick slots given up to catch up
+        self.dropped = 0                     # states not sent to slow clients
+        self.failed = 0                      # shard ticks that raised (their clients miss a state)
+
+    def summary(self):
+        if not self.work:
+            return "no ticks yet"
+        w = np.array(self.work) * 1000
+        b = np.array(self.busy) * 1000
+        return (f"{self.ticks} ticks, work p50 {np.median(w):.1f} / p95 {np.percentile(w, 95):.1f} ms, "
+                f"shard p95 {np.percentile(b, 95):.1f} ms, late {self.late}, skipped {self.skipped}, "
+                f"dropped {self.dropped}, failed {self.failed}")
+
+
+class _Client:
+    def __init__(self, cid, writer, shard):
+        self.cid = cid
+        self.writer = writer
+        self.shard = shard
+        self.pending = []
+        self.opened = False
+
+
+class GameServer:
+    def __init__(self, tick_hz=SERVER_TICK_HZ, workers=SERVER_WORKERS, dy_semitones=DY_SEMITONES):
+        self.tick_hz = tick_hz
+        self.dy = dy_semitones
+        n = workers or os.cpu_count() or 1
+        self.shards = [ProcessPoolExecutor(max_workers=1) for _ in range(n)]
+        self.load = [0] * n
+        self.clients = {}
+        self.stats = TickStats()
+        self._next_id = 0
+        self._running = False
+
+    async def start_workers(self):
+        """Start the shard processes now rather than on the first client."""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(s, _shard_ping) for s in self.shards))
+
+    def close(self):
+        self._running = False
+        for s in self.shards:
+            s.shutdown(cancel_futures=True)
+
+    # ---------- connections ----------
+    @staticmethod
+    def _send(writer, msg):
+        if not writer.is_closing():
+            writer.write((json.dumps(msg) + "\n").encode())
+
+    def _make_level(self, msg):
+        if "level" in msg:
+            return _client_level(msg["level"])
+        fmin, fmax = float(msg["fmin_hz"]), float(msg["fmax_hz"])
+        if not 20.0 <= fmin < fmax <= 2000.0:
+            raise ValueError("want 20 <= fmin_hz < fmax_hz <= 2000")
+        return Level.generate(fmin, fmax, msg.get("mode")).to_dict()
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        shard = self.load.index(min(self.load))
+        self.load[shard] += 1
+        client = _Client(self._next_id, writer, shard)
+        self._next_id += 1
+        self.clients[client.cid] = client
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    msg = json.loads(line)
+                    kind = msg["type"]
+                except (ValueError, KeyError, TypeError):
+                    self._send(writer, {"type": "error", "error": "expected one JSON object with a 'type' per line"})
+                    continue
+
+                if kind == "pitch":
+                    frames = msg.get("frames", [])
+                    if not _valid_frames(frames):
+                        self._send(writer, {"type": "error", "error": "frames must be a list of [t, hz|null] pairs"})
+                    elif client.opened:
+                        client.pending.extend(frames)
+                elif kind == "hello":
+                    if client.opened:
+                        self._send(writer, {"type": "error", "error": "already have a level"})
+                        continue
+                    try:
+                        level = self._make_level(msg)
+                        await loop.run_in_executor(self.shards[shard], _shard_open, client.cid, level, self.dy)
+                    except (KeyError, TypeError, ValueError) as e:
+                        self._send(writer, {"type": "error", "error": f"bad level: {e!r}"})
+                        continue
+                    client.opened = True
+                    self._send(writer, {"type": "level", "id": client.cid,
+                                        "dt": HOP_SIZE / SR, "level": level})
+                elif kind == "bye":
+                    break
+                else:
+                    self._send(writer, {"type": "error", "error": f"unknown message type {kind!r}"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            del self.clients[client.cid]
+            self.load[shard] -= 1
+            if client.opened:
+                score = await loop.run_in_executor(self.shards[shard], _shard_close, client.cid)
+                self._send(writer, {"type": "final", "score": score})
+            writer.close()
+
+    # ---------- fixed-rate publishing ----------
+    async def run_ticks(self):
+        loop = asyncio.get_running_loop()
+        period = 1.0 / self.tick_hz
+        stats = self.stats
+        self._running = True
+        next_t = loop.time()
+        tick = 0
+        while self._running:
+            t_start = loop.time()
+            batches = [[] for _ in self.shards]
+            for c in self.clients.values():
+                if c.opened:
+                    batches[c.shard].append((c.cid, c.pending))
+                    c.pending = []
+            futures = [loop.run_in_executor(self.shards[i], _shard_tick, tick, b)
+                       for i, b in enumerate(batches) if b]
+            busy = 0.0
+            for result in await asyncio.gather(*futures, return_exceptions=True):
+                if isinstance(result, BaseException):
+                    stats.failed += 1
+                    continue
+                lines, shard_busy = result
+                busy = max(busy, shard_busy)
+                for cid, line in lines:
+                    c = self.clients.get(cid)
+                    if c is None or c.writer.is_closing():
+                        continue
+                    if c.writer.transport.get_write_buffer_size() > SERVER_MAX_BUFFER:
+                        stats.dropped += 1
+                        continue
+                    c.writer.write(line)
+
+            stats.work.append(loop.time() - t_start)
+            stats.busy.append(busy)
+            stats.ticks += 1
+            tick += 1
+
+            next_t += period
+            behind = loop.time() - next_t
+            if behind > 0:
+                # overran: publish again right away, give up whole periods we can't make
+                stats.late += 1
+                skip = int(behind / period)
+                stats.skipped += skip
+                next_t += skip * period
+            await asyncio.sleep(max(0.0, next_t - loop.time()))
+
+    async def serve(self, host=SERVER_HOST, port=SERVER_PORT, unix_path=None, stats_every=None):
+        await self.start_workers()
+        if unix_path:
+            server = await asyncio.start_unix_server(self.handle, path=unix_path)
+            where = unix_path
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+            where = "%s:%d" % server.sockets[0].getsockname()[:2]
+        print(f"Serving on {where}: {len(self.shards)} shards, {self.tick_hz} Hz ticks")
+        ticks = asyncio.create_task(self.run_ticks())
+        try:
+            async with server:
+                while True:
+                    await asyncio.sleep(stats_every or 3600)
+                    if stats_every:
+                        print(f"{len(self.clients)} clients | {self.stats.summary()}")
+        finally:
+            ticks.cancel()
+            self.close()
+
+
+# ---------- benchmark: simulated clients ----------
+async def _sim_client(port, level, seconds, send_hz, rng, out):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write((json.dumps({"type": "hello", "level": level.to_dict()}) + "\n").encode())
+    reply = json.loads(await reader.readline())
+    if reply.get("type") != "level":
+        out.append(None)
+        writer.close()
+        return
+
+    states = []
+    final = []
+
+    async def read():
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            msg = json.loads(line)
+            if msg["type"] == "state":
+                states.append(loop.time())
+            elif msg["type"] == "final":
+                final.append(msg["score"])
+                return
+
+    loop = asyncio.get_running_loop()
+    reading = asyncio.create_task(read())
+    detune = 2 ** (rng.normal(0, 20) / 1200)     # this singer is a few cents off
+    t_start = loop.time()
+    k = 0
+    while True:
+        await asyncio.sleep(1.0 / send_hz * rng.uniform(0.8, 1.2))
+        now = loop.time() - t_start
+        if now > seconds:
+            break
+        k_end = int(now / level.dt)
+        frames = []
+        for j in range(k, k_end):
+            hz = level.target_hz(j * level.dt)
+            frames.append([j * level.dt, None if not np.isfinite(hz) else hz * detune * 2 ** (rng.normal(0, 15) / 1200)])
+        k = k_end
+        writer.write((json.dumps({"type": "pitch", "frames": frames}) + "\n").encode())
+        await writer.drain()
+    writer.write(b'{"type": "bye"}\n')
+    await writer.drain()
+    await asyncio.wait_for(reading, 10)
+    writer.close()
+
+    # steady state only: skip the first second
+    t = np.array(states) - t_start
+    t = t[(t > 1.0) & (t <= seconds)]
+    gaps = np.diff(t)
+    out.append({
+        "rate": len(t) / max(seconds - 1.0, 1e-9),
+        "max_gap": float(gaps.max()) if len(gaps) else float("inf"),
+        "final": bool(final),
+    })
+
+
+def _sim_clients(port, n, seconds, send_hz, level_dict, seed, queue):
+    """One client process: n concurrent simulated singers."""
+    level = Level.from_dict(level_dict)
+    rng = np.random.default_rng(seed)
+    out = []
+
+    async def run():
+        await asyncio.gather(*(_sim_client(port, level, seconds, send_hz, rng, out) for _ in range(n)))
+
+    asyncio.run(run())
+    queue.put(out)
+
+
+async def _bench_step(n_sessions, args, level):
+    server = GameServer(tick_hz=args.tick_hz, workers=args.workers)
+    await server.start_workers()
+    srv = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    port = srv.sockets[0].getsockname()[1]
+    ticks = asyncio.create_task(server.run_ticks())
+
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    n_procs = max(1, min(args.client_procs, n_sessions))
+    counts = [n_sessions // n_procs + (i < n_sessions % n_procs) for i in range(n_procs)]
+    procs = [ctx.Process(target=_sim_clients, daemon=True,
+                         args=(port, c, args.seconds, args.send_hz, level.to_dict(), args.seed + i, queue))
+             for i, c in enumerate(counts)]
+    for p in procs:
+        p.start()
+    loop = asyncio.get_running_loop()
+    results = []
+    for _ in procs:
+        results.extend(await loop.run_in_executor(None, queue.get))
+    for p in procs:
+        p.join()
+
+    ticks.cancel()
+    srv.close()
+    await srv.wait_closed()
+    server.close()
+    return results, server.stats
+
+
+def bench(args):
+    random.seed(args.seed)
+    level = Level.generate(150.0, 400.0)
+    n_shards = args.workers or os.cpu_count() or 1
+    print(f"{args.seconds:.0f}s per step, {args.tick_hz} Hz ticks, {n_shards} shards, "
+          f"clients send {args.send_hz} Hz from {args.client_procs} processes")
+    print(f"{'sessions':>9}{'states/s':>10}{'max gap':>9}{'tick p95':>10}{'shard p95':>10}"
+          f"{'late':>6}{'drop':>6}   sustained")
+    period_ms = 1000.0 / args.tick_hz
+    for n in args.bench:
+        results, stats = asyncio.run(_bench_step(n, args, level))
+        ok = [r for r in results if r is not None]
+        rate = np.median([r["rate"] for r in ok]) if ok else 0.0
+        gap = max((r["max_gap"] for r in ok), default=float("inf")) * 1000
+        work = np.percentile(np.array(stats.work) * 1000, 95) if stats.work else float("nan")
+        busy = np.percentile(np.array(stats.busy) * 1000, 95) if stats.busy else float("nan")
+        sustained = (len(ok) == n and all(r["final"] for r in ok)
+                     and rate >= 0.95 * args.tick_hz and gap <= 3 * period_ms)
+        print(f"{n:9d}{rate:10.1f}{gap:8.0f}ms{work:8.1f}ms{busy:8.1f}ms{stats.late:6d}{stats.dropped:6d}"
+              f"   {'yes' if sustained else 'NO'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless multi-client pitch game server")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--unix", default=None, metavar="PATH", help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--tick-hz", type=float, default=SERVER_TICK_HZ)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="shard processes (0 = one per CPU)")
+    parser.add_argument("--stats", type=float, default=None, metavar="S", help="print tick stats every S seconds")
+    parser.add_argument("--bench", type=int, nargs="+", default=None, metavar="N",
+                        help="run simulated clients: sessions per step")
+    parser.add_argument("--seconds", type=float, default=10.0, help="benchmark step length")
+    parser.add_argument("--send-hz", type=float, default=20.0, help="simulated client send rate")
+    parser.add_argument("--client-procs", type=int, default=2, help="processes running simulated clients")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.bench:
+        bench(args)
+        return
+    server = GameServer(tick_hz=args.tick_hz, workers=args.workers)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix, args.stats))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# governor.py
+from collections import namedtuple
+
+from config import (
+    SR, HOP_SIZE, WIN_SIZE,
+    GOV_BACKLOG_HIGH, GOV_LOAD_HIGH, GOV_LOAD_LOW,
+    GOV_DOWN_AFTER, GOV_UP_AFTER_SEC,
+)
+
+# hop_mult: input hops combined into one analysis (larger effective hop)
+# win_size: analysis window in samples at the decimated rate
+# decim:    analysis sample rate = SR / decim
+QualityLevel = namedtuple("QualityLevel", ["hop_mult", "win_size", "decim"])
+
+QUALITY_LEVELS = [
+    QualityLevel(1, WIN_SIZE, 1),        # full quality
+    QualityLevel(2, WIN_SIZE, 1),        # half the analyses
+    QualityLevel(2, WIN_SIZE // 2, 1),   # + half the window
+    QualityLevel(2, WIN_SIZE // 4, 2),   # + half the sample rate (same window duration)
+    QualityLevel(4, WIN_SIZE // 4, 2),   # quarter the analyses
+]
+
+# EMA factor for detector load
+LOAD_EMA_ALPHA = 0.2
+# limit on how far repeated flapping can stretch the step-up dwell
+MAX_UP_BACKOFF = 8
+
+
+def level_params(level):
+    """(win_size, hop_size, samplerate) for the detector at this level."""
+    sr = SR // level.decim
+    hop = HOP_SIZE * level.hop_mult // level.decim
+    return level.win_size, hop, sr
+
+
+def describe(level):
+    win, hop, sr = level_params(level)
+    return f"hop {hop} / win {win} @ {sr / 1000:.1f} kHz"
+
+
+class QualityGovernor:
+    """
+    Steps pitch analysis quality down when the worker falls behind and back up
+    when there is headroom again, so overload gives a coarser trace instead of
+    dropped hops.
+
+    Overloaded: hop backlog >= GOV_BACKLOG_HIGH, any hop dropped, or detector
+    load (detect time / hop period) above GOV_LOAD_HIGH, for GOV_DOWN_AFTER
+    analyses in a row. Headroom: empty queue and load below GOV_LOAD_LOW for
+    GOV_UP_AFTER_SEC. Stepping down soon after stepping up doubles that dwell.
+    """
+    def __init__(self, levels=QUALITY_LEVELS):
+        self.levels = levels
+        self.index = 0
+        self.load = 0.0
+        self._hot = 0
+        self._cool_s = 0.0
+        self._up_backoff = 1
+        self._just_stepped_up = False
+
+    @property
+    def level(self):
+        return self.levels[self.index]
+
+    @property
+    def period_s(self):
+        return HOP_SIZE * self.level.hop_mult / SR
+
+    def observe(self, backlog, detect_s, dropped):
+        """Feed one analysis. Returns True if the level changed."""
+        period = self.period_s
+        self.load += LOAD_EMA_ALPHA * (detect_s / period - self.load)
+
+        if backlog >= GOV_BACKLOG_HIGH or dropped or self.load > GOV_LOAD_HIGH:
+            self._hot += 1
+            self._cool_s = 0.0
+        elif backlog == 0 and self.load < GOV_LOAD_LOW:
+            self._hot = 0
+            self._cool_s += period
+            if self._cool_s >= GOV_UP_AFTER_SEC:
+                # the last step up held; stop treating it as recent
+                self._just_stepped_up = False
+        else:
+            self._hot = 0
+            self._cool_s = 0.0
+
+        if self._hot >= GOV_DOWN_AFTER and self.index < len(self.levels) - 1:
+            if self._just_stepped_up:
+                self._up_backoff = min(MAX_UP_BACKOFF, self._up_backoff * 2)
+            self._step(+1)
+            self._just_stepped_up = False
+            return True
+
+        if self._cool_s >= GOV_UP_AFTER_SEC * self._up_backoff and self.index > 0:
+            self._step(-1)
+            self._just_stepped_up = True
+            return True
+
+        return False
+
+    def _step(self, delta):
+        self.index += delta
+        self._hot = 0
+        self._cool_s = 0.0
+        # the new level has a different cost; let the estimate re-settle
+        self.load = 0.0
@@ -0,0 +1,103 @@
+# guide_tone.py
+"""
+Guide voice: the level's target played as a soft tone while you sing.
+
+Synthesized block by block inside the audio output callback. Each block
+is stamped with its DAC time on clock.now() (clock.dac_time), so sample
+n of a block sounds the note that is due at
+
+    t_dac + n / SR - t0          (t0 = level start, as main.py's `now`)
+
+which is exactly what the renderer draws at that moment. Tempo changes
+(level.set_speed) are picked up on the next block.
+
+    guide = GuideVoice(level, t0)
+    guide.start(pitch_stream)     # duplex PitchStream: same stream as the mic
+    ...
+    guide.stop()
+
+With a duplex PitchStream (PitchStream(duplex=True)) the guide is one of
+its output sources, so input and output run on the same device clock and
+callback. Otherwise it opens its own sd.OutputStream; the two device
+clocks can then drift apart by a few ms over a long session.
+
+Use headphones: from speakers, the guide reaches the mic and the detector
+follows it instead of you.
+"""
+import numpy as np
+
+import clock
+from utils_music import midi_to_hz
+from config import SR, HOP_SIZE, GUIDE_VOLUME, GUIDE_HARMONICS, GUIDE_FADE_S
+
+
+class GuideVoice:
+    """Target-note synth; render() adds one block of it into an output buffer."""
+    def __init__(self, level, t0, volume=GUIDE_VOLUME, harmonics=GUIDE_HARMONICS,
+                 fade_s=GUIDE_FADE_S, sr=SR):
+        self.level = level
+        self.t0 = t0
+        self.sr = sr
+        self.fade_s = fade_s
+        partials = np.asarray(harmonics, float)
+        self._partials = volume * partials / partials.sum()
+        self._k = np.arange(1, len(partials) + 1)[:, None]
+        self._n = np.arange(HOP_SIZE) / sr
+        self._phase = 0.0          # fundamental phase at the next block, radians
+        self._stream = None
+        self._pitch_stream = None
+
+    # ---------- synthesis (audio callback thread) ----------
+    def render(self, out, t_dac):
+        """Add the guide for a block whose first sample leaves the DAC at t_dac into `out` (mono, float32)."""
+        frames = len(out)
+        if len(self._n) != frames:
+            self._n = np.arange(frames) / self.sr
+        t_on, t_off = self.level.times     # one read: a tempo change swaps both at once
+        midi = self.level.midi
+        t = t_dac - self.t0 + self._n
+        if not len(t_off) or t[-1] < 0.0 or t[0] >= t_off[-1]:
+            return
+
+        # note per sample, with a short attack/release at its edges
+        i = np.clip(np.searchsorted(t_on, t, side="right") - 1, 0, len(midi) - 1)
+        edge = np.minimum(t - t_on[i], t_off[i] - t)
+        env = np.clip(edge / self.fade_s, 0.0, 1.0)
+        hz = midi_to_hz(midi[i])
+        sounding = np.isfinite(hz) & (t >= 0.0)
+        env[~sounding] = 0.0
+        hz[~sounding] = 0.0
+
+        # phase-continuous oscillator: the frequency steps at note edges, the phase doesn't
+        step = (2.0 * np.pi / self.sr) * hz
+        phase = self._phase + np.cumsum(step) - step
+        self._phase = float((phase[-1] + step[-1]) % (2.0 * np.pi))
+        out += (env * (self._partials @ np.sin(self._k * phase))).astype(np.float32)
+
+    def out_callback(self, outdata, frames, time_info, status):
+        """sd.OutputStream callback, for when the mic isn't on a duplex stream."""
+        t_dac = clock.dac_time(time_info, clock.now())
+        outdata[:] = 0.0
+        self.render(outdata[:, 0], t_dac)
+
+    # ---------- life cycle ----------
+    def start(self, pitch_stream=None):
+        """Play through pitch_stream's output if it is duplex, else on an output stream of its own."""
+        if pitch_stream is not None and getattr(pitch_stream, "duplex", False):
+            pitch_stream.add_output(self)
+            self._pitch_stream = pitch_stream
+            return
+        import sounddevice as sd
+        self._stream = sd.OutputStream(
+            callback=self.out_callback, samplerate=self.sr, blocksize=HOP_SIZE, channels=1,
+        )
+        self._stream.start()
+
+    def stop(self):
+        if self._pitch_stream is not None:
+            self._pitch_stream.remove_output(self)
+            self._pitch_stream = None
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
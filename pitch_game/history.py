@@ -0,0 +1,294 @@
+# history.py
+"""
+Local session history in SQLite.
+
+One row per session and per sung note, plus a small `rollup` table of
+running sums keyed by (dimension, key, mode), updated in the same
+transaction as every insert. Progress queries read only the rollups (or
+the indexed sessions table), so a dashboard loads in milliseconds however
+many sessions are stored.
+
+Writes go through HistoryWriter, a background thread, so the game thread
+only enqueues a summary at level end.
+
+Dashboard:
+  python history.py [--db history.sqlite]
+"""
+import argparse
+import queue
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from config import HISTORY_DB
+from utils_music import interval_name
+from scoring import score_track, score_notes
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions(
+    id INTEGER PRIMARY KEY,
+    started TEXT NOT NULL,
+    day TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    bpm REAL,
+    tonic INTEGER,
+    fmin_hz REAL,
+    fmax_hz REAL,
+    accuracy REAL,
+    coverage REAL,
+    mean_abs_cents REAL,
+    n_notes INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_day ON sessions(day);
+CREATE INDEX IF NOT EXISTS idx_sessions_mode_day ON sessions(mode, day);
+
+CREATE TABLE IF NOT EXISTS notes(
+    session_id INTEGER NOT NULL REFERENCES sessions(id),
+    idx INTEGER NOT NULL,
+    midi INTEGER NOT NULL,
+    interval TEXT NOT NULL,
+    direction INTEGER NOT NULL,
+    region TEXT NOT NULL,
+    dur_s REAL,
+    accuracy REAL,
+    coverage REAL,
+    mean_abs_cents REAL,
+    PRIMARY KEY(session_id, idx)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_notes_interval ON notes(interval);
+CREATE INDEX IF NOT EXISTS idx_notes_region ON notes(region);
+
+CREATE TABLE IF NOT EXISTS rollup(
+    dim TEXT NOT NULL,       -- interval | region | mode | day
+    key TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    sum_accuracy REAL NOT NULL,
+    n_cents INTEGER NOT NULL,
+    sum_abs_cents REAL NOT NULL,
+    PRIMARY KEY(dim, key, mode)
+) WITHOUT ROWID;
+"""
+
+_UPSERT_ROLLUP = """
+INSERT INTO rollup(dim, key, mode, n, sum_accuracy, n_cents, sum_abs_cents)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(dim, key, mode) DO UPDATE SET
+    n = n + excluded.n,
+    sum_accuracy = sum_accuracy + excluded.sum_accuracy,
+    n_cents = n_cents + excluded.n_cents,
+    sum_abs_cents = sum_abs_cents + excluded.sum_abs_cents
+"""
+
+
+def region_name(midi):
+    """Pitch region of a note: its octave, e.g. 'C4–B4'."""
+    octave = int(midi) // 12 - 1
+    return f"C{octave}–B{octave}"
+
+
+def _num(x):
+    return None if x is None or not np.isfinite(x) else float(x)
+
+
+class HistoryStore:
+    def __init__(self, path=HISTORY_DB):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    # ---------- writes ----------
+    def add_session(self, session, notes):
+        """
+        session: dict with started, mode, bpm, tonic, fmin_hz, fmax_hz and
+                 score_track fields; notes: scoring.score_notes rows.
+        Everything, rollups included, goes in one transaction.
+        """
+        mode = session["mode"]
+        day = session["started"][:10]
+        rollups = {}
+
+        def add(dim, key, acc, cents):
+            r = rollups.setdefault((dim, key), [0, 0.0, 0, 0.0])
+            if acc is None:
+                return
+            r[0] += 1
+            r[1] += acc
+            if cents is not None:
+                r[2] += 1
+                r[3] += cents
+
+        note_rows = []
+        for nt in notes:
+            acc, cents = _num(nt["accuracy"]), _num(nt["mean_abs_cents"])
+            st = nt["interval"]
+            name = "start" if st is None else interval_name(st)
+            direction = 0 if not st else (1 if st > 0 else -1)
+            region = region_name(nt["midi"])
+            note_rows.append((
+                nt["idx"], nt["midi"], name, direction, region,
+                nt["dur_s"], acc, _num(nt["coverage"]), cents,
+            ))
+            add("interval", name, acc, cents)
+            add("region", region, acc, cents)
+            add("mode", mode, acc, cents)
+            add("day", day, acc, cents)
+
+        with self.db:
+            cur = self.db.execute(
+                "INSERT INTO sessions(started, day, mode, bpm, tonic, fmin_hz, fmax_hz,"
+                " accuracy, coverage, mean_abs_cents, n_notes) VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+                (session["started"], day, mode, session.get("bpm"), session.get("tonic"),
+                 session.get("fmin_hz"), session.get("fmax_hz"),
+                 _num(session.get("accuracy")), _num(session.get("coverage")),
+                 _num(session.get("mean_abs_cents")), len(notes)),
+            )
+            sid = cur.lastrowid
+            self.db.executemany(
+                "INSERT INTO notes(session_id, idx, midi, interval, direction, region,"
+                " dur_s, accuracy, coverage, mean_abs_cents) VALUES (?,?,?,?,?,?,?,?,?,?)",
+                [(sid,) + row for row in note_rows],
+            )
+            self.db.executemany(
+                _UPSERT_ROLLUP,
+                [(dim, key, mode, *vals) for (dim, key), vals in rollups.items()],
+            )
+        return sid
+
+    # ---------- progress queries ----------
+    def _rollup(self, dim, mode=None):
+        sql = (
+            "SELECT key, SUM(n), SUM(sum_accuracy) / SUM(n),"
+            " SUM(sum_abs_cents) / NULLIF(SUM(n_cents), 0)"
+            " FROM rollup WHERE dim = ? AND n > 0"
+        )
+        args = [dim]
+        if mode is not None:
+            sql += " AND mode = ?"
+            args.append(mode)
+        sql += " GROUP BY key ORDER BY key"
+        return [
+            {"key": k, "notes": n, "accuracy": acc, "mean_abs_cents": cents}
+            for k, n, acc, cents in self.db.execute(sql, args)
+        ]
+
+    def interval_accuracy(self, mode=None):
+        return self._rollup("interval", mode)
+
+    def region_accuracy(self, mode=None):
+        return self._rollup("region", mode)
+
+    def mode_accuracy(self):
+        return self._rollup("mode")
+
+    def accuracy_over_time(self, mode=None):
+        """Per-day note accuracy, oldest first."""
+        return self._rollup("day", mode)
+
+    def recent_sessions(self, limit=20):
+        rows = self.db.execute(
+            "SELECT id, started, mode, bpm, accuracy, coverage, mean_abs_cents, n_notes"
+            " FROM sessions ORDER BY id DESC LIMIT ?", (limit,)
+        )
+        keys = ("id", "started", "mode", "bpm", "accuracy", "coverage", "mean_abs_cents", "n_notes")
+        return [dict(zip(keys, r)) for r in rows]
+
+
+class HistoryWriter:
+    """
+    Background thread that owns its own HistoryStore connection.
+    submit() never blocks the game thread.
+    """
+    def __init__(self, path=HISTORY_DB):
+        self.path = path
+        self._q = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, session, notes):
+        """Store an already scored session."""
+        self._q.put((session, notes))
+
+    def submit_level(self, session, level, t_user, hz_user):
+        """Score a finished game_core.Level on the writer thread (at the tempo it was played), then store it."""
+        self._q.put((session, (level, np.array(t_user, float), np.array(hz_user, float))))
+
+    def _loop(self):
+        store = HistoryStore(self.path)
+        try:
+            while True:
+                item = self._q.get()
+                if item is None:
+                    break
+                session, notes = item
+                # one bad session must not take the writer (and every later one) down
+                try:
+                    if isinstance(notes, tuple):
+                        level, t_user, hz_user = notes
+                        session = dict(session, **score_track(t_user, hz_user, level.t_target, level.hz_target))
+                        notes = score_notes(level.events, level.tempo, t_user, hz_user)
+                    store.add_session(session, notes)
+                except sqlite3.Error as e:
+                    print(f"History: could not save session ({e})")
+                except Exception as e:
+                    print(f"History: session dropped ({type(e).__name__}: {e})")
+        finally:
+            store.close()
+
+    def close(self, timeout=5.0):
+        """Finish pending writes."""
+        self._q.put(None)
+        self._thread.join(timeout)
+
+
+# ---------- dashboard ----------
+def _pct(x):
+    return "    —" if x is None else f"{100 * x:4.0f}%"
+
+
+def _cents(x):
+    return "   —" if x is None else f"{x:4.0f}"
+
+
+def print_dashboard(store, mode=None):
+    t = time.perf_counter()
+    sections = [
+        ("By interval", store.interval_accuracy(mode)),
+        ("By region", store.region_accuracy(mode)),
+        ("By mode", store.mode_accuracy()),
+        ("By day", store.accuracy_over_time(mode)),
+    ]
+    recent = store.recent_sessions(10)
+    ms = (time.perf_counter() - t) * 1000
+
+    for title, rows in sections:
+        print(f"\n{title}")
+        for r in rows:
+            print(f"  {r['key']:<22} {r['notes']:6d} notes  {_pct(r['accuracy'])}  {_cents(r['mean_abs_cents'])} ct")
+    print("\nRecent sessions")
+    for r in recent:
+        print(f"  {r['started']}  {r['mode']:<11} {_pct(r['accuracy'])}  {r['n_notes']:3d} notes")
+    print(f"\n(queried in {ms:.1f} ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show your progress across sessions")
+    parser.add_argument("--db", default=HISTORY_DB)
+    parser.add_argument("--mode", default=None, help="restrict interval/region/day views to one mode")
+    args = parser.parse_args()
+    store = HistoryStore(args.db)
+    try:
+        print_dashboard(store, args.mode)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
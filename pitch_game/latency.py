@@ -0,0 +1,94 @@
+# latency.py
+import numpy as np
+from collections import deque
+
+from config import LATENCY_HISTORY, LATENCY_HIST_BINS, LATENCY_HIST_MAX_MS
+
+# stage name -> (from, to) timestamps of a PitchSample + frame time
+STAGES = {
+    "capture": ("t_adc", "t_enq"),    # ADC -> audio callback enqueue
+    "detect": ("t_enq", "t_det"),     # queue wait + pitch detector
+    "display": ("t_det", "t_frame"),  # detector -> first frame showing it
+    "total": ("t_adc", "t_frame"),
+}
+
+_SPARK = "▁▂▃▄▅▆▇█"
+
+
+class LatencyStats:
+    """
+    Rolling per-stage latency history (seconds).
+    Fed from the main thread only, once per sample when it is first drawn.
+    """
+    def __init__(self, history=LATENCY_HISTORY):
+        self._hist = {name: deque(maxlen=history) for name in STAGES}
+
+    def add_sample(self, sample, t_frame):
+        stamps = {
+            "t_adc": sample.t_adc,
+            "t_enq": sample.t_enq,
+            "t_det": sample.t_det,
+            "t_frame": t_frame,
+        }
+        for name, (a, b) in STAGES.items():
+            self._hist[name].append(stamps[b] - stamps[a])
+
+    def add_samples(self, recs, t_frame):
+        """add_sample for a whole array of result records (see results_ring)."""
+        if len(recs) == 0:
+            return
+        stamps = {"t_adc": recs["t_adc"], "t_enq": recs["t_enq"], "t_det": recs["t_det"], "t_frame": t_frame}
+        for name, (a, b) in STAGES.items():
+            self._hist[name].extend((stamps[b] - stamps[a]).tolist())
+
+    def count(self):
+        return len(self._hist["total"])
+
+    def percentiles(self, stage, q=(50, 95)):
+        vals = self._hist[stage]
+        if not vals:
+            return [np.nan] * len(q)
+        return list(np.percentile(np.fromiter(vals, float), q))
+
+    def pipeline_delay(self):
+        """Median capture -> screen delay in seconds (0 until measured)."""
+        p50, = self.percentiles("total", q=(50,))
+        return float(p50) if np.isfinite(p50) else 0.0
+
+    def histogram(self, stage, bins=LATENCY_HIST_BINS, max_ms=LATENCY_HIST_MAX_MS):
+        """Counts over `bins` equal-width bins in [0, max_ms] ms (overflow goes in the last)."""
+        vals_ms = np.fromiter(self._hist[stage], float) * 1000.0
+        vals_ms = np.clip(vals_ms, 0.0, max_ms)
+        counts, edges = np.histogram(vals_ms, bins=bins, range=(0.0, max_ms))
+        return counts, edges
+
+    def _sparkline(self, stage):
+        counts, _ = self.histogram(stage)
+        top = counts.max()
+        if top == 0:
+            return " " * len(counts)
+        return "".join(_SPARK[int(round(c / top * (len(_SPARK) - 1)))] for c in counts)
+
+    def summary_text(self):
+        """Compact multi-line p50/p95 + histogram text for the live overlay."""
+        lines = [f"latency ms (p50/p95, 0–{LATENCY_HIST_MAX_MS:.0f})"]
+        for name in STAGES:
+            p50, p95 = self.percentiles(name)
+            if not np.isfinite(p50):
+                lines.append(f"{name:>7}  —")
+                continue
+            lines.append(f"{name:>7} {p50*1000:4.0f}/{p95*1000:4.0f} {self._sparkline(name)}")
+        return "\n".join(lines)
+
+    def report(self):
+        """Longer end-of-session report."""
+        if self.count() == 0:
+            return "No latency samples recorded."
+        out = [f"=== Latency ({self.count()} samples) ==="]
+        for name in STAGES:
+            p5, p50, p95, p99 = self.percentiles(name, q=(5, 50, 95, 99))
+            out.append(
+                f"{name:>7}: p5 {p5*1000:6.1f}  p50 {p50*1000:6.1f}  "
+                f"p95 {p95*1000:6.1f}  p99 {p99*1000:6.1f} ms  {self._sparkline(name)}"
+            )
+        return "\n".join(out)
@@ -0,0 +1,319 @@
+# latency_probe.py
+"""
+Round-trip latency measurement.
+
+Plays short probe tones through the output and follows each one through
+the real input path (PitchStream, same blocksize and detector as the
+game). Per probe:
+
+  input    tone leaves the DAC -> its onset is in a captured hop
+           (output + acoustic + input buffering)
+  detect   onset captured -> PitchStream reports the probe pitch
+           (analysis window fill + queue + detector)
+  total    tone leaves the DAC -> pitch reported
+
+The screen part of the chain is what the in-game latency overlay
+(SHOW_LATENCY_STATS) measures.
+
+Put the mic near the speakers (or use a loopback cable). Without audio
+hardware, --simulate runs the same measurement against SimulatedLoopback,
+a stand-in device with a known delay and callback jitter:
+
+  python latency_probe.py
+  python latency_probe.py --simulate --delay 0.08 --jitter 0.01 -n 30
+"""
+import argparse
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+import clock
+from config import SR, HOP_SIZE, PROBE_HZ, PROBE_TONE_S, PROBE_GAP_S, PROBE_COUNT, PROBE_AMPLITUDE
+
+LOCK_CENTS = 50.0      # a detection this close to PROBE_HZ counts as "heard"
+NOISE_S = 0.5          # silence at the start, to measure the input noise floor
+ONSET_FACTOR = 8.0     # onset = first sample this far above the noise floor
+FADE_S = 0.002
+
+
+class SimulatedLoopback:
+    """
+    Stand-in for an output + input device pair wired back to back.
+
+    Input sample j is output sample j - delay_s * sr, plus a little noise.
+    Input callbacks arrive one block late plus a random 0..jitter_s, with
+    PortAudio-style time_info stamps on the clock.now() time base, so the
+    ADC-stamped measurement should recover delay_s whatever the jitter.
+
+        sim = SimulatedLoopback(delay_s=0.05, jitter_s=0.005)
+        PitchStream(stream_factory=sim.InputStream)
+        sim.OutputStream(callback=..., samplerate=SR, blocksize=HOP_SIZE, channels=1)
+
+    sim.Stream is the full-duplex form (PitchStream(duplex=True,
+    stream_factory=sim.Stream)): one callback gets the input block and
+    fills the output block. Delays below one block are not simulated.
+    """
+    def __init__(self, delay_s=0.05, jitter_s=0.005, sr=SR, blocksize=HOP_SIZE,
+                 noise=1e-3, seed=0):
+        self.delay_s = delay_s
+        self.jitter_s = jitter_s
+        self.sr = sr
+        self.blocksize = blocksize
+        self.noise = noise
+        self._rng = np.random.default_rng(seed)
+
+        self._delay = int(round(delay_s * sr))
+        n_air = self._delay + 2 * blocksize
+        self._air = np.zeros(n_air, dtype=np.float32)   # ring of output samples by index
+        self._out_cb = None
+        self._in_cb = None
+        self._duplex_cb = None
+        self._thread = None
+        self._running = False
+        self._lock = threading.Lock()
+
+    # sd.InputStream / sd.OutputStream look-alikes
+    def InputStream(self, callback, samplerate=SR, blocksize=HOP_SIZE, channels=1, **kw):
+        return _SimStream(self, "input", callback)
+
+    def OutputStream(self, callback, samplerate=SR, blocksize=HOP_SIZE, channels=1, **kw):
+        return _SimStream(self, "output", callback)
+
+    def Stream(self, callback, samplerate=SR, blocksize=HOP_SIZE, channels=1, **kw):
+        return _SimStream(self, "duplex", callback)
+
+    def _attach(self, kind, callback):
+        with self._lock:
+            setattr(self, f"_{_CB_ATTR[kind]}_cb", callback)
+            if not self._running:
+                self._running = True
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _detach(self, kind):
+        with self._lock:
+            setattr(self, f"_{_CB_ATTR[kind]}_cb", None)
+            stop = self._in_cb is None and self._out_cb is None and self._duplex_cb is None
+            if stop:
+                self._running = False
+        if stop and self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+
+    def _run(self):
+        B, sr, n_air = self.blocksize, self.sr, len(self._air)
+        out = np.zeros((B, 1), dtype=np.float32)
+        t_start = clock.now()
+        k = 0
+        while self._running:
+            t_block = t_start + k * B / sr          # ADC/DAC time of sample k*B
+            deliver = t_block + B / sr + self._rng.uniform(0.0, self.jitter_s)
+            wait = deliver - clock.now()
+            if wait > 0:
+                time.sleep(wait)
+            idx = (np.arange(B) + k * B) % n_air
+            in_cb, out_cb, duplex_cb = self._in_cb, self._out_cb, self._duplex_cb
+            # captured before this block's output lands (delay >= one block)
+            x = self._capture(k) if in_cb is not None or duplex_cb is not None else None
+
+            self._air[idx] = 0.0
+            if out_cb is not None:
+                out[:] = 0.0
+                now = clock.now()
+                out_cb(out, B, SimpleNamespace(outputBufferDacTime=t_block, currentTime=now), None)
+                self._air[idx] += out[:, 0]
+            if duplex_cb is not None:
+                out[:] = 0.0
+                now = clock.now()
+                duplex_cb(x[:, None], out, B, SimpleNamespace(
+                    inputBufferAdcTime=t_block, outputBufferDacTime=t_block, currentTime=now), None)
+                self._air[idx] += out[:, 0]
+
+            if in_cb is not None:
+                now = clock.now()
+                in_cb(x[:, None], B, SimpleNamespace(inputBufferAdcTime=t_block, currentTime=now), None)
+            k += 1
+
+    def _capture(self, k):
+        B = self.blocksize
+        if k * B < self._delay:
+            x = np.zeros(B, dtype=np.float32)
+        else:
+            x = self._air[(np.arange(B) + k * B - self._delay) % len(self._air)]
+        return x + self._rng.normal(0.0, self.noise, B).astype(np.float32)
+
+
+_CB_ATTR = {"input": "in", "output": "out", "duplex": "duplex"}
+
+
+class _SimStream:
+    def __init__(self, sim, kind, callback):
+        self.sim, self.kind, self.callback = sim, kind, callback
+
+    def start(self):
+        self.sim._attach(self.kind, self.callback)
+
+    def stop(self):
+        self.sim._detach(self.kind)
+
+    def close(self):
+        pass
+
+
+class LatencyProbe:
+    """
+    Output callback that plays the probe tones, plus a hop tap that finds
+    each tone's onset in the raw input. Detection times come from the
+    PitchStream's own samples.
+    """
+    def __init__(self, freq_hz=PROBE_HZ, tone_s=PROBE_TONE_S, gap_s=PROBE_GAP_S,
+                 count=PROBE_COUNT, amplitude=PROBE_AMPLITUDE, sr=SR):
+        self.freq_hz = freq_hz
+        self.count = count
+        self.sr = sr
+        self.period = int((tone_s + gap_s) * sr)
+        n = int(tone_s * sr)
+        fade = min(int(FADE_S * sr), n // 2)
+        env = np.ones(n)
+        env[:fade] = np.linspace(0, 1, fade)
+        env[n - fade:] = np.linspace(1, 0, fade)
+        self.tone = (amplitude * env * np.sin(2 * np.pi * freq_hz * np.arange(n) / sr)).astype(np.float32)
+        self.first = int(NOISE_S * sr)
+
+        self._pos = 0                       # output sample counter
+        self.t_emit = [None] * count        # DAC time of each tone's first sample
+        self.t_onset = [None] * count       # capture time of each tone's first sample
+        self._noise_sq, self._noise_n = 0.0, 0
+        self._threshold = None
+        self.done = threading.Event()
+
+    def _tone_start(self, i):
+        return self.first + i * self.period
+
+    # ---------- output callback ----------
+    def out_callback(self, outdata, frames, time_info, status):
+        t_dac = clock.dac_time(time_info, clock.now())
+        outdata[:] = 0.0
+        a, b = self._pos, self._pos + frames
+        for i in range(self.count):
+            s = self._tone_start(i)
+            lo, hi = max(a, s), min(b, s + len(self.tone))
+            if lo < hi:
+                outdata[lo - a:hi - a, 0] = self.tone[lo - s:hi - s]
+                if self.t_emit[i] is None:
+                    self.t_emit[i] = t_dac + (s - a) / self.sr
+        self._pos = b
+        if a > self._tone_start(self.count - 1) + self.period:
+            self.done.set()
+
+    # ---------- input tap (audio callback thread) ----------
+    def hop_tap(self, hop, t_adc):
+        if self._threshold is None:
+            # still in the lead-in silence: learn the noise floor
+            self._noise_sq += float(np.dot(hop, hop))
+            self._noise_n += len(hop)
+            if self._noise_n >= self.first // 2:
+                rms = np.sqrt(self._noise_sq / self._noise_n)
+                self._threshold = max(ONSET_FACTOR * rms, 1e-4)
+            return
+        i = next((i for i, t in enumerate(self.t_onset) if t is None), None)
+        if i is None or self.t_emit[i] is None:
+            return
+        # only samples captured after the tone left the DAC can be its onset
+        k0 = max(0, int(np.ceil((self.t_emit[i] - t_adc) * self.sr)))
+        if k0 >= len(hop):
+            return
+        above = np.flatnonzero(np.abs(hop[k0:]) > self._threshold)
+        if len(above):
+            self.t_onset[i] = t_adc + (k0 + above[0]) / self.sr
+
+    # ---------- results ----------
+    def results(self, recs):
+        """Per probe {input, detect, total} seconds (None where it was missed), from result records."""
+        t_det = recs["t_det"]
+        hz = recs["hz"].astype(float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            locked = np.abs(1200 * np.log2(hz / self.freq_hz)) < LOCK_CENTS
+        out = []
+        for i in range(self.count):
+            emit, onset = self.t_emit[i], self.t_onset[i]
+            row = {"input": None, "detect": None, "total": None}
+            if emit is not None and onset is not None:
+                row["input"] = onset - emit
+                hits = np.flatnonzero(locked & (t_det >= onset))
+                if len(hits):
+                    det = t_det[hits[0]]
+                    if det - emit < self.period / self.sr:
+                        row["detect"] = det - onset
+                        row["total"] = det - emit
+            out.append(row)
+        return out
+
+
+def measure(pitch_stream, output_factory, probe):
+    """Run the probe tones through output_factory + pitch_stream; returns probe.results."""
+    chunks = []
+    cursor = pitch_stream.subscribe()
+    pitch_stream.hop_tap = probe.hop_tap
+    with pitch_stream.open_stream():
+        out = output_factory(callback=probe.out_callback, samplerate=SR, blocksize=HOP_SIZE, channels=1)
+        out.start()
+        try:
+            while not probe.done.wait(0.05):
+                chunks.append(cursor.read()[0].copy())
+            time.sleep(0.2)
+            chunks.append(cursor.read()[0].copy())
+        finally:
+            out.stop()
+            out.close()
+    pitch_stream.hop_tap = None
+    if cursor.lost:
+        print(f"warning: {cursor.lost} pitch results were overwritten before they were read")
+    return probe.results(np.concatenate(chunks))
+
+
+def report(rows):
+    lines = [f"{'':8}{'n':>4}{'min':>9}{'p50':>9}{'p95':>9}{'max':>9}   (ms)"]
+    for key in ("input", "detect", "total"):
+        v = np.array([r[key] for r in rows if r[key] is not None]) * 1000
+        if len(v):
+            lines.append(f"{key:<8}{len(v):4d}{v.min():9.1f}{np.median(v):9.1f}"
+                         f"{np.percentile(v, 95):9.1f}{v.max():9.1f}")
+        else:
+            lines.append(f"{key:<8}{0:4d}{'—':>9}{'—':>9}{'—':>9}{'—':>9}")
+    missed = sum(r["total"] is None for r in rows)
+    if missed:
+        lines.append(f"{missed} of {len(rows)} probes not detected")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure output -> mic -> detector latency")
+    parser.add_argument("-n", "--count", type=int, default=PROBE_COUNT)
+    parser.add_argument("--simulate", action="store_true", help="use SimulatedLoopback instead of audio hardware")
+    parser.add_argument("--delay", type=float, default=0.05, help="simulated round-trip delay (s)")
+    parser.add_argument("--jitter", type=float, default=0.005, help="simulated callback jitter (s)")
+    args = parser.parse_args()
+
+    from audio_pitch import PitchStream
+
+    probe = LatencyProbe(count=args.count)
+    if args.simulate:
+        sim = SimulatedLoopback(delay_s=args.delay, jitter_s=args.jitter)
+        pitch_stream = PitchStream(stream_factory=sim.InputStream)
+        output_factory = sim.OutputStream
+        print(f"Simulated loopback: {args.delay * 1000:.0f} ms delay, "
+              f"{args.jitter * 1000:.0f} ms jitter, blocksize {HOP_SIZE}")
+    else:
+        import sounddevice as sd
+        pitch_stream = PitchStream()
+        output_factory = sd.OutputStream
+        print("Playing probe tones: keep the mic near the speakers and stay quiet.")
+
+    rows = measure(pitch_stream, output_factory, probe)
+    print(report(rows))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+# levels.py
+import json
+
+
+def save_level(path, events, bpm, **meta):
+    """
+    Store a generated level as JSON:
+      {"bpm": 70, "events": [[beats, midi_or_null], ...], ...meta}
+    meta may hold "tempo" (tempo.TempoMap.to_list()) when the tempo changes.
+    """
+    data = dict(meta)
+    data["bpm"] = bpm
+    data["events"] = [[float(d), None if m is None else int(m)] for d, m in events]
+    with open(path, "w") as f:
+        json.dump(data, f, indent=1)
+
+
+def save_game_level(path, level):
+    """save_level for a game_core.Level, with its tempo map if it is not one constant bpm."""
+    data = level.to_dict()
+    save_level(path, data.pop("events"), data.pop("bpm"), **data)
+
+
+def load_level(path):
+    """Returns (events, bpm, meta) as written by save_level."""
+    with open(path) as f:
+        data = json.load(f)
+    events = [(float(d), None if m is None else int(m)) for d, m in data.pop("events")]
+    bpm = float(data.pop("bpm"))
+    return events, bpm, data
@@ -1,43 +1,91 @@
 # main.py
+import argparse
+import atexit
+import os
 import time
+
+import clock
+T_START = clock.now()
+
 import numpy as np
-from collections import deque
+
+# Only light modules up here: matplotlib, aubio and sounddevice load inside
+# main(), matplotlib on a background thread while the first prompt is up.
+from profiler import PROFILER
+from startup import StartupTimer, preload
+from renderers import make_renderer, RENDERER_MODULES
+from config import LATENCY_COMPENSATION, SHOW_LATENCY_STATS, IDLE_POLL_HZ
 
 from config import SR, HOP_SIZE, DEFAULT_BPM, MODE_NAME, PHRASES, DY_SEMITONES, WINDOW_SECONDS
-from scale_playback import play_scale_warmup
 from config import PLAY_SCALE_WARMUP, WARMUP_NOTE_BEATS, WARMUP_PAUSE_BEATS, WARMUP_REPEATS
-
-from audio_pitch import PitchStream
-from calibration import run_calibration
-from melody_generator import generate_melody_for_range
-from target_trace import events_to_target_trace
-from renderer import GameRenderer
+from config import INPUT_CHANNELS, RENDERER, SHOW_SPECTROGRAM
+from config import RECORD_SESSIONS, SESSIONS_DIR
+from config import SAVE_HISTORY, GUIDE_TONE, DUPLEX_AUDIO, ECHO_CANCEL
 
 from config import TONIC_NAME, FORCE_TONIC_KEY, MIN_NOTE_BEATS, MAX_JUMP_SEMITONES
+from config import LEVEL_SPEED, TEMPO_KEY_STEP, TEMPO_SPEED_RANGE
+
+# game-side modules, imported on the preload thread during calibration
+PRELOAD = RENDERER_MODULES.get(RENDERER, []) + [
+    "game_core", "tempo", "melody_generator", "guide_tone", "scale_playback", "levels",
+    "latency", "scheduler", "governor", "scoring", "history", "recorder",
+]
 
 
-def main():
-    pitch_stream = PitchStream()
+def main(profile_path=None, save_level_path=None):
+    startup = StartupTimer(T_START)
+    if profile_path:
+        PROFILER.enable()
+        atexit.register(PROFILER.dump, profile_path)
+
+    preload(PRELOAD, warm_matplotlib=(RENDERER == "matplotlib"))
+    from audio_pitch import PitchStream, MultiPitchStream
+    from calibration import run_calibration
+
+    if INPUT_CHANNELS > 1:
+        pitch_stream = MultiPitchStream(INPUT_CHANNELS)
+    else:
+        # duplex: our output (guide voice, warm-up) plays on the mic's own
+        # stream, which is also what echo cancellation needs as reference
+        pitch_stream = PitchStream(duplex=DUPLEX_AUDIO and (GUIDE_TONE or ECHO_CANCEL))
+    n_singers = pitch_stream.n_channels
 
     with pitch_stream.open_stream():
         # 1) Calibration
-        fmin_raw, fmax_raw, fmin_tess, fmax_tess = run_calibration(pitch_stream, truncate_frac=0.05)
+        startup.mark("first prompt")
+        with startup.waiting():
+            fmin_raw, fmax_raw, fmin_tess, fmax_tess = run_calibration(pitch_stream, truncate_frac=0.05)
+        if pitch_stream.postfilter is not None:
+            # fold octave errors that land outside the singer's range
+            pitch_stream.postfilter.set_range(fmin_raw, fmax_raw)
+
+        from game_core import Level
+        from levels import save_game_level
 
         fmin_plot = fmin_tess
         fmax_plot = fmax_tess
 
-        # 2) Melody generation
-        events, bpm, midi_min, midi_max, tonic = generate_melody_for_range(
-            MODE_NAME, fmin_plot, fmax_plot,
+        # 2) Melody generation (+ hop-grid target trace)
+        level = Level.generate(
+            fmin_plot, fmax_plot, MODE_NAME,
             bpm=DEFAULT_BPM, phrases=PHRASES,
             min_note_beats=MIN_NOTE_BEATS,
             max_jump_semitones=MAX_JUMP_SEMITONES,
             tonic_name=TONIC_NAME,
             force_tonic_key=FORCE_TONIC_KEY
         )
+        bpm = level.bpm
+        tonic, midi_min, midi_max = level.meta["tonic"], level.meta["midi_min"], level.meta["midi_max"]
+
+        if save_level_path:
+            save_game_level(save_level_path, level)
+            print(f"Level saved to {save_level_path}")
+        # practice slow-down: only how it's played, not part of the saved level
+        level.set_speed(LEVEL_SPEED)
 
-        # Warm-up
+        # Warm-up: starts playing, the figure is built while it sounds
         if PLAY_SCALE_WARMUP:
+            from scale_playback import play_scale_warmup, wait_for_playback
             play_scale_warmup(
                 tonic_midi=tonic,
                 mode_name=MODE_NAME,
@@ -48,66 +96,225 @@ def main():
                 note_beats=WARMUP_NOTE_BEATS,
                 pause_beats=WARMUP_PAUSE_BEATS,
                 repeats=WARMUP_REPEATS,
+                blocking=False,
+                pitch_stream=pitch_stream,
             )
 
-        # 3) Target trace
-        t_target, hz_target = events_to_target_trace(events, bpm, HOP_SIZE, SR)
-        total_duration = t_target[-1]
-        print(f"Generated melody length: {total_duration:.1f}s @ {bpm} bpm in {MODE_NAME}")
+        # 3) Target timeline (notes placed by the level's tempo map)
+        speed_txt = f" x{level.speed:g}" if level.speed != 1.0 else ""
+        print(f"Generated melody length: {level.duration:.1f}s @ {bpm} bpm{speed_txt} in {MODE_NAME}")
 
         # 4) Renderer
-        renderer = GameRenderer(fmin_plot, fmax_plot, DY_SEMITONES)
-        renderer.draw_background_map(t_target, hz_target)
+        renderer = make_renderer(RENDERER, fmin_plot, fmax_plot, DY_SEMITONES, n_users=n_singers)
+        renderer.draw_background_map(level)
+        spectrogram = None
+        if SHOW_SPECTROGRAM and renderer.y_bins_midi is not None and n_singers == 1:
+            from spectrogram import Spectrogram
+            spectrogram = Spectrogram(renderer.y_bins_midi)
+            renderer.attach_spectrogram(spectrogram)
+        startup.mark("figure ready")
 
-        # 5) User buffers (store ALL YIN samples)
+        if PLAY_SCALE_WARMUP:
+            with startup.waiting():
+                wait_for_playback()
+
+        from latency import LatencyStats
+        from scheduler import FrameScheduler
+        from governor import describe
+        from scoring import score_tracks
+        from history import HistoryWriter
+        from recorder import SessionRecorder, session_dir, LEVEL_FILE
+
+        # 5) User traces. The on-screen window is a view of the pitch
+        # stream's result ring; the whole level is kept as array chunks
+        # for the end-of-level summary.
         max_points = int(WINDOW_SECONDS * SR / HOP_SIZE * 2)  # a bit extra room
-        user_times = deque(maxlen=max_points)
-        user_pitches = deque(maxlen=max_points)
-
-        t0 = time.time()
-
-        print("Game start! Sing along with the green lane. Close window/Ctrl+C to stop.")
-
-        # Fixed FPS loop
-        target_fps = 60
-        frame_dt = 1.0 / target_fps
-        next_frame = time.time()
-
-        while renderer.still_open():
-            now = time.time() - t0
-            if now > total_duration:
-                renderer.score_text.set_text("Level complete! 🎉")
-                renderer.fig.canvas.draw()
-                renderer.fig.canvas.flush_events()
-                time.sleep(0.1)
-                continue
-
-            # ---- DRAIN ALL NEW PITCH SAMPLES ----
-            new_samples = pitch_stream.pop_all_pitches()
-            for t_abs, hz in new_samples:
-                t_rel = t_abs - t0
-                user_times.append(t_rel)
-                user_pitches.append(hz)
-
-            # If no new samples arrived, still append latest to keep continuity
-            if not new_samples:
-                user_times.append(now)
-                user_pitches.append(pitch_stream.latest_hz)
-
-            renderer.update(
-                now,
-                user_times, user_pitches,
-                t_target, hz_target,
-                pitch_stream.latest_hz
-            )
+        # with compensation, samples sit at their capture time and
+        # the whole trace trails `now` by the measured pipeline delay
+        t_field = "t_adc" if LATENCY_COMPENSATION else "t_det"
+        level_times = []
+        level_pitches = [[] for _ in range(n_singers)]
+
+        latency = LatencyStats()
+        stats_every = 0.5
+        next_stats = 0.0
+
+        t0 = clock.now()
+        started = time.strftime("%Y-%m-%d %H:%M:%S")
+        if spectrogram is not None:
+            spectrogram.t0 = t0
+            pitch_stream.spectrogram = spectrogram
+
+        guide = None
+        history = None
+        recorder = None
+        try:
+            if GUIDE_TONE:
+                from guide_tone import GuideVoice
+                # same time origin as `now`: the guide sounds what the lane shows
+                guide = GuideVoice(level, t0)
+                guide.start(pitch_stream)
+
+            if SAVE_HISTORY:
+                history = HistoryWriter()
+
+            if RECORD_SESSIONS:
+                rec_path = session_dir(SESSIONS_DIR)
+                recorder = SessionRecorder(rec_path, t0, output=pitch_stream.duplex)
+                save_game_level(os.path.join(rec_path, LEVEL_FILE), level)
+                saved_tempo = level.tempo
+                pitch_stream.recorder = recorder
+
+            print("Game start! Sing along with the green lane. Up/Down: faster/slower. "
+                  "Close window/Ctrl+C to stop.")
+
+            # Event-driven loop: sleep on detector output until the scheduler's
+            # next deadline, draw only when a frame is due
+            sched = FrameScheduler()
+            pending = []          # drained samples not yet on screen
+            was_voiced = [False] * n_singers
+            finished = False
+            shown_level = 0
+            startup_reported = False
+
+            while renderer.still_open():
+                now = clock.now() - t0
+                if now > level.duration:
+                    if not finished:
+                        renderer.show_message("Level complete! 🎉")
+                        finished = True
+                        t_level = np.concatenate(level_times) if level_times else np.zeros(0)
+                        hz_level = [np.concatenate(c) if c else np.zeros(0) for c in level_pitches]
+                        if n_singers > 1:
+                            scores = score_tracks([(t_level, hz) for hz in hz_level], level.t_target, level.hz_target)
+                            for i, sc in enumerate(scores):
+                                print(f"Singer {i + 1}: accuracy {100 * sc['accuracy']:.0f}%, "
+                                      f"coverage {100 * sc['coverage']:.0f}%")
+                        if history is not None:
+                            # group mode: history follows singer 1 (channel 0)
+                            # scoring + SQLite writes happen on the history thread
+                            history.submit_level(
+                                {
+                                    "started": started, "mode": MODE_NAME, "bpm": bpm, "tonic": tonic,
+                                    "fmin_hz": fmin_plot, "fmax_hz": fmax_plot,
+                                },
+                                level, t_level, hz_level[0],
+                            )
+                    # nothing changes any more: just keep the window responsive
+                    renderer.pump_events()
+                    time.sleep(1.0 / IDLE_POLL_HZ)
+                    continue
+
+                delay = latency.pipeline_delay() if LATENCY_COMPENSATION else 0.0
+
+                # ---- DRAIN ALL NEW PITCH SAMPLES (one array, no per-sample work) ----
+                recs = pitch_stream.pop_results()
+                if len(recs):
+                    hz = recs["hz"].reshape(len(recs), n_singers)
+                    level_times.append(recs[t_field] - t0)
+                    for ch in range(n_singers):
+                        level_pitches[ch].append(hz[:, ch].astype(float))
+
+                    voiced = np.isfinite(hz)
+                    if voiced.any() or any(was_voiced):
+                        sched.mark_dirty()
+                    was_voiced = list(voiced[-1])
+                    pending.append(recs)
+
+                if not sched.frame_due():
+                    with PROFILER.section("main.wait"):
+                        pitch_stream.wait_for_samples(sched.time_to_next_frame())
+                    continue
+
+                q_level, n_levels = pitch_stream.quality_level
+                if q_level != shown_level:
+                    # governor stepped: tell the player why the trace got coarser
+                    renderer.set_quality_text(
+                        f"Reduced quality {q_level}/{n_levels - 1}: "
+                        f"{describe(pitch_stream.governor.level)}" if q_level else ""
+                    )
+                    shown_level = q_level
+                    sched.mark_dirty()
+
+                steps = renderer.take_tempo_steps()
+                if steps:
+                    # re-anchor at `now`: what was sung stays put, the rest moves
+                    lo, hi = TEMPO_SPEED_RANGE
+                    speed = round(min(max(level.speed + steps * TEMPO_KEY_STEP, lo), hi), 3)
+                    level.set_speed(speed, at_s=now)
+                    print(f"Tempo x{speed:g}")
+                    sched.mark_dirty()
+
+                if SHOW_LATENCY_STATS and now >= next_stats:
+                    renderer.set_latency_text(
+                        latency.summary_text() + f"\n{sched.fps:5.0f} fps budget"
+                    )
+                    next_stats = now + stats_every
+
+                # this level's part of the newest results
+                window = pitch_stream.recent_results(max_points)
+                window = window[np.searchsorted(window[t_field], t0):]
+                user_times = window[t_field] - t0
+                user_pitches = window["hz"].reshape(len(window), n_singers)
+
+                t_draw = clock.now()
+                renderer.update(
+                    now,
+                    user_times, user_pitches[:, 0],
+                    pitch_stream.latest_hz_channels if n_singers > 1 else pitch_stream.latest_hz,
+                    latency_s=delay,
+                    extra_traces=[(user_times, user_pitches[:, ch]) for ch in range(1, n_singers)],
+                )
+
+                # first frame showing these samples is now on screen
+                t_frame = clock.now()
+                sched.frame_done(t_draw, t_frame)
+                for recs in pending:
+                    latency.add_samples(recs, t_frame)
+                pending.clear()
+
+                if not startup_reported:
+                    startup.mark("first frame")
+                    print(startup.report())
+                    startup_reported = True
+        finally:
+            # also on Ctrl+C (the documented way to stop): silence the guide,
+            # and commit the history row and the recording
+            if guide is not None:
+                guide.stop()
+
+            if history is not None:
+                history.close()
+
+            if recorder is not None:
+                pitch_stream.recorder = None
+                if level.tempo != saved_tempo:
+                    # the level as it was played, tempo changes included (even
+                    # ones that ended back at the same speed)
+                    save_game_level(os.path.join(rec_path, LEVEL_FILE), level)
+                info = recorder.close({
+                    "mode": MODE_NAME, "bpm": bpm, "tonic": tonic,
+                    "fmin_hz": fmin_plot, "fmax_hz": fmax_plot,
+                    "started": started,
+                })
+                print(f"Session recorded to {recorder.path} "
+                      f"({info['audio_samples'] / SR:.0f}s audio, {info['pitch_samples']} pitch samples)")
 
-            # FPS pacing
-            next_frame += frame_dt
-            sleep = next_frame - time.time()
-            if sleep > 0:
-                time.sleep(sleep)
-            else:
-                next_frame = time.time()
+        print(latency.report())
+        aec = pitch_stream.echo_canceller
+        if aec is not None:
+            print(f"Echo cancellation: {aec.erle_db:.1f} dB, "
+                  f"{aec.double_talk_hops * HOP_SIZE / SR:.0f}s of singing over the playback")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="The Pitch Game")
+    parser.add_argument(
+        "--profile", nargs="?", const="profile.json", default=None, metavar="PATH",
+        help="collect per-stage timings and write them as JSON at exit (default: profile.json)",
+    )
+    parser.add_argument(
+        "--save-level", default=None, metavar="PATH",
+        help="write the generated level as JSON (e.g. for analyze_offline.py --level)",
+    )
+    args = parser.parse_args()
+    main(profile_path=args.profile, save_level_path=args.save_level)
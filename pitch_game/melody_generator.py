@@ -1,7 +1,13 @@
 # melody_generator.py
+import json
+import os
 import random
 import math
-from utils_music import hz_to_midi, midi_to_hz
+
+import numpy as np
+
+from utils_music import hz_to_midi, midi_to_hz, quantize_to_scale
+from config import STYLES_DIR
 
 MODES = {
     "ionian":  [0,2,4,5,7,9,11],
@@ -112,6 +118,44 @@ def enforce_min_note_beats(events, min_note_beats=1.0):
 
     return merged
 
+# -----------------------------
+# Phrase cadence
+# -----------------------------
+def append_cadence(events, cur_midi, tonic_midi, mode_offsets, midi_min, midi_max, max_jump_semitones):
+    """
+    Overwrite the last ~2 beats with a cadence onto the tonic (2-1 or 5-1),
+    kept in range and within max_jump_semitones of the note it now follows.
+    Returns the new last note.
+    """
+    cadence = random.choice([
+        [(1, tonic_midi + mode_offsets[1]), (1, tonic_midi)],
+        [(1, tonic_midi + 7), (1, tonic_midi)],
+    ])
+
+    beats_removed = 0.0
+    while beats_removed < 2.0 and events:
+        dur, _ = events.pop()
+        beats_removed += dur
+    for _, note in reversed(events):
+        if note is not None:
+            cur_midi = note
+            break
+
+    for dur, note in cadence:
+        while note < midi_min: note += 12
+        while note > midi_max: note -= 12
+        if abs(note - cur_midi) > max_jump_semitones:
+            step = 1 if note > cur_midi else -1
+            note = cur_midi + step * min(max_jump_semitones, abs(note - cur_midi))
+            # the clamp can land between scale notes: snap, toward cur_midi if need be
+            snapped = int(quantize_to_scale(note, tonic_midi, mode_offsets))
+            if abs(snapped - cur_midi) > max_jump_semitones:
+                snapped = int(quantize_to_scale(note - step, tonic_midi, mode_offsets))
+            note = snapped
+        cur_midi = note
+        events.append((dur, note))
+    return cur_midi
+
 # -----------------------------
 # Generator A
 # -----------------------------
@@ -236,24 +280,8 @@ def generator_A(
                 beats_done += dur
 
         # cadence overwrite last ~2 beats
-        cadence = random.choice([
-            [(1, tonic_midi + mode_offsets[1]), (1, tonic_midi)],
-            [(1, tonic_midi + 7), (1, tonic_midi)],
-        ])
-
-        beats_removed = 0.0
-        while beats_removed < 2.0 and events:
-            dur, _ = events.pop()
-            beats_removed += dur
-
-        for dur, note in cadence:
-            while note < midi_min: note += 12
-            while note > midi_max: note -= 12
-            if abs(note - cur_midi) > max_jump_semitones:
-                step = 1 if note > cur_midi else -1
-                note = cur_midi + step * min(max_jump_semitones, abs(note - cur_midi))
-            cur_midi = note
-            events.append((dur, note))
+        cur_midi = append_cadence(events, cur_midi, tonic_midi, mode_offsets,
+                                  midi_min, midi_max, max_jump_semitones)
 
         events.append((random.choice([1,2]), None))
 
@@ -261,6 +289,161 @@ def generator_A(
     events = enforce_min_note_beats(events, min_note_beats=min_note_beats)
     return events, bpm
 
+# -----------------------------
+# Style presets (trained by style_trainer.py)
+# -----------------------------
+STYLE_VERSION = 2        # 2: phrase-start rhythm rows trained, unseen contexts backed off
+STYLE_DURS = (0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 4.0)   # note/rest lengths (beats)
+STYLE_MAX_STEP = 7       # scale-degree steps -7..7 (larger leaps are clipped)
+STYLE_BAR_SLOTS = 8      # onset positions per 4/4 bar (eighths)
+
+
+def style_table_shapes():
+    """
+    steps:  [degree, previous step (+ phrase start), next step]
+    rhythm: [bar slot, previous token (+ start), next token]; tokens are
+            STYLE_DURS indices for notes, then the same again for rests
+    """
+    n_steps = 2 * STYLE_MAX_STEP + 1
+    n_tok = 2 * len(STYLE_DURS)
+    return (7, n_steps + 1, n_steps), (STYLE_BAR_SLOTS, n_tok + 1, n_tok)
+
+
+class StyleModel:
+    """A trained preset: CDF tables memory-mapped from STYLES_DIR/<name>/."""
+    def __init__(self, path):
+        with open(os.path.join(path, "style.json")) as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != STYLE_VERSION:
+            raise ValueError(f"style {path} is version {self.meta.get('version')}, "
+                             f"expected {STYLE_VERSION}: retrain it with style_trainer.py")
+        self.name = self.meta["style"]
+        self.steps = np.load(os.path.join(path, "steps.npy"), mmap_mode="r")
+        self.rhythm = np.load(os.path.join(path, "rhythm.npy"), mmap_mode="r")
+        self.durs = tuple(self.meta["durs"])
+        self.max_step = self.meta["max_step"]
+        self.bar_slots = self.meta["bar_slots"]
+
+    @property
+    def start_step(self):
+        return self.steps.shape[1] - 1
+
+    @property
+    def start_token(self):
+        return self.rhythm.shape[1] - 1
+
+    def note_token(self, beats):
+        """Token of a note of this length (nearest of durs)."""
+        return int(np.argmin([abs(beats - d) for d in self.durs]))
+
+    def step_weights(self, degree, prev_step):
+        """Probability of each step -max_step..max_step (as a list) after prev_step from this degree."""
+        cdf = self.steps[degree, prev_step]
+        return np.diff(cdf, prepend=np.float32(0.0)).tolist()
+
+    def sample_rhythm(self, pos_beats, prev_token, min_note_beats=0.0):
+        """
+        Next token from the bar position (beats) and the previous token:
+        (beats, is_rest, token). Notes shorter than min_note_beats are not
+        drawn (rests are).
+        """
+        slot = int(round(pos_beats * self.bar_slots / 4.0)) % self.bar_slots
+        cdf = self.rhythm[slot, prev_token]
+        n = len(self.durs)
+        if min_note_beats > self.durs[0]:
+            w = np.diff(cdf, prepend=np.float32(0.0))
+            w[:n][np.asarray(self.durs) < min_note_beats] = 0.0
+            if w.sum() <= 0.0:
+                w[n - 1] = 1.0
+            cdf = np.cumsum(w)
+        tok = min(int(np.searchsorted(cdf, random.random() * cdf[-1], side="right")), len(cdf) - 1)
+        return self.durs[tok % n], tok >= n, tok
+
+
+_styles = {}
+
+
+def load_style(name, styles_dir=STYLES_DIR):
+    """StyleModel for a preset name, cached (the tables stay memory-mapped)."""
+    path = os.path.join(styles_dir, name)
+    if path not in _styles:
+        if not os.path.exists(os.path.join(path, "style.json")):
+            raise FileNotFoundError(f"no style preset '{name}' in {styles_dir}/ "
+                                    f"(train one with: python style_trainer.py <midi folder> --style {name})")
+        _styles[path] = StyleModel(path)
+    return _styles[path]
+
+
+def generator_style(
+    style,
+    tonic_midi,
+    mode_offsets,
+    midi_min,
+    midi_max,
+    bpm=100,
+    phrases=4,
+    phrase_beats_choices=(8,12,16),
+    max_jump_semitones=5,
+    min_note_beats=1.0
+):
+    """
+    Same contract as generator_A, but steps and rhythm are sampled from a
+    StyleModel's tables. Range, max jump, tonic start and phrase cadences
+    are still enforced here; a step the range or jump limit rules out is
+    dropped and the rest renormalized. Repeated notes are dropped too, as
+    in generator_A: sung, they would merge into one.
+    """
+    allowed = build_allowed_scale(tonic_midi, mode_offsets, midi_min, midi_max)
+    degree_of = {m: list(mode_offsets).index((m - tonic_midi) % 12) for m in allowed}
+    ms = style.max_step
+
+    tonic_start = min(allowed, key=lambda m: abs(m - tonic_midi))
+    cur_idx = allowed.index(tonic_start)
+    cur_midi = tonic_start
+    events = [(1.0, cur_midi)]
+    pos = 1.0                          # beats since the start (bar position)
+    prev_step = style.start_step
+    prev_tok = style.note_token(1.0)   # after the 1-beat tonic
+
+    for _ in range(phrases):
+        phrase_beats = random.choice(phrase_beats_choices)
+        beats_done = 0.0
+
+        while beats_done < phrase_beats - 1e-6:
+            dur, is_rest, prev_tok = style.sample_rhythm(pos, prev_tok, min_note_beats)
+            dur = min(dur, phrase_beats - beats_done)
+            pos += dur
+            beats_done += dur
+            if is_rest:
+                events.append((dur, None))
+                continue
+
+            weights = style.step_weights(degree_of[allowed[cur_idx]], prev_step)
+            candidates, cand_w = [], []
+            for s, w in enumerate(weights):
+                ni = cur_idx + s - ms
+                if s != ms and 0 <= ni < len(allowed) and 0 < abs(allowed[ni] - cur_midi) <= max_jump_semitones:
+                    candidates.append(s)
+                    cand_w.append(w)
+            s = weighted_choice(candidates, cand_w) if candidates else ms
+            cur_idx += s - ms
+            cur_midi = allowed[cur_idx]
+            prev_step = s
+            events.append((dur, cur_midi))
+
+        # cadence overwrite last ~2 beats
+        cur_midi = append_cadence(events, cur_midi, tonic_midi, mode_offsets,
+                                  midi_min, midi_max, max_jump_semitones)
+        cur_idx = min(range(len(allowed)), key=lambda i: abs(allowed[i] - cur_midi))
+
+        events.append((random.choice([1,2]), None))
+        pos = sum(d for d, _ in events)
+        prev_step = style.start_step
+        prev_tok = style.start_token
+
+    events = enforce_min_note_beats(events, min_note_beats=min_note_beats)
+    return events, bpm
+
 def generate_melody_for_range(
     mode_name,
     fmin_hz,
@@ -270,7 +453,8 @@ def generate_melody_for_range(
     min_note_beats=1.0,
     max_jump_semitones=5,
     tonic_name=None,          # NEW
-    force_tonic_key=False     # NEW
+    force_tonic_key=False,    # NEW
+    style=None                # trained preset name (style_trainer.py); None = generator_A
 ):
     mode_offsets = MODES[mode_name]
 
@@ -287,11 +471,20 @@ def generate_melody_for_range(
     else:
         tonic_midi = tonic_guess
 
-    events, bpm = generator_A(
-        tonic_midi, mode_offsets,
-        midi_min, midi_max,
-        bpm=bpm, phrases=phrases,
-        min_note_beats=min_note_beats,
-        max_jump_semitones=max_jump_semitones
-    )
+    if style:
+        events, bpm = generator_style(
+            load_style(style), tonic_midi, mode_offsets,
+            midi_min, midi_max,
+            bpm=bpm, phrases=phrases,
+            min_note_beats=min_note_beats,
+            max_jump_semitones=max_jump_semitones
+        )
+    else:
+        events, bpm = generator_A(
+            tonic_midi, mode_offsets,
+            midi_min, midi_max,
+            bpm=bpm, phrases=phrases,
+            min_note_beats=min_note_beats,
+            max_jump_semitones=max_jump_semitones
+        )
     return events, bpm, midi_min, midi_max, tonic_midi
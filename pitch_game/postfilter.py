@@ -0,0 +1,137 @@
+# postfilter.py
+"""
+Online clean-up of raw detector output: steadier voicing and a smoother
+trace. One call per hop, fixed work (used when config POSTFILTER is on):
+
+    pf = PitchPostFilter()
+    pf.set_range(fmin_hz, fmax_hz)            # after calibration (optional)
+    hz, conf, flags = pf(f0, conf, t)         # hz NaN when unvoiced
+
+Stages, in order:
+  voicing     hysteresis on confidence: CONF_THRESH to start a note, a
+              little less to keep it, so notes don't flicker on and off
+  octave      a value about an octave off the note so far (or outside the
+              calibrated range when an octave away is inside it) is folded
+              back; a jump that persists is accepted as real
+  median      running median of the last few voiced values
+  hold        short dropouts inside a note keep the last value, for up to
+              POSTFILTER_HOLD_S scaled by how confident that value was
+
+Median and octave reference restart at every note onset, so a new note
+is never pulled towards the previous one (a leap of an octave between
+notes is common; only the range check applies to a note's first hops).
+"""
+import math
+from collections import deque
+
+from results_ring import FLAG_VOICED
+from config import (
+    CONF_THRESH, POSTFILTER_MEDIAN, POSTFILTER_CONF_HYST, POSTFILTER_OCTAVE_HISTORY,
+    POSTFILTER_OCTAVE_ACCEPT_S, POSTFILTER_HOLD_S, POSTFILTER_RANGE_MARGIN,
+)
+
+# flags bits, next to results_ring's
+FLAG_HELD = 8           # value held over a dropout, not measured this hop
+FLAG_OCTAVE_FIXED = 16  # measured value was moved by an octave
+
+OCTAVE_TOL = 2.0        # semitones: |jump - 12| below this looks like an octave error
+
+
+def _midi(hz):
+    return 69.0 + 12.0 * math.log2(hz / 440.0)
+
+
+def _hz(midi):
+    return 440.0 * 2.0 ** ((midi - 69.0) / 12.0)
+
+
+def _median(values):
+    s = sorted(values)
+    n = len(s)
+    return s[n // 2] if n % 2 else 0.5 * (s[n // 2 - 1] + s[n // 2])
+
+
+class PitchPostFilter:
+    def __init__(self, median=POSTFILTER_MEDIAN, conf_on=CONF_THRESH,
+                 conf_hyst=POSTFILTER_CONF_HYST, octave_history=POSTFILTER_OCTAVE_HISTORY,
+                 octave_accept_s=POSTFILTER_OCTAVE_ACCEPT_S, hold_s=POSTFILTER_HOLD_S,
+                 range_margin=POSTFILTER_RANGE_MARGIN):
+        self.conf_on = conf_on
+        self.conf_off = conf_on - conf_hyst
+        self.octave_accept_s = octave_accept_s
+        self.hold_s = hold_s
+        self.range_margin = range_margin
+        self._range = None                       # (lo, hi) midi, with margin
+
+        self._recent = deque(maxlen=median)      # this note's corrected values
+        self._history = deque(maxlen=octave_history)   # this note's outputs, octave reference
+        self._voiced = False
+        self._out = math.nan                     # last output (midi)
+        self._out_conf = 0.0
+        self._t_voiced = -math.inf               # last hop with a measured value
+        self._jump_since = None                  # when a run of octave-off values began
+
+    def set_range(self, fmin_hz, fmax_hz):
+        """Calibrated range: values outside it are folded in by an octave when that lands inside."""
+        self._range = (_midi(fmin_hz) - self.range_margin, _midi(fmax_hz) + self.range_margin)
+
+    def reset(self):
+        self._recent.clear()
+        self._history.clear()
+        self._voiced = False
+        self._out = math.nan
+        self._jump_since = None
+
+    # ---------- stages ----------
+    def _voicing(self, f0, conf):
+        ok = 20.0 < f0 < 2000.0 and conf >= (self.conf_off if self._voiced else self.conf_on)
+        self._voiced = ok
+        return ok
+
+    def _fix_octave(self, m, t):
+        fixed = False
+        rng = self._range
+        if rng is not None and not rng[0] <= m <= rng[1]:
+            for k in (-12.0, 12.0):
+                if rng[0] <= m + k <= rng[1]:
+                    m += k
+                    fixed = True
+                    break
+
+        if self._history:
+            d = m - _median(self._history)
+            k = -12.0 if abs(d - 12.0) < OCTAVE_TOL else 12.0 if abs(d + 12.0) < OCTAVE_TOL else 0.0
+            if k:
+                if self._jump_since is None:
+                    self._jump_since = t
+                if t - self._jump_since < self.octave_accept_s:
+                    return m + k, True
+                # the singer really moved an octave: follow them
+                self._history.clear()
+                self._recent.clear()
+            self._jump_since = None
+        return m, fixed
+
+    # ---------- per hop ----------
+    def __call__(self, f0, conf, t):
+        """Raw detector (f0 Hz, confidence) at time t (s) -> (hz or NaN, conf, flags)."""
+        if not self._voicing(f0, conf):
+            if math.isfinite(self._out) and t - self._t_voiced <= self.hold_s * self._out_conf:
+                return _hz(self._out), self._out_conf, FLAG_VOICED | FLAG_HELD
+            self._out = math.nan
+            return math.nan, conf, 0
+
+        if not math.isfinite(self._out):
+            # note onset
+            self._recent.clear()
+            self._history.clear()
+            self._jump_since = None
+        m, fixed = self._fix_octave(_midi(f0), t)
+        self._recent.append(m)
+        out = _median(self._recent)
+
+        self._history.append(out)
+        self._out = out
+        self._out_conf = conf
+        self._t_voiced = t
+        return _hz(out), conf, FLAG_VOICED | (FLAG_OCTAVE_FIXED if fixed else 0)
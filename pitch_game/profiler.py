@@ -0,0 +1,158 @@
+# profiler.py
+import json
+import math
+import threading
+
+import clock
+
+# log-spaced histogram: BUCKETS_PER_OCTAVE buckets per doubling, starting at 1 µs
+BUCKETS_PER_OCTAVE = 4
+N_BUCKETS = 26 * BUCKETS_PER_OCTAVE   # 1 µs .. ~67 s
+
+
+def _bucket(dt):
+    us = dt * 1e6
+    if us <= 1.0:
+        return 0
+    return min(N_BUCKETS - 1, int(math.log2(us) * BUCKETS_PER_OCTAVE))
+
+
+def _bucket_upper_s(i):
+    return 2.0 ** ((i + 1) / BUCKETS_PER_OCTAVE) * 1e-6
+
+
+class _Section:
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * N_BUCKETS
+
+    def add(self, dt):
+        self.count += 1
+        self.total += dt
+        if dt > self.max:
+            self.max = dt
+        self.buckets[_bucket(dt)] += 1
+
+    def percentile(self, q):
+        """Upper edge of the bucket holding the q-th percentile (seconds)."""
+        if self.count == 0:
+            return 0.0
+        rank = q / 100.0 * self.count
+        acc = 0
+        for i, c in enumerate(self.buckets):
+            acc += c
+            if acc >= rank and c:
+                return min(_bucket_upper_s(i), self.max)
+        return self.max
+
+    def to_dict(self):
+        hist = [
+            [round(_bucket_upper_s(i) * 1000.0, 4), c]
+            for i, c in enumerate(self.buckets) if c
+        ]
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000.0,
+            "mean_ms": self.total / self.count * 1000.0 if self.count else 0.0,
+            "max_ms": self.max * 1000.0,
+            "p50_ms": self.percentile(50) * 1000.0,
+            "p90_ms": self.percentile(90) * 1000.0,
+            "p99_ms": self.percentile(99) * 1000.0,
+            "histogram_ms": hist,   # [bucket upper edge, count]
+        }
+
+
+class _Timed:
+    __slots__ = ("prof", "name", "t0")
+
+    def __init__(self, prof, name):
+        self.prof = prof
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = clock.now()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.prof.add(self.name, clock.now() - self.t0)
+        return False
+
+
+class _NullTimed:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL = _NullTimed()
+
+
+class Profiler:
+    """
+    Always-present timing hooks. While `enabled` is False every hook is a
+    single attribute check, so they stay compiled into the hot paths.
+
+    Hot paths (audio callback, worker) use the start()/stop() pair;
+    everything else can use `with PROFILER.section(name):`.
+    """
+    def __init__(self):
+        self.enabled = False
+        self._sections = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._t_enabled = 0.0
+
+    def enable(self):
+        self._t_enabled = clock.now()
+        self.enabled = True
+
+    def start(self):
+        return clock.now() if self.enabled else 0.0
+
+    def stop(self, name, t_start):
+        if self.enabled:
+            self.add(name, clock.now() - t_start)
+
+    def section(self, name):
+        if not self.enabled:
+            return _NULL
+        return _Timed(self, name)
+
+    def add(self, name, dt):
+        with self._lock:
+            sec = self._sections.get(name)
+            if sec is None:
+                sec = self._sections[name] = _Section()
+            sec.add(dt)
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    # ---------- reporting ----------
+    def snapshot(self):
+        with self._lock:
+            return {
+                "wall_s": clock.now() - self._t_enabled if self.enabled else 0.0,
+                "sections": {k: v.to_dict() for k, v in sorted(self._sections.items())},
+                "counters": dict(sorted(self._counters.items())),
+            }
+
+    def dump(self, path):
+        snap = self.snapshot()
+        with open(path, "w") as f:
+            json.dump(snap, f, indent=2)
+        print(f"Profile written to {path} ({len(snap['sections'])} sections)")
+
+
+PROFILER = Profiler()
@@ -0,0 +1,281 @@
+# recorder.py
+"""
+Non-blocking session recorder.
+
+The audio callback and pitch worker copy into preallocated chunk buffers and
+hand full chunks to a background writer thread through a lock-free deque, so
+neither ever waits on file I/O or a lock. If the disk falls so far behind
+that every buffer is in flight, new data is dropped (and counted) instead of
+blocking. close() only raises flags: producers stop writing, and the writer
+thread waits out a write in progress before it flushes the partial chunks.
+
+On-disk layout, one directory per session:
+  audio.f32   header + raw float32 mono samples
+  output.f32  header + what was played on a duplex stream (optional)
+  pitch.rec   header + PITCH_DTYPE records (t, hz, conf)
+  meta.json   sample rate, hop, level info, drop counts
+  level.json  the level that was played (levels.save_level)
+
+Both binary files are append-only with a fixed HEADER_SIZE header, so they
+can be memory-mapped directly (see open_session); a crash only loses the
+unwritten tail.
+"""
+import json
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from config import SR, HOP_SIZE, RECORD_AUDIO_CHUNK, RECORD_PITCH_CHUNK, RECORD_BUFFERS
+
+MAGIC = b"PGREC1\0\0"
+HEADER_SIZE = 64
+HEADER_FMT = "<8s8sII"   # magic, kind, sample rate, hop size (rest is padding)
+
+AUDIO_DTYPE = np.dtype("<f4")
+PITCH_DTYPE = np.dtype([("t", "<f8"), ("hz", "<f4"), ("conf", "<f4")])
+
+AUDIO_FILE = "audio.f32"
+OUTPUT_FILE = "output.f32"
+PITCH_FILE = "pitch.rec"
+META_FILE = "meta.json"
+LEVEL_FILE = "level.json"
+
+WRITER_POLL_S = 0.05
+
+
+def _write_header(f, kind, sr, hop):
+    head = struct.pack(HEADER_FMT, MAGIC, kind.encode().ljust(8, b"\0"), sr, hop)
+    f.write(head.ljust(HEADER_SIZE, b"\0"))
+
+
+def read_header(path):
+    with open(path, "rb") as f:
+        raw = f.read(HEADER_SIZE)
+    magic, kind, sr, hop = struct.unpack_from(HEADER_FMT, raw)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a pitch game recording")
+    return kind.rstrip(b"\0").decode(), sr, hop
+
+
+class _Channel:
+    """
+    Single-producer chunked buffer for one file.
+    write() is called from exactly one thread (callback or worker). Once
+    `closed` is set it drops its data; `busy` marks a write in progress, so
+    the writer thread knows when the current buffer is its alone.
+    """
+    def __init__(self, f, dtype, chunk, n_buffers):
+        self.f = f
+        self._free = deque(np.empty(chunk, dtype=dtype) for _ in range(n_buffers))
+        self._full = deque()     # (buffer, n_valid) ready for the writer
+        self._buf = self._free.popleft()
+        self._n = 0
+        self.dropped = 0
+        self.written = 0
+        self.closed = False
+        self.busy = False
+
+    def write(self, data):
+        """Copy `data` (array or single record) in; never blocks."""
+        # busy before closed is read, and closed before busy is read in
+        # wait_idle: one of the two always sees the other
+        self.busy = True
+        if not self.closed:
+            self._write(np.atleast_1d(data))
+        self.busy = False
+
+    def _write(self, data):
+        i = 0
+        while i < len(data):
+            if self._buf is None:
+                # all buffers in flight: drop the rest rather than wait
+                try:
+                    self._buf = self._free.popleft()
+                except IndexError:
+                    self.dropped += len(data) - i
+                    return
+            take = min(len(data) - i, len(self._buf) - self._n)
+            self._buf[self._n:self._n + take] = data[i:i + take]
+            self._n += take
+            i += take
+            if self._n == len(self._buf):
+                self._full.append((self._buf, self._n))
+                self._buf, self._n = None, 0
+
+    def wait_idle(self):
+        """Writer side, after `closed` is set: until a write in progress has returned."""
+        while self.busy:
+            time.sleep(0.001)
+
+    def flush_partial(self):
+        """Writer side, once idle after close: queue whatever is in the current buffer."""
+        if self._buf is not None and self._n:
+            self._full.append((self._buf, self._n))
+            self._buf, self._n = None, 0
+
+    def drain(self):
+        """Writer side: write all queued chunks and recycle their buffers."""
+        while self._full:
+            buf, n = self._full.popleft()
+            self.f.write(buf[:n].view(np.uint8).data)
+            self.written += n
+            self._free.append(buf)
+
+
+class SessionRecorder:
+    """
+    Tees raw input hops and pitch results to disk.
+
+        rec = SessionRecorder("sessions/20240101-120000", t0=clock.now())
+        pitch_stream.recorder = rec      # PitchStream calls write_audio / write_pitch
+        ...
+        rec.close(extra_meta)
+
+    Pitch times are stored relative to t0 (level start). With output=True
+    the duplex stream's output blocks are kept too (write_output), e.g. as
+    the reference for echo_cancel.py.
+    """
+    def __init__(self, path, t0, sr=SR, hop=HOP_SIZE, output=False):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.t0 = t0
+        self.sr = sr
+        self.hop = hop
+        self.audio_t_start = None   # level time of the first recorded sample
+        self.output_t_start = None  # level time the first recorded output sample left the DAC
+
+        self._audio_f = open(os.path.join(path, AUDIO_FILE), "wb")
+        self._pitch_f = open(os.path.join(path, PITCH_FILE), "wb")
+        _write_header(self._audio_f, "audio", sr, hop)
+        _write_header(self._pitch_f, "pitch", sr, hop)
+
+        self._audio = _Channel(self._audio_f, AUDIO_DTYPE, RECORD_AUDIO_CHUNK, RECORD_BUFFERS)
+        self._pitch = _Channel(self._pitch_f, PITCH_DTYPE, RECORD_PITCH_CHUNK, RECORD_BUFFERS)
+        self._rec = np.zeros(1, dtype=PITCH_DTYPE)   # scratch record for write_pitch
+        self._output_f = None
+        self._output = None
+        if output:
+            self._output_f = open(os.path.join(path, OUTPUT_FILE), "wb")
+            _write_header(self._output_f, "output", sr, hop)
+            self._output = _Channel(self._output_f, AUDIO_DTYPE, RECORD_AUDIO_CHUNK, RECORD_BUFFERS)
+
+        self._stop = threading.Event()
+        self._closed = False
+        self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer.start()
+
+    # ---------- producers (audio callback / pitch worker) ----------
+    def write_audio(self, hop, t_adc):
+        if self.audio_t_start is None:
+            self.audio_t_start = t_adc - self.t0
+        self._audio.write(hop)
+
+    def write_output(self, block, t_dac):
+        # from the first callback that recorded input on, so that
+        # output_t_start - audio_t_start is the output -> input latency
+        if self._output is None or self.audio_t_start is None:
+            return
+        if self.output_t_start is None:
+            self.output_t_start = t_dac - self.t0
+        self._output.write(block)
+
+    def write_pitch(self, t, hz, conf):
+        rec = self._rec
+        rec["t"] = t - self.t0
+        rec["hz"] = hz
+        rec["conf"] = conf
+        self._pitch.write(rec)
+
+    # ---------- writer thread ----------
+    def _writer_loop(self):
+        channels = [c for c in (self._audio, self._pitch, self._output) if c is not None]
+        while not self._stop.wait(WRITER_POLL_S):
+            for c in channels:
+                c.drain()
+        # close(): producers see `closed`; the buffers are ours once they're out
+        for c in channels:
+            c.wait_idle()
+            c.flush_partial()
+            c.drain()
+
+    def close(self, meta=None):
+        """
+        Stop recording. Safe while the callback/worker still hold the
+        recorder: each channel stops taking writes before its partial chunk
+        is flushed, and a write in progress finishes first.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        for c in (self._audio, self._pitch, self._output):
+            if c is not None:
+                c.closed = True
+        self._stop.set()
+        self._writer.join()
+        self._audio_f.close()
+        self._pitch_f.close()
+        if self._output_f is not None:
+            self._output_f.close()
+
+        info = dict(meta or {})
+        info.update({
+            "sr": self.sr,
+            "hop": self.hop,
+            "audio_t_start": self.audio_t_start,
+            "audio_samples": self._audio.written,
+            "pitch_samples": self._pitch.written,
+            "audio_dropped": self._audio.dropped,
+            "pitch_dropped": self._pitch.dropped,
+        })
+        if self._output is not None:
+            info.update({
+                "output_t_start": self.output_t_start,
+                "output_samples": self._output.written,
+                "output_dropped": self._output.dropped,
+            })
+        with open(os.path.join(self.path, META_FILE), "w") as f:
+            json.dump(info, f, indent=2)
+        return info
+
+
+def session_dir(root):
+    return os.path.join(root, time.strftime("%Y%m%d-%H%M%S"))
+
+
+def _memmap(path, dtype):
+    size = os.path.getsize(path) - HEADER_SIZE
+    n = max(0, size // dtype.itemsize)     # ignore a torn trailing record
+    if n == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=HEADER_SIZE, shape=(n,))
+
+
+def open_session(path):
+    """
+    Memory-map a recorded session. Returns a dict with
+    audio (float32 memmap), pitch (PITCH_DTYPE memmap), meta (dict), and
+    output (float32 memmap) if the session recorded one.
+    """
+    meta_path = os.path.join(path, META_FILE)
+    meta = {}
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+    audio_path = os.path.join(path, AUDIO_FILE)
+    pitch_path = os.path.join(path, PITCH_FILE)
+    _, sr, hop = read_header(pitch_path)
+    meta.setdefault("sr", sr)
+    meta.setdefault("hop", hop)
+    session = {
+        "audio": _memmap(audio_path, AUDIO_DTYPE),
+        "pitch": _memmap(pitch_path, PITCH_DTYPE),
+        "meta": meta,
+    }
+    output_path = os.path.join(path, OUTPUT_FILE)
+    if os.path.exists(output_path):
+        session["output"] = _memmap(output_path, AUDIO_DTYPE)
+    return session
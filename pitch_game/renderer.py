@@ -1,51 +1,40 @@
 # renderer.py
 import numpy as np
 import matplotlib.pyplot as plt
+import matplotlib.transforms as mtransforms
+from matplotlib.collections import PolyCollection
+from matplotlib.patches import Rectangle
 import math
 
-from utils_music import hz_to_midi, midi_to_name, cents_error
+from utils_music import hz_to_midi, midi_names
+from profiler import PROFILER
+from renderers import BaseRenderer
 from config import (
     WINDOW_SECONDS, Y_STEP_SEMITONE,
     ALPHA_GREEN, ALPHA_BLUE,
-    LOOKAHEAD_SECONDS, DY_SEMITONES
+    DY_SEMITONES, SPECTROGRAM_ALPHA
 )
 
-INTERVAL_NAMES = {
-    1: "semitone",
-    2: "tone",
-    3: "minor third",
-    4: "major third",
-    5: "fourth",
-    7: "fifth",
-}
-
-def interval_label(semitones_signed):
-    if not np.isfinite(semitones_signed):
-        return None
-    direction = (
-        "ascending" if semitones_signed > 0
-        else "descending" if semitones_signed < 0
-        else "unison"
-    )
-    st = int(round(abs(semitones_signed)))
-    name = INTERVAL_NAMES.get(st, f"{st} semitones")
-    return "unison" if direction == "unison" else f"{name} {direction}"
-
-
-class GameRenderer:
-    def __init__(self, fmin_plot, fmax_plot, dy_semitones):
+
+class GameRenderer(BaseRenderer):
+    def __init__(self, fmin_plot, fmax_plot, dy_semitones, n_users=1):
         self.fmin_plot_hz = fmin_plot
         self.fmax_plot_hz = fmax_plot
         self.dy_semitones = dy_semitones
         self.window_seconds = WINDOW_SECONDS
+        self.n_users = n_users
 
-        self.map_im = None
-        self._t_target_full = None
-        self._hz_target_full = None
-        self._midi_target_full = None
-        self._midi_target_q_full = None
-        self._rgba_full = None
+        # lane: note rectangles + target steps in level time, moved to
+        # "x = 0 is now" by one shared translation, so a frame (or a tempo
+        # change) never touches per-hop data
+        self._lane = None
+        self._lane_shift = mtransforms.Affine2D()
         self._y_bins_midi = None
+        self._spectrogram = None
+        self._spec_ims = []
+        self._spec_seen = -1
+        # per-singer float32 scratch for hz -> midi, reused every frame
+        self._midi_bufs = [np.empty(0, dtype=np.float32) for _ in range(n_users)]
 
         self._setup_axes()
 
@@ -54,12 +43,19 @@ class GameRenderer:
         midi_max = float(hz_to_midi(self.fmax_plot_hz))
 
         midi_ticks = list(range(int(math.floor(midi_min)), int(math.ceil(midi_max)) + 1))
-        tick_labels = [midi_to_name(m) for m in midi_ticks]
+        tick_labels = midi_names(midi_ticks).tolist()
 
         plt.ion()
         self.fig, self.ax = plt.subplots(figsize=(10, 6))
 
-        (self.line_user,) = self.ax.plot([], [], lw=2, label="You", zorder=3)
+        (self.line_user,) = self.ax.plot(
+            [], [], lw=2, label="You" if self.n_users == 1 else "Singer 1", zorder=3
+        )
+        # one line per singer in group mode (line_user is singer 1)
+        self.line_users = [self.line_user] + [
+            self.ax.plot([], [], lw=1.5, label=f"Singer {i + 1}", zorder=3)[0]
+            for i in range(1, self.n_users)
+        ]
 
         (self.line_target,) = self.ax.plot(
             [], [], lw=2, alpha=0.9, label="Target",
@@ -78,6 +74,10 @@ class GameRenderer:
         self.ax.legend(loc="lower left")
 
         self.score_text = self.ax.text(0.02, 0.95, "", transform=self.ax.transAxes, va="top")
+        self.quality_text = self.ax.text(
+            0.02, 0.89, "", transform=self.ax.transAxes, va="top",
+            fontsize=8, color="darkorange"
+        )
 
         self.ax_right = self.ax.twinx()
         self.ax_right.set_ylim(self.ax.get_ylim())
@@ -102,178 +102,213 @@ class GameRenderer:
                 ha="right", va="bottom"
             )
 
+        self.latency_text = self.ax.text(
+            0.98, 0.95, "", transform=self.ax.transAxes,
+            ha="right", va="top", family="monospace", fontsize=7, alpha=0.7
+        )
+
+        self.fig.canvas.mpl_connect("key_press_event", self._on_key)
+
 
     def _sync_right_axis(self):
         y0, y1 = self.ax.get_ylim()
         self.ax_right.set_ylim(y0, y1)
 
         midi_ticks = list(range(int(math.floor(y0)), int(math.ceil(y1)) + 1))
-        tick_labels = [midi_to_name(m) for m in midi_ticks]
+        tick_labels = midi_names(midi_ticks).tolist()
 
         self.ax.set_yticks(midi_ticks)
         self.ax.set_yticklabels(tick_labels)
         self.ax_right.set_yticks(midi_ticks)
         self.ax_right.set_yticklabels(tick_labels)
 
-    def make_map_rgba_midi(self, t_target, midi_target_q):
-        midi_min = float(hz_to_midi(self.fmin_plot_hz))
-        midi_max = float(hz_to_midi(self.fmax_plot_hz))
-
-        y_bins_midi = np.arange(midi_min, midi_max + Y_STEP_SEMITONE, Y_STEP_SEMITONE)
-        self._y_bins_midi = y_bins_midi
-
-        T = len(t_target)
-        Y = len(y_bins_midi)
-        rgba = np.zeros((Y, T, 4), dtype=np.float32)
-
-        # blue everywhere
-        rgba[..., 2] = 1.0
-        rgba[..., 3] = ALPHA_BLUE
-
-        # green lane
-        for k in range(T):
-            m = midi_target_q[k]
-            if not np.isfinite(m):
-                continue
-            mask = np.abs(y_bins_midi - m) <= self.dy_semitones
-            rgba[mask, k, 0] = 0.0
-            rgba[mask, k, 1] = 1.0
-            rgba[mask, k, 2] = 0.0
-            rgba[mask, k, 3] = ALPHA_GREEN
-
-        return rgba
-
-    def draw_background_map(self, t_target, hz_target):
-        self._t_target_full = t_target
-        self._hz_target_full = hz_target
-
-        self._midi_target_full = hz_to_midi(hz_target)
-        self._midi_target_q_full = np.where(
-            np.isfinite(self._midi_target_full),
-            np.round(self._midi_target_full),
-            np.nan
-        )
-
-        voiced = self._midi_target_q_full[np.isfinite(self._midi_target_q_full)]
+    def _on_key(self, event):
+        if event.key in ("up", "+", "="):
+            self._tempo_steps += 1
+        elif event.key in ("down", "-"):
+            self._tempo_steps -= 1
+
+    def _place_lane(self):
+        """Note rectangles and target steps at the level's current note times (O(notes))."""
+        lv = self.level
+        voiced = np.flatnonzero(np.isfinite(lv.midi))
+        t0, t1, m = lv.t0[voiced], lv.t1[voiced], lv.midi[voiced]
+        dy = self.dy_semitones
+        self._lane.set_verts(np.stack([
+            np.column_stack([t0, m - dy]), np.column_stack([t1, m - dy]),
+            np.column_stack([t1, m + dy]), np.column_stack([t0, m + dy]),
+        ], axis=1))
+
+        # steps-post target line: one run per group of back-to-back notes
+        xs, ys = [], []
+        for j, i in enumerate(voiced):
+            xs += [lv.t0[i], lv.t1[i]]
+            ys += [lv.midi[i], lv.midi[i]]
+            if j + 1 < len(voiced) and voiced[j + 1] != i + 1:
+                xs.append(np.nan)
+                ys.append(np.nan)
+        self.line_target.set_data(xs, ys)
+
+    def draw_background_map(self, level):
+        self.level = level
+        voiced = level.midi[np.isfinite(level.midi)]
         if len(voiced) > 0:
             m_lo, m_hi = float(voiced.min()), float(voiced.max())
             pad = max(2.0 * DY_SEMITONES, 1.0)
             self.ax.set_ylim(m_lo - pad, m_hi + pad)
             self._sync_right_axis()
 
-        self._rgba_full = self.make_map_rgba_midi(t_target, self._midi_target_q_full)
-
-        self.map_im = self.ax.imshow(
-            self._rgba_full[:, :1, :],
-            origin="lower",
-            aspect="auto",
-            extent=[-self.window_seconds, 0, self._y_bins_midi[0], self._y_bins_midi[-1]],
-            zorder=0
-        )
+        # pitch rows a Spectrogram underlay is resampled to
+        midi_min = float(hz_to_midi(self.fmin_plot_hz))
+        midi_max = float(hz_to_midi(self.fmax_plot_hz))
+        self._y_bins_midi = np.arange(midi_min, midi_max + Y_STEP_SEMITONE, Y_STEP_SEMITONE)
+
+        shifted = self._lane_shift + self.ax.transData
+        # blue behind everything, green per note
+        self.ax.add_patch(Rectangle((0, 0), 1, 1, transform=self.ax.transAxes,
+                                    facecolor=(0.0, 0.0, 1.0, ALPHA_BLUE), edgecolor="none", zorder=0))
+        self._lane = PolyCollection([], facecolors=[(0.0, 1.0, 0.0, ALPHA_GREEN)],
+                                    edgecolors="none", transform=shifted, zorder=0)
+        self.ax.add_collection(self._lane, autolim=False)
+        self.line_target.set_transform(shifted)
+        self._level_changed()
+        self._place_lane()
 
         self.fig.canvas.draw()
         self.fig.canvas.flush_events()
 
-    def _next_target_any(self, k_start, midi_target_q):
-        if k_start >= len(midi_target_q):
-            return None, np.nan
-        return k_start, midi_target_q[k_start]
-
-    def _current_target_midi(self, k_now):
-        if self._midi_target_q_full is None:
-            return np.nan
-        k_now = min(max(k_now, 0), len(self._midi_target_q_full) - 1)
-
-        if np.isfinite(self._midi_target_q_full[k_now]):
-            return self._midi_target_q_full[k_now]
-
-        for k in range(k_now, -1, -1):
-            if np.isfinite(self._midi_target_q_full[k]):
-                return self._midi_target_q_full[k]
-        return np.nan
-
-    def update(self, now, user_times, user_pitches_hz, t_target, hz_target, latest_pitch_hz):
+    @property
+    def y_bins_midi(self):
+        return self._y_bins_midi
+
+    def attach_spectrogram(self, spectrogram):
+        """
+        Show `spectrogram` (rows = y_bins_midi) under the lane. Two images,
+        one per ring half, so each frame only moves extents; pixel data is
+        refreshed only when new columns arrived.
+        """
+        self._spectrogram = spectrogram
+        y0, y1 = self._y_bins_midi[0], self._y_bins_midi[-1]
+        self._spec_ims = [
+            self.ax.imshow(
+                np.zeros((2, 2), dtype=np.float32), origin="lower", aspect="auto",
+                extent=[-self.window_seconds, 0, y0, y1], cmap="Greys", vmin=0.0, vmax=1.0,
+                alpha=SPECTROGRAM_ALPHA, interpolation="nearest", zorder=-1, visible=False,
+            )
+            for _ in range(2)
+        ]
+        # imshow resets the view; keep the game's axes
+        self.ax.set_xlim(-self.window_seconds, 0)
+        self._sync_right_axis()
+
+    def _update_spectrogram(self, now):
+        spec = self._spectrogram
+        halves = spec.halves()
+        fresh = spec.pushed != self._spec_seen
+        self._spec_seen = spec.pushed
+        y0, y1 = self._y_bins_midi[0], self._y_bins_midi[-1]
+        for k, im in enumerate(self._spec_ims):
+            if k < len(halves):
+                img, t_a, t_b = halves[k]
+                if fresh:
+                    im.set_data(img)
+                im.set_extent([t_a - now, t_b - now, y0, y1])
+                im.set_visible(True)
+            else:
+                im.set_visible(False)
+
+    def _trace_midi(self, k, pitches_hz):
+        """Singer k's pitches as midi, converted in place in a reused float32 buffer."""
+        n = len(pitches_hz)
+        buf = self._midi_bufs[k]
+        if len(buf) < n:
+            buf = self._midi_bufs[k] = np.empty(max(n, 2 * len(buf)), dtype=np.float32)
+        out = buf[:n]
+        out[:] = pitches_hz
+        return hz_to_midi(out, out=out)
+
+    def set_latency_text(self, text):
+        self.latency_text.set_text(text)
+
+    def set_quality_text(self, text):
+        self.quality_text.set_text(text)
+
+    def update(self, now, user_times, user_pitches_hz, latest_pitch_hz,
+               latency_s=0.0, extra_traces=()):
+        """
+        user_times are game-relative seconds on the same clock as `now`.
+        latency_s: measured capture -> screen delay; the latest pitch is scored
+        against the target that was due when it was sung, not the one due now.
+        Group mode: extra_traces holds (times, pitches_hz) for singers 2..N and
+        latest_pitch_hz one value per singer.
+        """
         if len(user_times) < 2:
             return
 
-        # user line
-        p_arr_hz = np.array(user_pitches_hz)
-        p_arr_midi = hz_to_midi(p_arr_hz)
+        # user line (x=0 is `now`, so a compensated trace trails by its delay)
+        t_prof = PROFILER.start()
+        p_arr_midi = self._trace_midi(0, user_pitches_hz)
 
         t_arr = np.array(user_times)
-        t_rel = t_arr - t_arr[-1]
+        t_rel = t_arr - now
         self.line_user.set_data(t_rel, p_arr_midi)
-
-        # target window indices
-        dt = (t_target[1] - t_target[0]) if len(t_target) > 1 else 0.01
-        t_win_start = max(0.0, now - self.window_seconds)
-        i0 = int(t_win_start / dt)
-        i1 = int(now / dt)
-
-        i0 = max(0, min(i0, len(t_target) - 1))
-        i1 = max(0, min(i1, len(t_target)))
-
-        # target line
-        t_t = t_target[i0:i1] - now
-        midi_t_q = self._midi_target_q_full[i0:i1]
-        self.line_target.set_data(t_t, midi_t_q)
-
-        # background map update (skip empty slice)
-        if self.map_im is not None and self._rgba_full is not None:
-            if i1 > i0:
-                rgba_win = self._rgba_full[:, i0:i1, :]
-                x0 = self._t_target_full[i0] - now
-                x1 = self._t_target_full[i1 - 1] - now
-                self.map_im.set_data(rgba_win)
-                self.map_im.set_extent([x0, x1, self._y_bins_midi[0], self._y_bins_midi[-1]])
+        for k, (line, (times, pitches)) in enumerate(zip(self.line_users[1:], extra_traces), 1):
+            line.set_data(np.asarray(times) - now, self._trace_midi(k, pitches))
+        PROFILER.stop("render.line", t_prof)
+
+        # lane: scroll by moving the shared translation
+        t_prof = PROFILER.start()
+        if self._level_changed():
+            self._place_lane()
+        self._lane_shift.clear().translate(-now, 0.0)
+        if self._spectrogram is not None:
+            self._update_spectrogram(now)
+        PROFILER.stop("render.map", t_prof)
 
         # scoring
-        k_now = int(now / dt)
-        target_now_hz = hz_target[k_now] if k_now < len(hz_target) else np.nan
-        err = cents_error(latest_pitch_hz, target_now_hz)
-        self.score_text.set_text(f"Error: {err:+.0f} cents" if np.isfinite(err) else "Error: —")
+        t_prof = PROFILER.start()
+        self.score_text.set_text(self._score_text(now, latest_pitch_hz, latency_s))
 
         # forecast
-        k_look = int((now + LOOKAHEAD_SECONDS) / dt)
-        k_next, midi_next_q = self._next_target_any(k_look, self._midi_target_q_full)
+        midi_next_q, txt = self._forecast(now)
 
-        if k_next is None:
+        if midi_next_q is None:
             self.forecast_dot.set_data([0.0], [np.nan])
             self.forecast_dot.set_alpha(0.0)
             self.pause_rect.set_visible(False)
             self.forecast_label.set_text("")
+        elif np.isfinite(midi_next_q):
+            self.pause_rect.set_visible(False)
+            self.forecast_dot.set_data([0.0], [midi_next_q])
+            self.forecast_dot.set_color("green")
+            self.forecast_dot.set_alpha(0.9)
+            self.forecast_label.set_color("green")
+            self.forecast_label.set_text(txt)
         else:
-            if np.isfinite(midi_next_q):
-                self.pause_rect.set_visible(False)
-                self.forecast_dot.set_data([0.0], [midi_next_q])
-                self.forecast_dot.set_color("green")
-                self.forecast_dot.set_alpha(0.9)
-
-                midi_curr_q = self._current_target_midi(k_now)
-                if np.isfinite(midi_curr_q):
-                    semitones_signed = midi_next_q - midi_curr_q
-                    int_lbl = interval_label(semitones_signed)
-                    txt = f"Next: {midi_to_name(midi_next_q)}"
-                    if int_lbl:
-                        txt += f"  |  {int_lbl}"
-                else:
-                    txt = f"Next: {midi_to_name(midi_next_q)}"
-
-                self.forecast_label.set_color("green")
-                self.forecast_label.set_text(txt)
-
-            else:
-                self.forecast_dot.set_data([0.0], [np.nan])
-                self.forecast_dot.set_alpha(0.0)
-                self.pause_rect.set_visible(True)
-                self.forecast_label.set_color("red")
-                self.forecast_label.set_text("Next: pause")
+            self.forecast_dot.set_data([0.0], [np.nan])
+            self.forecast_dot.set_alpha(0.0)
+            self.pause_rect.set_visible(True)
+            self.forecast_label.set_color("red")
+            self.forecast_label.set_text(txt)
 
         self.ax.set_xlim(-self.window_seconds, 0)
+        PROFILER.stop("render.text", t_prof)
 
         # flicker-free repaint
+        t_prof = PROFILER.start()
         self.fig.canvas.draw_idle()
         self.fig.canvas.flush_events()
+        PROFILER.stop("render.draw", t_prof)
+
+    def show_message(self, text):
+        """Replace the score line with `text` and repaint once."""
+        self.score_text.set_text(text)
+        self.fig.canvas.draw()
+        self.fig.canvas.flush_events()
+
+    def pump_events(self):
+        """Process window events without redrawing."""
+        self.fig.canvas.flush_events()
 
     def still_open(self):
         return plt.fignum_exists(self.fig.number)
@@ -0,0 +1,276 @@
+# renderer_pygame.py
+"""
+Low-overhead pygame (SDL) renderer, same picture as GameRenderer.
+
+Everything static (background, grid, note labels, title) is drawn once
+into a surface and blitted each frame; the lane is the level's notes
+(re-read only when a tempo change moves them), and text is rendered only
+when it changes. A frame is then a handful of rects and polylines.
+"""
+import math
+
+import numpy as np
+import pygame
+
+from utils_music import hz_to_midi, midi_to_name
+from profiler import PROFILER
+from renderers import BaseRenderer
+from config import WINDOW_SECONDS, ALPHA_GREEN, ALPHA_BLUE, DY_SEMITONES, PYGAME_WINDOW_SIZE
+
+MARGIN_X = 56
+MARGIN_Y = 36
+
+WHITE = (255, 255, 255)
+GRID = (225, 225, 225)
+AXIS = (60, 60, 60)
+# matplotlib's default color cycle, in GameRenderer's order: singers, then target
+TAB10 = [
+    (31, 119, 180), (255, 127, 14), (44, 160, 44), (214, 39, 40), (148, 103, 189),
+    (140, 86, 75), (227, 119, 194), (127, 127, 127), (188, 189, 34), (23, 190, 207),
+]
+GREEN = (0, 128, 0)
+RED = (200, 0, 0)
+
+
+def _blend(under, over, alpha):
+    return tuple(int(round((1 - alpha) * u + alpha * o)) for u, o in zip(under, over))
+
+
+BG_BLUE = _blend(WHITE, (0, 0, 255), ALPHA_BLUE)
+LANE_GREEN = _blend(BG_BLUE, (0, 255, 0), ALPHA_GREEN)
+
+
+class PygameRenderer(BaseRenderer):
+    def __init__(self, fmin_plot, fmax_plot, dy_semitones, n_users=1, size=PYGAME_WINDOW_SIZE):
+        self.fmin_plot_hz = fmin_plot
+        self.fmax_plot_hz = fmax_plot
+        self.dy_semitones = dy_semitones
+        self.window_seconds = WINDOW_SECONDS
+        self.n_users = n_users
+
+        pygame.display.init()
+        pygame.font.init()
+        self.screen = pygame.display.set_mode(size)
+        pygame.display.set_caption("Pitch Game — sing the green lane!")
+        self.font = pygame.font.SysFont(None, 22)
+        self.small = pygame.font.SysFont("monospace", 12)
+        self.plot = pygame.Rect(MARGIN_X, MARGIN_Y, size[0] - 2 * MARGIN_X, size[1] - 2 * MARGIN_Y)
+
+        self.midi_lo = float(hz_to_midi(fmin_plot))
+        self.midi_hi = float(hz_to_midi(fmax_plot))
+
+        # lane as note segments: start/end time and quantized midi (voiced only)
+        self._seg_t0 = np.zeros(0)
+        self._seg_t1 = np.zeros(0)
+        self._seg_midi = np.zeros(0)
+
+        self._score = ""
+        self._forecast_txt = ("", GREEN)
+        self._latency = ""
+        self._quality = ""
+        self._text_cache = {}
+
+        self._pause_band = pygame.Surface((max(1, int(0.18 / WINDOW_SECONDS * self.plot.w)), self.plot.h))
+        self._pause_band.set_alpha(int(255 * 0.18))
+        self._pause_band.fill((255, 0, 0))
+
+        self.user_colors = [TAB10[i % len(TAB10)] for i in range(n_users)]
+        self.target_color = TAB10[n_users % len(TAB10)]
+
+        self._open = True
+        self._build_static()
+
+    # ---------- coordinates ----------
+    def _x(self, t_rel):
+        return self.plot.left + (np.asarray(t_rel) + self.window_seconds) * (self.plot.w / self.window_seconds)
+
+    def _y(self, midi):
+        return self.plot.bottom - (np.asarray(midi) - self.midi_lo) * (self.plot.h / (self.midi_hi - self.midi_lo))
+
+    # ---------- static layer ----------
+    def _text(self, text, font=None, color=AXIS):
+        font = font or self.font
+        key = (text, id(font), color)
+        surf = self._text_cache.get(key)
+        if surf is None:
+            if len(self._text_cache) > 256:
+                self._text_cache.clear()
+            surf = font.render(text, True, color)
+            self._text_cache[key] = surf
+        return surf
+
+    def _build_static(self):
+        bg = pygame.Surface(self.screen.get_size())
+        bg.fill(WHITE)
+        bg.fill(BG_BLUE, self.plot)
+
+        for m in range(int(math.ceil(self.midi_lo)), int(math.floor(self.midi_hi)) + 1):
+            y = int(self._y(m))
+            pygame.draw.line(bg, GRID, (self.plot.left, y), (self.plot.right, y))
+            label = self.small.render(midi_to_name(m), True, AXIS)
+            bg.blit(label, (self.plot.left - label.get_width() - 6, y - label.get_height() // 2))
+            bg.blit(label, (self.plot.right + 6, y - label.get_height() // 2))
+
+        for s in range(int(self.window_seconds) + 1):
+            x = int(self._x(-s))
+            pygame.draw.line(bg, GRID, (x, self.plot.top), (x, self.plot.bottom))
+            label = self.small.render(f"{-s}", True, AXIS)
+            bg.blit(label, (x - label.get_width() // 2, self.plot.bottom + 4))
+
+        pygame.draw.rect(bg, AXIS, self.plot, 1)
+        title = self.font.render("Pitch Game — sing the green lane!", True, AXIS)
+        bg.blit(title, (self.screen.get_width() // 2 - title.get_width() // 2, 8))
+
+        # legend, bottom left
+        names = ["You"] if self.n_users == 1 else [f"Singer {i + 1}" for i in range(self.n_users)]
+        entries = list(zip(names, self.user_colors)) + [("Target", self.target_color)]
+        y = self.plot.bottom - 8 - 16 * len(entries)
+        for name, color in entries:
+            pygame.draw.line(bg, color, (self.plot.left + 10, y + 7), (self.plot.left + 30, y + 7), 2)
+            bg.blit(self.small.render(name, True, AXIS), (self.plot.left + 36, y))
+            y += 16
+        self._static = bg
+
+    def _place_lane(self):
+        """Voiced notes at the level's current times (O(notes))."""
+        lv = self.level
+        voiced = np.isfinite(lv.midi)
+        self._seg_t0 = lv.t0[voiced]
+        self._seg_t1 = lv.t1[voiced]
+        self._seg_midi = lv.midi[voiced]
+
+    def draw_background_map(self, level):
+        self.level = level
+        self._level_changed()
+        self._place_lane()
+
+        if len(self._seg_midi):
+            pad = max(2.0 * DY_SEMITONES, 1.0)
+            self.midi_lo = float(self._seg_midi.min()) - pad
+            self.midi_hi = float(self._seg_midi.max()) + pad
+            self._build_static()
+        self.screen.blit(self._static, (0, 0))
+        pygame.display.flip()
+
+    # ---------- per frame ----------
+    def set_latency_text(self, text):
+        self._latency = text
+
+    def set_quality_text(self, text):
+        self._quality = text
+
+    def _draw_trace(self, times, pitches_hz, now, color, width):
+        t = np.asarray(times, dtype=float)
+        if len(t) < 2:
+            return
+        keep = t >= now - self.window_seconds - 0.1
+        t = t[keep]
+        midi = hz_to_midi(np.asarray(pitches_hz, dtype=np.float32)[keep])
+        xs = self._x(t - now)
+        ys = self._y(midi)
+        ok = np.isfinite(ys)
+        # one polyline per voiced run
+        edges = np.flatnonzero(np.diff(ok.astype(np.int8))) + 1
+        for run in np.split(np.arange(len(ok)), edges):
+            if len(run) >= 2 and ok[run[0]]:
+                pygame.draw.lines(self.screen, color, False,
+                                  np.column_stack([xs[run], ys[run]]).tolist(), width)
+
+    def update(self, now, user_times, user_pitches_hz, latest_pitch_hz,
+               latency_s=0.0, extra_traces=()):
+        if len(user_times) < 2 or not self.pump_events():
+            return
+        if self._level_changed():
+            self._place_lane()
+        screen = self.screen
+        screen.blit(self._static, (0, 0))
+        screen.set_clip(self.plot)
+
+        # lane + target line, only what is on screen (x=0 is `now`)
+        t_prof = PROFILER.start()
+        t_lo = now - self.window_seconds
+        i0 = int(np.searchsorted(self._seg_t1, t_lo, side="right"))
+        i1 = int(np.searchsorted(self._seg_t0, now, side="left"))
+        dy = self.dy_semitones
+        target_color = self.target_color
+        prev = None
+        for i in range(i0, i1):
+            x0 = int(self._x(max(self._seg_t0[i], t_lo) - now))
+            x1 = int(self._x(min(self._seg_t1[i], now) - now))
+            m = self._seg_midi[i]
+            y_top, y_bot = int(self._y(m + dy)), int(self._y(m - dy))
+            screen.fill(LANE_GREEN, pygame.Rect(x0, y_top, x1 - x0 + 1, y_bot - y_top))
+            y = int(self._y(m))
+            pygame.draw.line(screen, target_color, (x0, y), (x1, y), 2)
+            if prev is not None and prev[0] == x0:
+                pygame.draw.line(screen, target_color, (x0, prev[1]), (x0, y), 2)
+            prev = (x1, y)
+        PROFILER.stop("render.map", t_prof)
+
+        # user trace(s)
+        t_prof = PROFILER.start()
+        self._draw_trace(user_times, user_pitches_hz, now, self.user_colors[0], 2)
+        for color, (times, pitches) in zip(self.user_colors[1:], extra_traces):
+            self._draw_trace(times, pitches, now, color, 2)
+        PROFILER.stop("render.line", t_prof)
+
+        # score + forecast
+        t_prof = PROFILER.start()
+        self._score = self._score_text(now, latest_pitch_hz, latency_s)
+        midi_next_q, txt = self._forecast(now)
+        if midi_next_q is None:
+            self._forecast_txt = ("", GREEN)
+        elif np.isfinite(midi_next_q):
+            pygame.draw.circle(screen, GREEN, (self.plot.right - 1, int(self._y(midi_next_q))), 7)
+            self._forecast_txt = (txt, GREEN)
+        else:
+            screen.blit(self._pause_band, (self.plot.right - self._pause_band.get_width(), self.plot.top))
+            self._forecast_txt = (txt, RED)
+
+        screen.set_clip(None)
+        self._draw_texts()
+        PROFILER.stop("render.text", t_prof)
+
+        t_prof = PROFILER.start()
+        pygame.display.flip()
+        PROFILER.stop("render.draw", t_prof)
+
+    def _draw_texts(self):
+        screen = self.screen
+        left, top = self.plot.left + 8, self.plot.top + 6
+        screen.blit(self._text(self._score), (left, top))
+        if self._quality:
+            screen.blit(self._text(self._quality, self.small, (255, 140, 0)), (left, top + 22))
+        txt, color = self._forecast_txt
+        if txt:
+            surf = self._text(txt, color=color)
+            screen.blit(surf, (self.plot.right - surf.get_width() - 8, self.plot.bottom - surf.get_height() - 6))
+        y = top
+        for line in self._latency.splitlines():
+            surf = self._text(line, self.small)
+            screen.blit(surf, (self.plot.right - surf.get_width() - 8, y))
+            y += surf.get_height()
+
+    def show_message(self, text):
+        self._score = text
+        self.screen.fill(BG_BLUE, pygame.Rect(self.plot.left + 1, self.plot.top + 1, self.plot.w // 2, 24))
+        self.screen.blit(self._text(text), (self.plot.left + 8, self.plot.top + 6))
+        pygame.display.flip()
+
+    def pump_events(self):
+        if not self._open:
+            return False
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self._open = False
+                pygame.display.quit()
+                break
+            if event.type == pygame.KEYDOWN:
+                if event.key in (pygame.K_UP, pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+                    self._tempo_steps += 1
+                elif event.key in (pygame.K_DOWN, pygame.K_MINUS, pygame.K_KP_MINUS):
+                    self._tempo_steps -= 1
+        return self._open
+
+    def still_open(self):
+        return self.pump_events()
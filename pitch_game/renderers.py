@@ -0,0 +1,136 @@
+# renderers.py
+"""
+Renderer interface and backend registry.
+
+main.py only talks to a renderer through the methods of BaseRenderer, so
+display backends are interchangeable:
+
+  matplotlib   renderer.GameRenderer (default, needs matplotlib)
+  pygame       renderer_pygame.PygameRenderer (needs pygame; much lower
+               CPU per frame, for slow machines or high frame rates)
+
+Backends are imported only when chosen, so neither library is required
+unless it is used.
+"""
+import importlib
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from utils_music import cents_error
+from game_core import forecast
+
+# name -> (module, class)
+RENDERERS = {
+    "matplotlib": ("renderer", "GameRenderer"),
+    "pygame": ("renderer_pygame", "PygameRenderer"),
+}
+
+# what the startup preload thread should import for each backend
+RENDERER_MODULES = {
+    "matplotlib": ["matplotlib", "matplotlib.figure", "matplotlib.backends.backend_agg"],
+    "pygame": ["pygame"],
+}
+
+
+class BaseRenderer(ABC):
+    """
+    What the game loop needs from a display backend.
+
+        r = make_renderer(name, fmin_hz, fmax_hz, dy_semitones, n_users=1)
+        r.draw_background_map(level)                  # once, before the loop
+        while r.still_open():
+            r.update(now, user_times, user_pitches_hz, latest_pitch_hz,
+                     latency_s=..., extra_traces=...)
+            speed_steps = r.take_tempo_steps()        # Up/Down pressed since last call
+
+    The lane is built from the level's notes (game_core.Level). After a
+    tempo change (level.set_speed) the next update() sees level.version
+    move and re-places the notes; nothing per hop is rebuilt.
+
+    The methods marked abstract are required: a backend missing one
+    fails when it is created, not in the middle of a session.
+    """
+    @abstractmethod
+    def draw_background_map(self, level):
+        """Draw the lane for `level` and keep it for update()."""
+
+    @abstractmethod
+    def update(self, now, user_times, user_pitches_hz, latest_pitch_hz,
+               latency_s=0.0, extra_traces=()):
+        """Draw one frame at game time `now` (see GameRenderer.update)."""
+
+    @abstractmethod
+    def still_open(self):
+        """False once the window has been closed."""
+
+    @abstractmethod
+    def show_message(self, text):
+        """Replace the score line with `text` and repaint once."""
+
+    @abstractmethod
+    def pump_events(self):
+        """Keep the window responsive without redrawing."""
+
+    def set_latency_text(self, text):
+        pass
+
+    def set_quality_text(self, text):
+        pass
+
+    # MIDI row centres of the lane image, for a Spectrogram underlay;
+    # backends that can't show one leave this None
+    y_bins_midi = None
+
+    def attach_spectrogram(self, spectrogram):
+        pass
+
+    # ---------- tempo keys ----------
+    _tempo_steps = 0
+
+    def take_tempo_steps(self):
+        """Net tempo key presses since the last call: +1 per Up (faster), -1 per Down."""
+        steps, self._tempo_steps = self._tempo_steps, 0
+        return steps
+
+    # ---------- shared game logic (uses self.level) ----------
+    level = None
+    _level_version = -1
+
+    def _level_changed(self):
+        """True once after the level's note times changed (new level or tempo)."""
+        if self.level is None or self.level.version == self._level_version:
+            return False
+        self._level_version = self.level.version
+        return True
+
+    def _score_text(self, now, latest_pitch_hz, latency_s):
+        """Cents error of the latest pitch(es) vs the target due when they were sung."""
+        target_now_hz = self.level.target_hz(max(0.0, now - latency_s))
+        errs = [cents_error(hz, target_now_hz) for hz in np.atleast_1d(latest_pitch_hz)]
+        if len(errs) == 1:
+            err = errs[0]
+            return f"Error: {err:+.0f} cents" if np.isfinite(err) else "Error: —"
+        return "Error: " + "  ".join(
+            f"{i + 1}: {e:+.0f}" if np.isfinite(e) else f"{i + 1}: —" for i, e in enumerate(errs)
+        )
+
+    def _forecast(self, now):
+        """
+        Target LOOKAHEAD_SECONDS ahead: (midi, label), midi NaN for a pause,
+        (None, "") past the end of the level.
+        """
+        return forecast(self.level, now)
+
+
+def make_renderer(name, fmin_plot, fmax_plot, dy_semitones, **options):
+    try:
+        module, cls = RENDERERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown renderer '{name}'. Known: {', '.join(RENDERERS)}")
+    try:
+        mod = importlib.import_module(module)
+    except ImportError as e:
+        raise ImportError(f"Renderer '{name}' needs a missing package ({e.name}). "
+                          f"Install it or set RENDERER in config.py.") from e
+    return getattr(mod, cls)(fmin_plot, fmax_plot, dy_semitones, **options)
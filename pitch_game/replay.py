@@ -0,0 +1,283 @@
+# replay.py
+"""
+Replay viewer for recorded sessions (see recorder.py).
+
+The pitch track is memory-mapped, never loaded whole. On first open a
+min/max/mean decimation pyramid is built next to the recording (lod/),
+each level LOD_FACTOR times coarser than the one below. While you scroll
+and zoom only the level that fits the visible span (at most
+LOD_MAX_POINTS points) is sliced and drawn, so interaction cost does not
+depend on session length.
+
+Usage:
+  python replay.py sessions/20240101-120000
+
+Mouse wheel zooms around the cursor, the toolbar pan tool scrolls,
+arrow keys pan and +/- zoom.
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.collections import PolyCollection
+
+from recorder import open_session, PITCH_FILE, LEVEL_FILE
+from levels import load_level
+from game_core import Level
+from utils_music import hz_to_midi, midi_names
+from config import DY_SEMITONES, ALPHA_GREEN, ALPHA_BLUE, WINDOW_SECONDS
+
+LOD_FACTOR = 4
+LOD_MAX_POINTS = 2000     # points drawn for any view
+LOD_CHUNK = 1 << 18       # raw records processed at a time while building
+LOD_DIR = "lod"
+
+# one pyramid bin: start time, min/max midi, sum + count for the mean
+LOD_DTYPE = np.dtype([("t", "<f8"), ("lo", "<f4"), ("hi", "<f4"), ("sum", "<f4"), ("n", "<u4")])
+
+
+# ---------- pyramid ----------
+def _track_midi(hz):
+    """Recorded hz -> float32 midi, NaN where unvoiced."""
+    midi = hz_to_midi(np.asarray(hz, np.float32))
+    midi[~np.isfinite(midi)] = np.nan
+    return midi
+
+
+def _reduce(t, lo, hi, s, n, factor):
+    """Merge every `factor` consecutive bins (the last block may be shorter)."""
+    m = len(t)
+    pad = (-m) % factor
+    if pad:
+        t = np.concatenate([t, np.full(pad, t[-1])])
+        lo = np.concatenate([lo, np.full(pad, np.inf, np.float32)])
+        hi = np.concatenate([hi, np.full(pad, -np.inf, np.float32)])
+        s = np.concatenate([s, np.zeros(pad, np.float32)])
+        n = np.concatenate([n, np.zeros(pad, np.uint32)])
+    out = np.empty((m + pad) // factor, dtype=LOD_DTYPE)
+    out["t"] = t[::factor]
+    out["lo"] = lo.reshape(-1, factor).min(axis=1)
+    out["hi"] = hi.reshape(-1, factor).max(axis=1)
+    out["sum"] = s.reshape(-1, factor).sum(axis=1)
+    out["n"] = n.reshape(-1, factor).sum(axis=1)
+    return out
+
+
+def _level1_from_raw(pitch, factor=LOD_FACTOR, chunk=LOD_CHUNK):
+    """First pyramid level straight from the memmapped raw track, chunk by chunk."""
+    chunk -= chunk % factor
+    parts = []
+    for i in range(0, len(pitch), chunk):
+        rec = pitch[i:i + chunk]
+        midi = _track_midi(rec["hz"])
+        voiced = np.isfinite(midi)
+        parts.append(_reduce(
+            np.asarray(rec["t"]),
+            np.where(voiced, midi, np.inf).astype(np.float32),
+            np.where(voiced, midi, -np.inf).astype(np.float32),
+            np.where(voiced, midi, 0.0).astype(np.float32),
+            voiced.astype(np.uint32),
+            factor,
+        ))
+    return np.concatenate(parts) if parts else np.zeros(0, LOD_DTYPE)
+
+
+def _source_stamp(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime": st.st_mtime}
+
+
+def load_pyramid(session_path, pitch):
+    """
+    Returns [level1, level2, ...] as read-only memmaps, building and caching
+    them under <session>/lod/ when missing or stale.
+    """
+    lod_dir = os.path.join(session_path, LOD_DIR)
+    stamp_path = os.path.join(lod_dir, "source.json")
+    stamp = _source_stamp(os.path.join(session_path, PITCH_FILE))
+
+    cached = None
+    if os.path.exists(stamp_path):
+        with open(stamp_path) as f:
+            info = json.load(f)
+        if info.get("source") == stamp and info.get("factor") == LOD_FACTOR:
+            cached = info["levels"]
+
+    if cached is None:
+        os.makedirs(lod_dir, exist_ok=True)
+        levels = []
+        lvl = _level1_from_raw(pitch)
+        while len(lvl):
+            levels.append(lvl)
+            if len(lvl) <= LOD_MAX_POINTS:
+                break
+            lvl = _reduce(lvl["t"], lvl["lo"], lvl["hi"], lvl["sum"], lvl["n"], LOD_FACTOR)
+        for k, lvl in enumerate(levels, start=1):
+            np.save(os.path.join(lod_dir, f"L{k}.npy"), lvl)
+        with open(stamp_path, "w") as f:
+            json.dump({"source": stamp, "factor": LOD_FACTOR, "levels": len(levels)}, f)
+        cached = len(levels)
+
+    return [np.load(os.path.join(lod_dir, f"L{k}.npy"), mmap_mode="r") for k in range(1, cached + 1)]
+
+
+# ---------- viewer ----------
+class ReplayViewer:
+    def __init__(self, session_path):
+        self.path = session_path
+        sess = open_session(session_path)
+        self.meta = sess["meta"]
+        self.pitch = sess["pitch"]
+        self.pyramid = load_pyramid(session_path, self.pitch)
+
+        self.notes = []
+        level_path = os.path.join(session_path, LEVEL_FILE)
+        if os.path.exists(level_path):
+            events, bpm, meta = load_level(level_path)
+            level = Level(events, bpm, tempo=meta.get("tempo"))
+            for i, (_, midi) in enumerate(level.events):
+                if midi is not None:
+                    self.notes.append((level.t0[i], level.t1[i] - level.t0[i], midi))
+
+        self.t_end = float(self.pitch["t"][-1]) if len(self.pitch) else 1.0
+        self._envelope = None
+        self._setup_axes()
+
+    def _y_range(self):
+        if "fmin_hz" in self.meta and "fmax_hz" in self.meta:
+            lo = float(hz_to_midi(self.meta["fmin_hz"]))
+            hi = float(hz_to_midi(self.meta["fmax_hz"]))
+        elif self.notes:
+            lo = min(m for _, _, m in self.notes) - 2.0
+            hi = max(m for _, _, m in self.notes) + 2.0
+        else:
+            lo, hi = 48.0, 72.0
+        if self.notes:
+            pad = max(2.0 * DY_SEMITONES, 1.0)
+            lo = min(lo, min(m for _, _, m in self.notes) - pad)
+            hi = max(hi, max(m for _, _, m in self.notes) + pad)
+        return lo, hi
+
+    def _setup_axes(self):
+        self.fig, self.ax = plt.subplots(figsize=(12, 6))
+        self.ax.set_facecolor((0.0, 0.0, 1.0, ALPHA_BLUE))
+        self.ax.set_title(f"Replay — {os.path.basename(os.path.normpath(self.path))}")
+        self.ax.set_xlabel("Time (s)")
+        self.ax.set_ylabel("Pitch (notes)")
+
+        lo, hi = self._y_range()
+        self.ax.set_ylim(lo, hi)
+        ticks = list(range(int(np.floor(lo)), int(np.ceil(hi)) + 1))
+        self.ax.set_yticks(ticks)
+        self.ax.set_yticklabels(midi_names(ticks).tolist())
+        self.ax.grid(True, which="major", axis="both", alpha=0.25, zorder=1)
+
+        # target lane: one rectangle per note, built once
+        dy = DY_SEMITONES
+        verts = [
+            [(t, m - dy), (t + d, m - dy), (t + d, m + dy), (t, m + dy)]
+            for t, d, m in self.notes
+        ]
+        self.ax.add_collection(PolyCollection(
+            verts, facecolors=(0.0, 1.0, 0.0, ALPHA_GREEN), edgecolors="none", zorder=0
+        ))
+        (self.line_target,) = self.ax.plot(
+            [t for t, _, _ in self.notes] + ([self.notes[-1][0] + self.notes[-1][1]] if self.notes else []),
+            [m for _, _, m in self.notes] + ([self.notes[-1][2]] if self.notes else []),
+            lw=2, alpha=0.9, drawstyle="steps-post", zorder=2, label="Target",
+        )
+
+        (self.line_user,) = self.ax.plot([], [], lw=1.5, zorder=3, label="You")
+        self.lod_text = self.ax.text(0.99, 0.98, "", transform=self.ax.transAxes,
+                                     ha="right", va="top", fontsize=8, alpha=0.7)
+        self.ax.legend(loc="lower left")
+
+        self.ax.set_xlim(0.0, min(self.t_end, max(WINDOW_SECONDS * 4, 1.0)))
+        self.ax.callbacks.connect("xlim_changed", lambda ax: self._refresh())
+        self.fig.canvas.mpl_connect("scroll_event", self._on_scroll)
+        self.fig.canvas.mpl_connect("key_press_event", self._on_key)
+        self._refresh()
+
+    # ---------- level of detail ----------
+    def _pick_level(self, x0, x1):
+        """0 = raw track, k >= 1 = pyramid level k."""
+        i0, i1 = np.searchsorted(self.pitch["t"], [x0, x1])
+        count = i1 - i0
+        k = 0
+        while count > LOD_MAX_POINTS and k < len(self.pyramid):
+            k += 1
+            count //= LOD_FACTOR
+        return k
+
+    def _refresh(self):
+        x0, x1 = self.ax.get_xlim()
+        k = self._pick_level(x0, x1)
+
+        if self._envelope is not None:
+            self._envelope.remove()
+            self._envelope = None
+
+        if k == 0:
+            i0, i1 = np.searchsorted(self.pitch["t"], [x0, x1])
+            i0, i1 = max(0, i0 - 1), min(len(self.pitch), i1 + 1)
+            rec = self.pitch[i0:i1]
+            self.line_user.set_data(rec["t"], _track_midi(rec["hz"]))
+            self.lod_text.set_text(f"raw · {i1 - i0} pts")
+        else:
+            lvl = self.pyramid[k - 1]
+            i0, i1 = np.searchsorted(lvl["t"], [x0, x1])
+            i0, i1 = max(0, i0 - 1), min(len(lvl), i1 + 1)
+            b = np.asarray(lvl[i0:i1])
+            voiced = b["n"] > 0
+            mean = np.where(voiced, b["sum"] / np.maximum(b["n"], 1), np.nan)
+            lo = np.where(voiced, b["lo"], np.nan)
+            hi = np.where(voiced, b["hi"], np.nan)
+            self.line_user.set_data(b["t"], mean)
+            self._envelope = self.ax.fill_between(
+                b["t"], lo, hi, where=voiced, step="post",
+                color=self.line_user.get_color(), alpha=0.3, lw=0, zorder=3,
+            )
+            self.lod_text.set_text(f"LOD {k} (×{LOD_FACTOR ** k}) · {i1 - i0} pts")
+
+        self.fig.canvas.draw_idle()
+
+    # ---------- interaction ----------
+    def _zoom(self, factor, x_center=None):
+        x0, x1 = self.ax.get_xlim()
+        if x_center is None:
+            x_center = 0.5 * (x0 + x1)
+        self.ax.set_xlim(x_center - (x_center - x0) * factor, x_center + (x1 - x_center) * factor)
+
+    def _on_scroll(self, event):
+        if event.inaxes is self.ax:
+            self._zoom(0.8 if event.button == "up" else 1.25, event.xdata)
+
+    def _on_key(self, event):
+        x0, x1 = self.ax.get_xlim()
+        step = 0.25 * (x1 - x0)
+        if event.key == "right":
+            self.ax.set_xlim(x0 + step, x1 + step)
+        elif event.key == "left":
+            self.ax.set_xlim(x0 - step, x1 - step)
+        elif event.key in ("+", "="):
+            self._zoom(0.8)
+        elif event.key == "-":
+            self._zoom(1.25)
+        elif event.key == "home":
+            self.ax.set_xlim(0.0, self.t_end)
+
+    def show(self):
+        plt.show()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrub and zoom through a recorded session")
+    parser.add_argument("session", help="session directory written by the recorder")
+    args = parser.parse_args()
+    ReplayViewer(args.session).show()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# results_ring.py
+"""
+Pitch results as one structured NumPy ring, written by the pitch worker.
+
+    ring = ResultRing(n_channels=1)
+    ring.publish(t_adc, t_enq, t_det, hz, conf, flags)     # worker only
+    recs, pos, lost = ring.since(pos)                        # new records, a view
+    recs["t_adc"], recs["hz"], recs["flags"]
+    ring.latest()                                            # consistent copy of the newest
+
+    cursor = ring.subscribe()                                # one per consumer
+    recs, lost = cursor.read()                               # its own position
+
+Every record is stored twice, at slot i and i + capacity, so any run of
+up to `capacity` records is one contiguous slice and readers never copy.
+`written` counts records ever published and is only advanced after a
+record is complete, so it doubles as the sequence number that makes
+latest() a consistent snapshot without a lock: the copy is good if the
+writer did not come back round to that slot while it was being taken.
+
+The slot the writer fills next is the oldest one, so readers only see
+the newest capacity - 1 records; anything older counts as lost.
+
+Readers never register with the writer: a Cursor is just a position,
+so publishing costs the same for one consumer or ten. The only shared
+step is waking readers blocked in wait().
+"""
+import threading
+
+import numpy as np
+
+from config import RESULT_RING_SIZE
+
+# flags bits
+FLAG_VOICED = 1        # hz is a pitch (any channel, for multi-channel rings)
+FLAG_REDUCED = 2       # analysed at a reduced quality level (see governor.py)
+FLAG_AFTER_DROP = 4    # input hops were dropped just before this result
+
+
+def result_dtype(n_channels=1):
+    """t_adc, t_enq, t_det (clock.now() seconds), hz, conf, flags; hz/conf per channel if n_channels > 1."""
+    ch = () if n_channels == 1 else (n_channels,)
+    return np.dtype([
+        ("t_adc", "<f8"), ("t_enq", "<f8"), ("t_det", "<f8"),
+        ("hz", "<f4", ch), ("conf", "<f4", ch),
+        ("flags", "<u4"),
+    ])
+
+
+class ResultRing:
+    def __init__(self, capacity=RESULT_RING_SIZE, n_channels=1):
+        self.capacity = capacity
+        self.n_channels = n_channels
+        self.dtype = result_dtype(n_channels)
+        self._buf = np.zeros(2 * capacity, dtype=self.dtype)
+        self.written = 0
+        self._cond = threading.Condition()
+
+    # ---------- writer (pitch worker) ----------
+    def publish(self, t_adc, t_enq, t_det, hz, conf, flags=0):
+        i = self.written % self.capacity
+        rec = (t_adc, t_enq, t_det, hz, conf, flags)
+        self._buf[i] = rec
+        self._buf[i + self.capacity] = rec
+        self.written += 1
+        with self._cond:
+            self._cond.notify_all()
+
+    # ---------- readers ----------
+    def _slice(self, a, b):
+        i = a % self.capacity
+        return self._buf[i:i + (b - a)]
+
+    def oldest(self, written=None):
+        """Position of the oldest record still intact."""
+        n = self.written if written is None else written
+        return max(0, n - self.capacity + 1)
+
+    def since(self, pos):
+        """
+        Records from position `pos` up to now: (view, new pos, lost), where
+        lost counts records that were overwritten before they were read.
+        """
+        n = self.written
+        start = max(pos, self.oldest(n))
+        return self._slice(start, n), n, start - pos
+
+    def last(self, k):
+        """View of the newest k records (fewer if there aren't that many)."""
+        n = self.written
+        return self._slice(max(self.oldest(n), n - k), n)
+
+    def wait_beyond(self, pos, timeout):
+        """Block until a record past position `pos` is published; False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.written > pos, timeout)
+
+    def subscribe(self, from_oldest=False):
+        """A Cursor starting at the next record (or at the oldest one still in the ring)."""
+        return Cursor(self, self.oldest() if from_oldest else self.written)
+
+    def latest(self):
+        """Copy of the newest record (a NumPy structured scalar), None before the first."""
+        while True:
+            n = self.written
+            if n == 0:
+                return None
+            rec = self._buf[(n - 1) % self.capacity].copy()
+            if self.written - n < self.capacity - 1:
+                return rec
+
+
+class Cursor:
+    """
+    One consumer's read position in a ResultRing.
+
+        recs, lost = cursor.read()     # view of everything since the last read
+        ...                            # slow work on recs
+        if not cursor.intact(): ...    # the writer lapped us meanwhile
+
+    lost > 0 means the reader fell more than a ring behind and that many
+    records were overwritten before it got to them (total in .lost).
+    """
+    def __init__(self, ring, pos):
+        self.ring = ring
+        self.pos = pos
+        self.lost = 0
+        self._view_start = pos
+
+    @property
+    def pending(self):
+        """Records published but not read yet."""
+        return self.ring.written - self.pos
+
+    def read(self):
+        recs, end, lost = self.ring.since(self.pos)
+        self._view_start = end - len(recs)
+        self.pos = end
+        self.lost += lost
+        return recs, lost
+
+    def intact(self):
+        """False if the view returned by the last read() may have been overwritten since."""
+        return self._view_start >= self.ring.oldest()
+
+    def wait(self, timeout):
+        """Block until there is something to read; False on timeout."""
+        return self.ring.wait_beyond(self.pos, timeout)
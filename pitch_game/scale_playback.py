@@ -5,6 +5,8 @@ import math
 from utils_music import midi_to_hz
 from melody_generator import MODES  # reuse the same modes dict
 
+_playing = None   # done Event of a warm-up on a duplex PitchStream
+
 def _sine_note(freq, dur_s, sr=44100, fade_ms=15):
     """Generate a sine tone with a short fade in/out."""
     n = int(dur_s * sr)
@@ -28,12 +30,18 @@ def play_scale_warmup(
     note_beats=0.6,
     pause_beats=0.15,
     repeats=1,
+    blocking=True,
+    pitch_stream=None,
 ):
     """
     Warm-up pattern:
       tonic -> 2nd -> 3rd -> 4th -> 5th -> 4th -> 3rd -> 2nd -> tonic
     i.e., go up to the 5th and back down in the chosen mode.
     Notes are clamped into [midi_min, midi_max] by octave wrapping if needed.
+    With blocking=False playback starts and this returns at once
+    (wait_for_playback() waits for the end).
+    With a duplex pitch_stream it plays on that stream, so an echo
+    canceller there hears it as its own output (and learns the room).
     """
     mode_offsets = MODES[mode_name]
 
@@ -76,5 +84,18 @@ def play_scale_warmup(
                 audio.append(np.zeros(int(pause_dur * sr), dtype=np.float32))
 
     audio = np.concatenate(audio) if len(audio) else np.zeros(1, dtype=np.float32)
-    sd.play(audio, sr)
-    sd.wait()
+    global _playing
+    if pitch_stream is not None and getattr(pitch_stream, "duplex", False):
+        _playing = pitch_stream.play(audio)
+    else:
+        _playing = None
+        sd.play(audio, sr)
+    if blocking:
+        wait_for_playback()
+
+
+def wait_for_playback():
+    if _playing is not None:
+        _playing.wait()
+    else:
+        sd.wait()
@@ -0,0 +1,61 @@
+# scheduler.py
+import clock
+from config import FRAME_MAX_FPS, FRAME_MIN_FPS, FRAME_QUIET_FPS, FRAME_CPU_BUDGET
+
+# how quickly the draw-cost estimate follows new measurements
+COST_EMA_ALPHA = 0.2
+
+
+class FrameScheduler:
+    """
+    Decides when the main loop should draw next.
+
+    - `dirty` frames (new voiced pitch, or voicing just changed) are drawn at
+      the active interval, which adapts to the measured draw cost so drawing
+      stays within FRAME_CPU_BUDGET of the main thread:
+          interval = clamp(cost / budget, 1/FRAME_MAX_FPS, 1/FRAME_MIN_FPS)
+    - otherwise only the lane scrolls, which looks fine at FRAME_QUIET_FPS
+    - the loop sleeps on detector output until the next deadline instead of
+      spinning at a fixed rate
+    """
+    def __init__(self, max_fps=FRAME_MAX_FPS, min_fps=FRAME_MIN_FPS,
+                 quiet_fps=FRAME_QUIET_FPS, cpu_budget=FRAME_CPU_BUDGET):
+        self.min_interval = 1.0 / max_fps
+        self.max_interval = 1.0 / min_fps
+        self.quiet_interval = 1.0 / quiet_fps
+        self.cpu_budget = cpu_budget
+
+        self.draw_cost = 0.0
+        self.interval = self.min_interval
+        self.dirty = True
+        self._last_frame = float("-inf")
+
+    def mark_dirty(self):
+        self.dirty = True
+
+    def _deadline(self):
+        iv = self.interval if self.dirty else max(self.interval, self.quiet_interval)
+        return self._last_frame + iv
+
+    def time_to_next_frame(self):
+        return max(0.0, self._deadline() - clock.now())
+
+    def frame_due(self):
+        return clock.now() >= self._deadline()
+
+    def frame_done(self, t_start, t_end):
+        """Record a drawn frame that started at t_start and finished at t_end."""
+        cost = t_end - t_start
+        if self.draw_cost == 0.0:
+            self.draw_cost = cost
+        else:
+            self.draw_cost += COST_EMA_ALPHA * (cost - self.draw_cost)
+
+        want = self.draw_cost / self.cpu_budget
+        self.interval = min(self.max_interval, max(self.min_interval, want))
+        self.dirty = False
+        self._last_frame = t_start
+
+    @property
+    def fps(self):
+        return 1.0 / self.interval
@@ -0,0 +1,133 @@
+# scoring.py
+import numpy as np
+
+from utils_music import cents_error, midi_to_hz
+from tempo import TempoMap
+from config import DY_SEMITONES, SR, HOP_SIZE
+
+# a user sample older than this no longer counts for a target frame
+MAX_SAMPLE_GAP_S = 3 * HOP_SIZE / SR
+
+
+def user_at_target_times(t_user, hz_user, t_target, max_gap=MAX_SAMPLE_GAP_S):
+    """
+    Sample a user pitch track (sorted times) at the target hop times:
+    the most recent user sample, NaN if there is none within max_gap.
+    """
+    t_user = np.asarray(t_user, float)
+    hz_user = np.asarray(hz_user, float)
+    t_target = np.asarray(t_target, float)
+    if len(t_user) == 0:
+        return np.full(len(t_target), np.nan)
+
+    idx = np.searchsorted(t_user, t_target, side="right") - 1
+    ok = idx >= 0
+    idx_c = np.clip(idx, 0, len(t_user) - 1)
+    ok &= (t_target - t_user[idx_c]) <= max_gap
+    return np.where(ok, hz_user[idx_c], np.nan)
+
+
+def score_counts(t_user, hz_user, t_target, hz_target, dy_semitones=DY_SEMITONES):
+    """
+    The sums behind score_track, so scores of consecutive stretches of a
+    level can be added up (see game_core.LiveScore):
+      frames, both (frames voiced on both sides), in_lane, abs_cents (sum)
+    """
+    hz_target = np.asarray(hz_target, float)
+    hz_sung = user_at_target_times(t_user, hz_user, t_target)
+
+    cents = cents_error(hz_sung, hz_target)       # NaN unless both voiced
+    both = np.isfinite(cents)
+    abs_cents = np.abs(cents[both])
+    return {
+        "frames": int(np.isfinite(hz_target).sum()),
+        "both": int(both.sum()),
+        "in_lane": int((abs_cents <= dy_semitones * 100).sum()),
+        "abs_cents": float(abs_cents.sum()),
+    }
+
+
+def scores_from_counts(c):
+    n = c["frames"]
+    return {
+        "accuracy": float(c["in_lane"] / n) if n else float("nan"),
+        "coverage": float(c["both"] / n) if n else float("nan"),
+        "mean_abs_cents": float(c["abs_cents"] / c["both"]) if c["both"] else float("nan"),
+        "frames": n,
+    }
+
+
+def score_track(t_user, hz_user, t_target, hz_target, dy_semitones=DY_SEMITONES):
+    """
+    Score a pitch track against a hop-grid target (see events_to_target_trace).
+
+    Returns a dict:
+      accuracy        fraction of voiced target frames sung inside the lane
+      coverage        fraction of voiced target frames where you were voiced at all
+      mean_abs_cents  mean |error| over frames where both are voiced
+      frames          number of voiced target frames
+    """
+    return scores_from_counts(score_counts(t_user, hz_user, t_target, hz_target, dy_semitones))
+
+
+def score_tracks(tracks, t_target, hz_target, dy_semitones=DY_SEMITONES):
+    """
+    Score several singers against the same target in one vectorized pass.
+    tracks: list of (t_user, hz_user). Returns one score_track dict per track.
+    """
+    hz_target = np.asarray(hz_target, float)
+    if not tracks:
+        return []
+    hz_sung = np.stack([user_at_target_times(t, hz, t_target) for t, hz in tracks])
+
+    target_voiced = np.isfinite(hz_target)
+    cents = cents_error(hz_sung, hz_target)       # NaN unless both voiced
+    both = np.isfinite(cents)
+    in_lane = both & (np.abs(np.nan_to_num(cents, nan=np.inf)) <= dy_semitones * 100)
+
+    n = int(target_voiced.sum())
+    n_both = both.sum(axis=1)
+    abs_sum = np.where(both, np.abs(np.nan_to_num(cents)), 0.0).sum(axis=1)
+    return [
+        {
+            "accuracy": float(in_lane[i].sum() / n) if n else float("nan"),
+            "coverage": float(n_both[i] / n) if n else float("nan"),
+            "mean_abs_cents": float(abs_sum[i] / n_both[i]) if n_both[i] else float("nan"),
+            "frames": n,
+        }
+        for i in range(len(tracks))
+    ]
+
+
+def score_notes(events, bpm, t_user, hz_user, hop_size=HOP_SIZE, sr=SR,
+                dy_semitones=DY_SEMITONES):
+    """
+    Per-note breakdown of a level. Returns a list of dicts, one per voiced
+    note: idx, midi, onset_s, dur_s, interval (semitones from the previous
+    voiced note, None for the first) plus score_track's fields. bpm may
+    be a tempo.TempoMap.
+    """
+    tempo = bpm if isinstance(bpm, TempoMap) else TempoMap.constant(bpm)
+    ends = tempo.seconds(np.cumsum([d for d, _ in events], dtype=float))
+    dt = hop_size / sr
+    out = []
+    t = 0.0
+    prev_midi = None
+    for idx, (_, midi) in enumerate(events):
+        dur_s = float(ends[idx]) - t
+        if midi is not None:
+            n = max(1, int(np.round(dur_s / dt)))
+            t_note = t + np.arange(n) * dt
+            hz_note = np.full(n, float(midi_to_hz(midi)))
+            row = {
+                "idx": idx,
+                "midi": int(midi),
+                "onset_s": t,
+                "dur_s": dur_s,
+                "interval": None if prev_midi is None else int(midi - prev_midi),
+            }
+            row.update(score_track(t_user, hz_user, t_note, hz_note, dy_semitones))
+            out.append(row)
+            prev_midi = midi
+        t += dur_s
+    return out
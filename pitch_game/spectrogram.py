@@ -0,0 +1,100 @@
+# spectrogram.py
+"""
+Live log-frequency spectrogram, computed in the pitch worker.
+
+    spec = Spectrogram(renderer.y_bins_midi)      # rows = the renderer's MIDI bins
+    pitch_stream.spectrogram = spec                # worker: spec.push(window, t_adc)
+    renderer.attach_spectrogram(spec)              # renderer: spec.halves()
+
+Each hop the worker windows the analysis buffer it already keeps, takes
+one rfft and maps the magnitudes onto the MIDI rows with a precomputed
+weight matrix. The column goes into a fixed-size ring image, so nothing
+is ever reallocated; the renderer shows the ring as two image halves
+(oldest..end, start..newest) and only their extents move as it scrolls.
+"""
+import threading
+
+import numpy as np
+
+from utils_music import midi_to_hz
+from config import SR, HOP_SIZE, WIN_SIZE, WINDOW_SECONDS, SPECTROGRAM_DB_RANGE
+
+
+def _midi_weights(midi_bins, win_size, sr):
+    """
+    (rows, fft bins) matrix: each row a triangle around its pitch, as wide
+    as the larger of its MIDI step and the FFT bin spacing, normalized.
+    Returns (matrix restricted to the useful bins, first bin, last bin).
+    """
+    f_rows = midi_to_hz(midi_bins)
+    step = np.median(np.diff(midi_bins)) if len(midi_bins) > 1 else 0.1
+    df = sr / win_size
+    half_width = np.maximum(f_rows * (2 ** (step / 12) - 1), df)
+
+    k_lo = max(0, int(np.floor((f_rows[0] - half_width[0]) / df)))
+    k_hi = min(win_size // 2, int(np.ceil((f_rows[-1] + half_width[-1]) / df)) + 1)
+    f_bins = np.arange(k_lo, k_hi) * df
+
+    w = np.maximum(0.0, 1.0 - np.abs(f_bins[None, :] - f_rows[:, None]) / half_width[:, None])
+    w /= np.maximum(w.sum(axis=1, keepdims=True), 1e-12)
+    return w.astype(np.float32), k_lo, k_hi
+
+
+class Spectrogram:
+    def __init__(self, midi_bins, win_size=WIN_SIZE, sr=SR, hop_size=HOP_SIZE,
+                 seconds=WINDOW_SECONDS + 1.0, db_range=SPECTROGRAM_DB_RANGE):
+        self.midi_bins = np.asarray(midi_bins, dtype=float)
+        self.win_size = win_size
+        self.dt = hop_size / sr
+        self.t0 = 0.0          # clock time of game t = 0, set by main
+
+        self._window = np.hanning(win_size).astype(np.float32)
+        self._weights, self._k_lo, self._k_hi = _midi_weights(self.midi_bins, win_size, sr)
+        # full-scale sine -> 0 dB
+        self._ref = float(self._window.sum() / 2)
+        self._db_lo, self._db_hi = db_range
+
+        self.n_cols = int(np.ceil(seconds / self.dt))
+        self.image = np.zeros((len(self.midi_bins), self.n_cols), dtype=np.float32)
+        self.times = np.full(self.n_cols, np.nan)
+        self._w = 0            # next column to write
+        self.pushed = 0
+        self._lock = threading.Lock()
+
+    # ---------- worker side ----------
+    def column(self, window):
+        """0..1 magnitude per MIDI row for one analysis window."""
+        mag = np.abs(np.fft.rfft(window * self._window))[self._k_lo:self._k_hi]
+        rows = self._weights @ mag.astype(np.float32)
+        db = 20.0 * np.log10(np.maximum(rows, 1e-9) / self._ref)
+        return np.clip((db - self._db_lo) / (self._db_hi - self._db_lo), 0.0, 1.0)
+
+    def push(self, window, t, skip=False):
+        """
+        Add the column for `window` at clock time `t`. With skip=True (CPU
+        overload) an empty column keeps the time axis intact.
+        """
+        w = self._w
+        if skip:
+            self.image[:, w] = 0.0
+        else:
+            self.image[:, w] = self.column(window)
+        with self._lock:
+            self.times[w] = t
+            self._w = (w + 1) % self.n_cols
+            self.pushed += 1
+
+    # ---------- renderer side ----------
+    def halves(self):
+        """
+        [(image view, t_first, t_last), ...] oldest first, times relative to
+        t0; views into the ring, no copies. Empty halves are left out.
+        """
+        with self._lock:
+            w = self._w
+            times = self.times.copy()
+        out = []
+        for a, b in ((w, self.n_cols), (0, w)):
+            if b > a and np.isfinite(times[a]) and np.isfinite(times[b - 1]):
+                out.append((self.image[:, a:b], times[a] - self.t0, times[b - 1] - self.t0 + self.dt))
+        return out
@@ -0,0 +1,82 @@
+# startup.py
+"""
+Startup helpers.
+
+  preload(...)    import heavy modules on a background thread while the
+                  main thread gets the audio stream and the first prompt up
+  StartupTimer    time-to-first-prompt / time-to-first-frame report; time
+                  spent waiting on the player (Enter presses, warm-up audio)
+                  is tracked separately so the report shows our own cost
+"""
+import importlib
+import threading
+
+import clock
+
+
+def _warm_matplotlib():
+    # render one tiny off-screen figure: loads the Agg backend, fonts and
+    # text layout caches so the real figure's first draw is quick
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure(figsize=(2, 2))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.plot([0, 1], [0, 1], label="x")
+    ax.set_yticks([0, 1])
+    ax.set_yticklabels(["C4", "C#4"])
+    ax.text(0.5, 0.5, "Error: —")
+    ax.legend()
+    fig.canvas.draw()
+
+
+def preload(modules, warm_matplotlib=True):
+    """
+    Import `modules` on a daemon thread and return it (join() before relying
+    on them is optional: a later import just waits for the module lock).
+    pyplot is left to the main thread, GUI backends want to start there.
+    """
+    def run():
+        for name in modules:
+            try:
+                importlib.import_module(name)
+            except Exception:
+                pass   # the main thread's own import will report it
+        if warm_matplotlib:
+            try:
+                _warm_matplotlib()
+            except Exception:
+                pass
+
+    t = threading.Thread(target=run, name="preload", daemon=True)
+    t.start()
+    return t
+
+
+class StartupTimer:
+    def __init__(self, t0=None):
+        self.t0 = clock.now() if t0 is None else t0
+        self.marks = []           # (name, seconds since t0, our own seconds)
+        self._waited = 0.0
+
+    def mark(self, name):
+        t = clock.now() - self.t0
+        self.marks.append((name, t, t - self._waited))
+
+    def waiting(self):
+        """Context manager for time spent on the player, not on startup work."""
+        timer = self
+
+        class _Wait:
+            def __enter__(_self):
+                _self.t = clock.now()
+            def __exit__(_self, *exc):
+                timer._waited += clock.now() - _self.t
+
+        return _Wait()
+
+    def report(self):
+        lines = ["Startup:"]
+        for name, t, own in self.marks:
+            lines.append(f"  {name:<14} {t:6.2f}s  ({own:.2f}s excluding prompts/warm-up)")
+        return "\n".join(lines)
@@ -0,0 +1,330 @@
+# style_trainer.py
+"""
+Learn a melody style from a folder of MIDI files, offline.
+
+Each Standard MIDI File gives one melody line (the highest busy non-drum
+track/channel, highest note wins where notes overlap). Its key is
+estimated among melody_generator.MODES, and the line becomes two token
+streams keyed by mode degree:
+
+  steps    scale-degree step to the next note (-7..7, clipped), given the
+           current degree and the previous step
+  rhythm   next note or rest length (melody_generator.STYLE_DURS, in
+           beats), given the previous one and where in the 4/4 bar it starts
+
+Unseen contexts back off to the counts summed over contexts, then
+counts are smoothed and stored as float32 CDF tables, one .npy per table
+under STYLES_DIR/<style>/ plus style.json. The game memory-maps them
+(melody_generator.load_style), so picking a style costs no training and
+almost no startup time.
+
+Usage:
+  python style_trainer.py midi/folk/ --style folk
+  python style_trainer.py midi/chorales/ midi/hymns/ --style hymn --smoothing 0.05
+"""
+import argparse
+import json
+import os
+import struct
+
+import numpy as np
+
+from utils_music import quantize_to_scale
+from melody_generator import (
+    MODES, STYLE_DURS, STYLE_MAX_STEP, STYLE_BAR_SLOTS, STYLE_VERSION, style_table_shapes,
+)
+from config import STYLES_DIR
+
+MIDI_EXTS = (".mid", ".midi", ".smf")
+DRUM_CHANNEL = 9
+PHRASE_REST_BEATS = 1.0   # a rest at least this long starts a new phrase (step and rhythm context reset)
+MIN_REST_BEATS = 0.25     # shorter gaps are legato, added to the note before
+
+
+# ---------- Standard MIDI File ----------
+def _varlen(data, i):
+    value = 0
+    while True:
+        b = data[i]
+        i += 1
+        value = (value << 7) | (b & 0x7F)
+        if not b & 0x80:
+            return value, i
+
+
+def read_smf(path):
+    """
+    Minimal SMF reader (format 0/1, metrical time): (ticks per beat,
+    {(track, channel): [(start_tick, end_tick, midi), ...]}). Only note
+    on/off matter; every other event is skipped.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != b"MThd":
+        raise ValueError("not a Standard MIDI File")
+    hlen, _fmt, ntrks, division = struct.unpack(">IHHH", data[4:14])
+    if division & 0x8000:
+        raise ValueError("SMPTE time division not supported")
+
+    notes = {}
+    i = 8 + hlen
+    for track in range(ntrks):
+        if data[i:i + 4] != b"MTrk":
+            raise ValueError(f"bad track header in track {track}")
+        (tlen,) = struct.unpack(">I", data[i + 4:i + 8])
+        i += 8
+        end = i + tlen
+        tick = 0
+        status = 0
+        sounding = {}     # (channel, midi) -> start tick
+        while i < end:
+            delta, i = _varlen(data, i)
+            tick += delta
+            if data[i] & 0x80:
+                status = data[i]
+                i += 1
+            if status == 0xFF:                        # meta
+                kind = data[i]
+                length, i = _varlen(data, i + 1)
+                i += length
+                if kind == 0x2F:                      # end of track
+                    break
+                continue
+            if status in (0xF0, 0xF7):                # sysex
+                length, i = _varlen(data, i)
+                i += length
+                continue
+            kind, ch = status & 0xF0, status & 0x0F
+            if kind in (0xC0, 0xD0):                  # one data byte
+                i += 1
+                continue
+            a, b = data[i], data[i + 1]
+            i += 2
+            if kind == 0x90 and b > 0:
+                sounding.setdefault((ch, a), tick)
+            elif kind == 0x80 or kind == 0x90:
+                start = sounding.pop((ch, a), None)
+                if start is not None and tick > start:
+                    notes.setdefault((track, ch), []).append((start, tick, a))
+        i = end
+    return division, notes
+
+
+def melody_line(notes):
+    """Monophonic line from a note list: highest note per onset, cut at the next onset."""
+    by_start = {}
+    for start, stop, midi in notes:
+        if midi > by_start.get(start, (0, -1))[1]:
+            by_start[start] = (stop, midi)
+    starts = sorted(by_start)
+    line = []
+    for k, start in enumerate(starts):
+        stop, midi = by_start[start]
+        if k + 1 < len(starts):
+            stop = min(stop, starts[k + 1])
+        line.append((start, stop, midi))
+    return line
+
+
+def pick_melody(notes_by_part):
+    """
+    The melody candidate: among non-drum parts with at least a quarter of
+    the busiest one's onsets, the highest on average (accompaniment tends
+    to sit lower, and bass is rarely the tune).
+    """
+    lines = {key: melody_line(v) for key, v in notes_by_part.items() if key[1] != DRUM_CHANNEL}
+    if not lines:
+        return []
+    busiest = max(len(line) for line in lines.values())
+    busy = [line for line in lines.values() if 4 * len(line) >= busiest]
+    return max(busy, key=lambda line: sum(m for _, _, m in line) / len(line))
+
+
+# ---------- key and tokens ----------
+def estimate_key(line):
+    """
+    (tonic pitch class, mode name) among MODES: most duration inside the
+    mode, then most time on the tonic, then ending on it.
+    """
+    pc_dur = np.zeros(12)
+    for start, stop, midi in line:
+        pc_dur[midi % 12] += stop - start
+    total = pc_dur.sum() or 1.0
+    last_pc = line[-1][2] % 12
+    best, best_score = (0, "ionian"), -np.inf
+    for tonic in range(12):
+        for name, offsets in MODES.items():
+            inside = pc_dur[[(tonic + o) % 12 for o in offsets]].sum() / total
+            score = inside + 0.1 * pc_dur[tonic] / total + 0.05 * (last_pc == tonic)
+            if score > best_score:
+                best, best_score = (tonic, name), score
+    return best
+
+
+def diatonic_index(midi, tonic_pc, offsets):
+    """
+    Steps above the tonic in the mode (octaves * 7 + degree), for one note
+    or an array; out-of-mode notes snap to the nearest degree, ties down.
+    """
+    snapped = quantize_to_scale(midi, tonic_pc, offsets).astype(int)
+    octave, pc = np.divmod(snapped - tonic_pc, 12)
+    degree_of = np.zeros(12, dtype=int)
+    degree_of[list(offsets)] = np.arange(len(offsets))
+    return octave * 7 + degree_of[pc]
+
+
+def _dur_token(beats):
+    return int(np.argmin([abs(beats - d) for d in STYLE_DURS]))
+
+
+def _slot(pos_beats):
+    return int(round(pos_beats * STYLE_BAR_SLOTS / 4.0)) % STYLE_BAR_SLOTS
+
+
+def count_line(line, division, steps, rhythm):
+    """Add one melody's step and rhythm transitions to the count tables; returns the key."""
+    tonic_pc, mode = estimate_key(line)
+    offsets = MODES[mode]
+    n_durs = len(STYLE_DURS)
+    start_step = steps.shape[1] - 1
+    start_tok = rhythm.shape[1] - 1
+
+    prev_tok = start_tok
+    prev_step = start_step
+    prev_d = None
+    degrees = diatonic_index([midi for _, _, midi in line], tonic_pc, offsets)
+    for k, (start, stop, midi) in enumerate(line):
+        pos = start / division
+        if k > 0:
+            gap = (start - line[k - 1][1]) / division
+            if gap >= MIN_REST_BEATS:
+                tok = n_durs + _dur_token(gap)
+                rhythm[_slot(pos - gap), prev_tok, tok] += 1
+                prev_tok = tok
+                if gap >= PHRASE_REST_BEATS:
+                    # as the generator does after a phrase's closing rest
+                    prev_tok = start_tok
+                    prev_step = start_step
+                    prev_d = None
+        end = line[k + 1][0] if k + 1 < len(line) else stop
+        if end - stop >= MIN_REST_BEATS * division:
+            end = stop                 # a rest follows
+        tok = _dur_token((end - start) / division)
+        rhythm[_slot(pos), prev_tok, tok] += 1
+        prev_tok = tok
+
+        d = int(degrees[k])
+        if prev_d is not None:
+            step = int(np.clip(d - prev_d, -STYLE_MAX_STEP, STYLE_MAX_STEP))
+            steps[prev_d % 7, prev_step, step + STYLE_MAX_STEP] += 1
+            prev_step = step + STYLE_MAX_STEP
+        prev_d = d
+    return tonic_pc, mode
+
+
+# ---------- compile ----------
+def back_off(counts):
+    """
+    Contexts never seen in training (all-zero rows) take the counts summed
+    over every previous step/token for the same degree/bar slot, or over
+    the whole table if that is empty too, instead of a uniform guess.
+    """
+    out = counts.copy()
+    total = counts.sum(axis=(0, 1))
+    for i in range(counts.shape[0]):
+        fallback = counts[i].sum(axis=0)
+        if fallback.sum() == 0:
+            fallback = total
+        out[i, counts[i].sum(axis=-1) == 0] = fallback
+    return out
+
+
+def to_cdf(counts, smoothing):
+    """Counts -> float32 CDF along the last axis (additive smoothing, so every row is a distribution)."""
+    p = counts + smoothing
+    cdf = np.cumsum(p, axis=-1)
+    cdf /= cdf[..., -1:]
+    return cdf.astype(np.float32)
+
+
+def save_style(out_dir, steps, rhythm, meta, smoothing):
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, "steps.npy"), to_cdf(back_off(steps), smoothing))
+    np.save(os.path.join(out_dir, "rhythm.npy"), to_cdf(back_off(rhythm), smoothing))
+    with open(os.path.join(out_dir, "style.json"), "w") as f:
+        json.dump(meta, f, indent=1)
+
+
+def find_midi_files(roots):
+    found = []
+    for root in roots:
+        for dirpath, _, files in os.walk(root):
+            for name in files:
+                if name.lower().endswith(MIDI_EXTS):
+                    found.append(os.path.join(dirpath, name))
+    return sorted(found)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train a melody style preset from MIDI files")
+    parser.add_argument("inputs", nargs="+", help="folders of .mid files")
+    parser.add_argument("--style", default=None, help="preset name (default: first folder's name)")
+    parser.add_argument("--out-dir", default=STYLES_DIR)
+    parser.add_argument("--smoothing", type=float, default=0.1, help="added to every count")
+    parser.add_argument("--min-notes", type=int, default=8, help="skip melodies shorter than this")
+    args = parser.parse_args()
+
+    style = args.style or os.path.basename(os.path.normpath(args.inputs[0]))
+    files = find_midi_files(args.inputs)
+    if not files:
+        print(f"No MIDI files found in {', '.join(args.inputs)}")
+        return
+
+    steps_shape, rhythm_shape = style_table_shapes()
+    steps = np.zeros(steps_shape)
+    rhythm = np.zeros(rhythm_shape)
+    used, skipped, n_notes, modes = 0, [], 0, {}
+    for path in files:
+        try:
+            division, parts = read_smf(path)
+        except (ValueError, IndexError, struct.error) as e:   # unreadable file: report and keep going
+            skipped.append({"file": path, "error": str(e) or "truncated"})
+            continue
+        line = pick_melody(parts)
+        if len(line) < args.min_notes:
+            skipped.append({"file": path, "error": f"{len(line)} melody notes"})
+            continue
+        _, mode = count_line(line, division, steps, rhythm)
+        modes[mode] = modes.get(mode, 0) + 1
+        used += 1
+        n_notes += len(line)
+
+    for s in skipped:
+        print(f"  skipped {s['file']}: {s['error']}")
+    if not used:
+        print("Nothing to train on.")
+        return
+
+    out = os.path.join(args.out_dir, style)
+    meta = {
+        "version": STYLE_VERSION,
+        "style": style,
+        "files": used,
+        "notes": n_notes,
+        "modes": modes,
+        "durs": list(STYLE_DURS),
+        "max_step": STYLE_MAX_STEP,
+        "bar_slots": STYLE_BAR_SLOTS,
+        "smoothing": args.smoothing,
+    }
+    save_style(out, steps, rhythm, meta, args.smoothing)
+
+    step_hist = steps.sum(axis=(0, 1))
+    common = np.argsort(step_hist)[::-1][:5] - STYLE_MAX_STEP
+    print(f"Style '{style}': {used} melodies, {n_notes} notes "
+          f"({', '.join(f'{n} {m}' for m, n in sorted(modes.items()))}) -> {out}")
+    print(f"  most common degree steps: {', '.join(f'{s:+d}' for s in common)}")
+
+
+if __name__ == "__main__":
+    main()
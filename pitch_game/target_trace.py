@@ -9,20 +9,13 @@ def events_to_target_trace(events, bpm, hop_size, sr):
     """
     sec_per_beat = 60.0 / bpm
     dt = hop_size / sr
+    if not events:
+        return np.zeros(0), np.zeros(0)
 
-    t_list = []
-    hz_list = []
-    t = 0.0
+    dur_beats = np.array([d for d, _ in events], float)
+    midi = np.array([np.nan if m is None else m for _, m in events], float)
+    n_frames = np.round(dur_beats * sec_per_beat / dt).astype(int)
 
-    for dur_beats, note_midi in events:
-        dur_sec = dur_beats * sec_per_beat
-        n_frames = int(np.round(dur_sec / dt))
-
-        hz_val = np.nan if note_midi is None else float(midi_to_hz(note_midi))
-
-        for _ in range(n_frames):
-            t_list.append(t)
-            hz_list.append(hz_val)
-            t += dt
-
-    return np.array(t_list, float), np.array(hz_list, float)
+    # one hz per event, repeated over its frames (NaN stays NaN = pause)
+    hz = np.repeat(midi_to_hz(midi), n_frames)
+    return np.arange(len(hz)) * dt, hz
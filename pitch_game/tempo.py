@@ -0,0 +1,130 @@
+# tempo.py
+"""
+Tempo maps: beats <-> seconds for a level whose tempo is not one number.
+
+    tm = TempoMap.constant(90)
+    tm = TempoMap.from_points([(0, 80), (16, 100), (32, 90)])             # per-phrase BPM
+    tm = TempoMap.from_points([(0, 70), (32, 110)], ramp=True)            # accelerando
+    tm = tm.rescaled(0.8)                                                 # practice at 80%
+    tm = tm.rescaled(1.1, from_beat=tm.beats(12.5))                       # live, from now on
+
+    tm.seconds(beats)   # vectorized
+    tm.beats(seconds)   # vectorized inverse
+
+A map is a list of segments (start beat, bpm, end bpm). Inside a segment
+the tempo is constant or changes linearly with the beat position, so
+both directions have a closed form and a lookup is one searchsorted over
+the segments. The last segment runs on at its end tempo. Maps are never
+changed in place; rescaled() returns a new one and leaves everything
+before from_beat where it was, which is what lets a level change tempo
+mid-play without its past moving.
+"""
+import numpy as np
+
+
+class TempoMap:
+    def __init__(self, segments):
+        """segments: [(start_beat, bpm, end_bpm), ...], the first at beat 0, start beats increasing."""
+        seg = np.asarray(segments, float).reshape(-1, 3)
+        if len(seg) == 0 or seg[0, 0] != 0.0:
+            raise ValueError("a tempo map starts at beat 0")
+        if np.any(np.diff(seg[:, 0]) <= 0.0):
+            raise ValueError("tempo segments must start at increasing beats")
+        if np.any(seg[:, 1:] <= 0.0):
+            raise ValueError("tempos must be positive")
+        seg[-1, 2] = seg[-1, 1]        # the last segment holds its tempo
+
+        self.b0 = seg[:, 0]
+        self.bpm0 = seg[:, 1]
+        self.bpm1 = seg[:, 2]
+        length = np.diff(self.b0)
+        self._slope = np.zeros(len(seg))            # bpm per beat
+        self._slope[:-1] = (self.bpm1[:-1] - self.bpm0[:-1]) / length
+        self.t0 = np.zeros(len(seg))                # segment start, seconds
+        self.t0[1:] = np.cumsum(self._span(np.arange(len(seg) - 1), length))
+
+    # ---------- construction ----------
+    @classmethod
+    def constant(cls, bpm):
+        return cls([(0.0, bpm, bpm)])
+
+    @classmethod
+    def from_points(cls, points, ramp=False):
+        """(beat, bpm) points: the tempo steps at each one, or with ramp=True moves linearly to the next."""
+        points = sorted((float(b), float(bpm)) for b, bpm in points)
+        if points[0][0] > 0.0:
+            points.insert(0, (0.0, points[0][1]))
+        return cls([
+            (b, bpm, points[i + 1][1] if ramp and i + 1 < len(points) else bpm)
+            for i, (b, bpm) in enumerate(points)
+        ])
+
+    @classmethod
+    def from_list(cls, data):
+        """The to_list() layout, or a plain bpm number."""
+        if isinstance(data, (int, float)):
+            return cls.constant(data)
+        return cls(data)
+
+    def to_list(self):
+        return [[float(b), float(a), float(z)] for b, a, z in zip(self.b0, self.bpm0, self.bpm1)]
+
+    @property
+    def is_constant(self):
+        return len(self.b0) == 1
+
+    def __eq__(self, other):
+        return isinstance(other, TempoMap) and self.to_list() == other.to_list()
+
+    def __repr__(self):
+        if self.is_constant:
+            return f"TempoMap.constant({self.bpm0[0]:g})"
+        return f"TempoMap({self.to_list()})"
+
+    # ---------- lookups ----------
+    def _span(self, i, x):
+        """Seconds from the start of segment(s) i to x beats into it."""
+        k = self._slope[i]
+        a = self.bpm0[i]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ramp = 60.0 / k * np.log1p(k * x / a)
+        return np.where(k == 0.0, 60.0 * x / a, ramp)
+
+    def seconds(self, beats):
+        """Time (s) of beat position(s)."""
+        b = np.asarray(beats, float)
+        i = np.clip(np.searchsorted(self.b0, b, side="right") - 1, 0, None)
+        t = self.t0[i] + self._span(i, b - self.b0[i])
+        return float(t) if t.ndim == 0 else t
+
+    def beats(self, seconds):
+        """Beat position(s) at time(s) in seconds."""
+        t = np.asarray(seconds, float)
+        i = np.clip(np.searchsorted(self.t0, t, side="right") - 1, 0, None)
+        k = self._slope[i]
+        a = self.bpm0[i]
+        dt = t - self.t0[i]
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            ramp = a * np.expm1(k * dt / 60.0) / k
+        b = self.b0[i] + np.where(k == 0.0, a * dt / 60.0, ramp)
+        return float(b) if b.ndim == 0 else b
+
+    def bpm_at(self, beat):
+        i = max(0, int(np.searchsorted(self.b0, beat, side="right")) - 1)
+        return float(self.bpm0[i] + self._slope[i] * (beat - self.b0[i]))
+
+    # ---------- changes ----------
+    def rescaled(self, factor, from_beat=0.0):
+        """New map with every tempo from `from_beat` on multiplied by factor; earlier beats keep their times."""
+        out = self.to_list()
+        i = max(0, int(np.searchsorted(self.b0, from_beat, side="right")) - 1)
+        if from_beat > self.b0[i]:
+            # split the segment at from_beat
+            mid = self.bpm_at(from_beat)
+            out.insert(i + 1, [from_beat, mid, out[i][2]])
+            out[i][2] = mid
+            i += 1
+        for seg in out[i:]:
+            seg[1] *= factor
+            seg[2] *= factor
+        return TempoMap(out)
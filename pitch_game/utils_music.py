@@ -5,21 +5,112 @@ import numpy as np
 A4 = 440.0
 NOTE_NAMES = ["C","C#","D","D#","E","F","F#","G","G#","A","A#","B"]
 
-def midi_to_hz(midi):
-    midi = np.asarray(midi, dtype=float)
-    return A4 * (2 ** ((midi - 69) / 12))
+# Kernels below take scalars or arrays. Arrays keep float32 if they are
+# float32 (other input becomes float64 unless dtype= says otherwise), and
+# out= writes the result into a preallocated array of the same shape, so
+# per-frame code can convert without allocating.
 
-def hz_to_midi(hz):
-    hz = np.asarray(hz, dtype=float)
-    return 69 + 12 * np.log2(hz / A4)
+def _as_float(x, dtype, out):
+    x = np.asarray(x)
+    if out is not None:
+        dtype = out.dtype
+    elif dtype is None:
+        dtype = x.dtype if x.dtype in (np.float32, np.float64) else np.float64
+    return x.astype(dtype, copy=False)
+
+def midi_to_hz(midi, out=None, dtype=None):
+    midi = _as_float(midi, dtype, out)
+    if midi.ndim == 0 and out is None:
+        return midi.dtype.type(A4 * 2.0 ** ((float(midi) - 69.0) / 12.0))
+    out = np.subtract(midi, 69.0, out=out, dtype=midi.dtype)
+    out *= 1.0 / 12.0
+    np.exp2(out, out=out)
+    out *= A4
+    return out
+
+def hz_to_midi(hz, out=None, dtype=None):
+    """Unvoiced (NaN) stays NaN; 0 Hz gives -inf."""
+    hz = _as_float(hz, dtype, out)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if hz.ndim == 0 and out is None:
+            return hz.dtype.type(69.0 + 12.0 * np.log2(hz / A4))
+        out = np.multiply(hz, 1.0 / A4, out=out, dtype=hz.dtype)
+        np.log2(out, out=out)
+    out *= 12.0
+    out += 69.0
+    return out
+
+# midi 0..127 -> "C-1".."G9", built once
+NOTE_NAME_TABLE = [f"{NOTE_NAMES[n % 12]}{n // 12 - 1}" for n in range(128)]
+_NOTE_NAME_ARRAY = np.array(NOTE_NAME_TABLE, dtype=object)
 
 def midi_to_name(midi):
     n = int(round(midi))
-    name = NOTE_NAMES[n % 12]
-    octave = n // 12 - 1
-    return f"{name}{octave}"
-
-def cents_error(hz, target_hz):
-    if not np.isfinite(hz) or not np.isfinite(target_hz):
-        return np.nan
-    return 1200 * math.log2(hz / target_hz)
+    if 0 <= n < 128:
+        return NOTE_NAME_TABLE[n]
+    return f"{NOTE_NAMES[n % 12]}{n // 12 - 1}"
+
+def midi_names(midi):
+    """Vectorized midi_to_name (rounds, clips to 0..127): object array of names."""
+    idx = np.clip(np.rint(np.asarray(midi, dtype=float)), 0, 127).astype(np.intp)
+    return _NOTE_NAME_ARRAY[idx]
+
+def cents_error(hz, target_hz, out=None):
+    """
+    1200*log2(hz/target). Scalars: NaN unless both are finite. Arrays
+    (broadcast): NaN wherever either side is unvoiced (NaN or <= 0).
+    """
+    if out is None and np.ndim(hz) == 0 and np.ndim(target_hz) == 0:
+        if not np.isfinite(hz) or not np.isfinite(target_hz):
+            return np.nan
+        return 1200 * math.log2(hz / target_hz)
+    hz = np.asarray(hz)
+    target_hz = np.asarray(target_hz)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = np.divide(hz, target_hz, out=out)
+        np.log2(out, out=out)
+    out *= 1200.0
+    out[~np.isfinite(out)] = np.nan
+    return out
+
+def quantize_to_scale(midi, tonic_midi, mode_offsets, out=None):
+    """
+    Nearest note of the scale (tonic + mode_offsets, e.g. MODES["dorian"])
+    for each MIDI value; NaN stays NaN. Ties go to the lower note.
+    """
+    midi = np.asarray(midi)
+    degrees = np.array(sorted(mode_offsets) + [12 + min(mode_offsets)], dtype=float)
+    rel = midi - tonic_midi
+    octave = np.floor(rel / 12.0)
+    within = rel - 12.0 * octave
+    nearest = degrees[np.argmin(np.abs(within[..., None] - degrees), axis=-1)]
+    return np.add(nearest + 12.0 * octave, tonic_midi, out=out)
+
+
+INTERVAL_NAMES = {
+    1: "semitone",
+    2: "tone",
+    3: "minor third",
+    4: "major third",
+    5: "fourth",
+    7: "fifth",
+}
+
+def interval_label(semitones_signed):
+    if not np.isfinite(semitones_signed):
+        return None
+    direction = (
+        "ascending" if semitones_signed > 0
+        else "descending" if semitones_signed < 0
+        else "unison"
+    )
+    st = int(round(abs(semitones_signed)))
+    name = INTERVAL_NAMES.get(st, f"{st} semitones")
+    return "unison" if direction == "unison" else f"{name} {direction}"
+
+def interval_name(semitones_signed):
+    """INTERVAL_NAMES category without direction ("fifth", "unison", "6 semitones")."""
+    st = int(round(abs(semitones_signed)))
+    if st == 0:
+        return "unison"
+    return INTERVAL_NAMES.get(st, f"{st} semitones")
@@ -0,0 +1,54 @@
+# test_guide_tone.py
+"""
+GuideVoice through a duplex SimulatedLoopback: each note must reach the
+mic at level start + note time + the simulated delay. The attack ramp's
+first few samples sit under the onset level, so a note may be heard a
+few samples late, never early. Run from the repo root:  python -m pytest unit_test
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "pitch_game"))
+
+import clock
+from audio_pitch import PitchStream
+from game_core import Level
+from guide_tone import GuideVoice
+from latency_probe import SimulatedLoopback
+from config import SR
+
+ONSET_LEVEL = 1e-4    # well above the simulated noise floor (1e-5)
+RAMP_SAMPLES = 6      # attack ramp samples that can stay under ONSET_LEVEL
+
+
+def test_guide_onsets_land_on_note_times():
+    sim = SimulatedLoopback(delay_s=0.03, jitter_s=0.004, noise=1e-5)
+    ps = PitchStream(duplex=True, stream_factory=sim.Stream, use_governor=False)
+    level = Level([(0.5, None), (1, 60), (0.5, None), (1, 64)], 120)
+    taps = []
+    ps.hop_tap = lambda hop, t: taps.append((hop.copy(), t))
+
+    with ps.open_stream():
+        time.sleep(0.2)
+        t0 = clock.now() + 0.137          # not on a block boundary
+        guide = GuideVoice(level, t0)
+        guide.start(ps)
+        try:
+            time.sleep(level.duration + 0.2)
+        finally:
+            guide.stop()
+
+    t_on, _ = level.times
+    onsets = t0 + t_on[np.isfinite(level.midi)] + sim.delay_s
+    for expected in onsets:
+        heard = None
+        for hop, t in taps:
+            loud = np.flatnonzero(np.abs(hop) > ONSET_LEVEL)
+            if len(loud) and t + loud[0] / SR > expected - 0.01:
+                heard = t + loud[0] / SR
+                break
+        assert heard is not None, expected
+        assert -1.0 / SR < heard - expected < RAMP_SAMPLES / SR, (heard - expected) * SR
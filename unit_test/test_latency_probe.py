@@ -0,0 +1,29 @@
+# test_latency_probe.py
+"""
+latency_probe against SimulatedLoopback: no audio hardware (or PortAudio)
+needed, and the measured input latency must come back as the simulated
+delay. Run from the repo root:  python -m pytest unit_test
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "pitch_game"))
+
+from audio_pitch import PitchStream
+from latency_probe import LatencyProbe, SimulatedLoopback, measure
+from config import SR
+
+
+@pytest.mark.parametrize("delay_s", [0.03, 0.08])
+def test_simulated_delay_is_measured(delay_s):
+    sim = SimulatedLoopback(delay_s=delay_s, jitter_s=0.005)
+    probe = LatencyProbe(count=3)
+    rows = measure(PitchStream(stream_factory=sim.InputStream), sim.OutputStream, probe)
+
+    assert all(r["total"] is not None for r in rows), rows
+    for r in rows:
+        # onset found to within a couple of samples of the simulated delay
+        assert abs(r["input"] - delay_s) < 3.0 / SR + 1e-4, r
+        assert r["detect"] > 0.0
@@ -0,0 +1,123 @@
+# test_results_ring.py
+"""
+ResultRing and its cursors: reads stay contiguous across the wrap, a
+reader that falls behind loses exactly the overwritten records, cursors
+don't disturb each other, and latest() never returns a torn record while
+the writer runs. Run from the repo root:  python -m pytest unit_test
+"""
+import os
+import sys
+import threading
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "pitch_game"))
+
+from results_ring import ResultRing
+
+CAPACITY = 8
+
+
+def publish(ring, k):
+    """Record k has every field equal to k, so a torn copy shows."""
+    ring.publish(k, k, k, k, k, k)
+
+
+def test_reads_wrap_around_contiguously():
+    ring = ResultRing(capacity=CAPACITY)
+    cursor = ring.subscribe()
+    seen = []
+    for k in range(3 * CAPACITY + 3):
+        publish(ring, k)
+        if k % 5 == 4:                         # reads of 5, straddling the wrap
+            recs, lost = cursor.read()
+            assert lost == 0
+            seen.extend(recs["t_adc"])
+    recs, lost = cursor.read()
+    seen.extend(recs["t_adc"])
+    assert seen == list(range(3 * CAPACITY + 3))
+    assert cursor.pending == 0 and cursor.lost == 0
+
+
+def test_overrun_skips_to_oldest_and_counts_lost():
+    ring = ResultRing(capacity=CAPACITY)
+    cursor = ring.subscribe()
+    n = 3 * CAPACITY
+    for k in range(n):
+        publish(ring, k)
+    view, lost = cursor.read()
+    # the slot being filled next is the oldest, so capacity - 1 survive
+    assert lost == n - (CAPACITY - 1)
+    assert list(view["t_adc"]) == list(range(n - CAPACITY + 1, n))
+    assert cursor.lost == lost and cursor.intact()
+
+    for k in range(n, n + CAPACITY):
+        publish(ring, k)                       # the writer laps the view just returned
+    assert not cursor.intact()
+    view, lost = cursor.read()
+    assert lost == 1 and view["t_adc"][0] == n + 1
+
+
+def test_cursors_are_independent():
+    ring = ResultRing(capacity=CAPACITY)
+    fast, slow = ring.subscribe(), ring.subscribe()
+    for k in range(4):
+        publish(ring, k)
+    assert list(fast.read()[0]["t_adc"]) == [0, 1, 2, 3]
+    late = ring.subscribe()
+    early = ring.subscribe(from_oldest=True)
+    for k in range(4, 6):
+        publish(ring, k)
+
+    assert list(fast.read()[0]["t_adc"]) == [4, 5]
+    assert list(late.read()[0]["t_adc"]) == [4, 5]
+    assert list(early.read()[0]["t_adc"]) == [0, 1, 2, 3, 4, 5]
+    assert slow.pending == 6
+    assert list(slow.read()[0]["t_adc"]) == [0, 1, 2, 3, 4, 5]
+    assert fast.pending == slow.pending == 0
+
+
+def test_latest_is_never_torn():
+    ring = ResultRing(capacity=4)
+    assert ring.latest() is None
+    n = 100_000
+    done = threading.Event()
+
+    def writer():
+        for k in range(1, n + 1):
+            publish(ring, k)
+        done.set()
+
+    threading.Thread(target=writer, daemon=True).start()
+    prev = 0
+    while not done.is_set():
+        rec = ring.latest()
+        if rec is None:
+            continue
+        k = rec["t_adc"]
+        assert rec["t_enq"] == rec["t_det"] == rec["hz"] == rec["conf"] == rec["flags"] == k
+        assert k >= prev
+        prev = k
+    assert ring.latest()["t_adc"] == n
+    assert np.isclose(ring.last(2)["hz"], [n - 1, n]).all()
+
+
+def test_latest_retries_when_lapped_mid_copy():
+    ring = ResultRing(capacity=CAPACITY)
+    for k in range(1, 4):
+        publish(ring, k)
+    buf = ring._buf
+
+    class LapDuringCopy:
+        """The writer gets most of a ring ahead while latest() copies: the copy is torn."""
+        def __getitem__(self, i):
+            ring._buf = buf
+            torn = buf[i].copy()
+            for k in range(4, 3 + CAPACITY):
+                publish(ring, k)
+            torn["hz"] = buf[i]["hz"] + 1
+            return torn
+
+    ring._buf = LapDuringCopy()
+    rec = ring.latest()
+    assert rec["t_adc"] == rec["hz"] == 2 + CAPACITY
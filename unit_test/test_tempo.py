@@ -0,0 +1,58 @@
+# test_tempo.py
+"""
+TempoMap: seconds() and beats() are inverses for constant, stepped and
+ramped maps (and rescaled ones), ramps match a numeric integral of
+60/bpm, and rescaling never moves the past. Run from the repo root:
+python -m pytest unit_test
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "pitch_game"))
+
+from tempo import TempoMap
+
+MAPS = {
+    "constant": TempoMap.constant(90),
+    "steps": TempoMap.from_points([(0, 80), (16, 100), (32, 90)]),
+    "accelerando": TempoMap.from_points([(0, 70), (32, 110)], ramp=True),
+    "ritardando": TempoMap.from_points([(0, 120), (8, 120), (24, 60)], ramp=True),
+    "rescaled live": TempoMap.from_points([(0, 70), (32, 110)], ramp=True).rescaled(0.8, from_beat=12.5),
+}
+BEATS = np.concatenate([np.linspace(0.0, 48.0, 577), [8.0, 16.0, 24.0, 32.0]])
+
+
+@pytest.mark.parametrize("name", sorted(MAPS))
+def test_round_trip(name):
+    tm = MAPS[name]
+    t = tm.seconds(BEATS)
+    assert np.all(np.diff(t[:577]) > 0)
+    np.testing.assert_allclose(tm.beats(t), BEATS, atol=1e-9)
+    np.testing.assert_allclose(tm.seconds(tm.beats(t)), t, atol=1e-9)
+    assert isinstance(tm.seconds(3.0), float) and isinstance(tm.beats(2.0), float)
+
+
+@pytest.mark.parametrize("name", sorted(MAPS))
+def test_seconds_integrate_the_tempo(name):
+    tm = MAPS[name]
+    b = np.linspace(0.0, 48.0, 48001)
+    mid = 0.5 * (b[1:] + b[:-1])                    # midpoint rule: exact across tempo steps
+    spb = 60.0 / np.array([tm.bpm_at(x) for x in mid])
+    t = np.concatenate([[0.0], np.cumsum(spb * np.diff(b))])
+    np.testing.assert_allclose(tm.seconds(b), t, atol=1e-6)
+
+
+def test_rescaled_keeps_the_past():
+    tm = MAPS["steps"]
+    at = 20.0
+    faster = tm.rescaled(1.25, from_beat=at)
+    before = np.linspace(0.0, at, 50)
+    after = np.linspace(at, 48.0, 50)
+    np.testing.assert_allclose(faster.seconds(before), tm.seconds(before), atol=1e-12)
+    np.testing.assert_allclose(faster.seconds(after) - faster.seconds(at),
+                               (tm.seconds(after) - tm.seconds(at)) / 1.25, atol=1e-9)
+    assert TempoMap.from_list(faster.to_list()) == faster
+    assert TempoMap.from_list(90) == MAPS["constant"]
@@ -0,0 +1,47 @@
+# test_utils_music.py
+"""
+quantize_to_scale against a plain per-note version: nearest scale note,
+ties to the lower one, NaN kept, float32 out= honoured. Run from the repo
+root:  python -m pytest unit_test
+"""
+import math
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "pitch_game"))
+
+from melody_generator import MODES
+from utils_music import quantize_to_scale
+
+
+def snap_one(m, tonic, offsets):
+    if not math.isfinite(m):
+        return math.nan
+    base = tonic + 12 * math.floor((m - tonic) / 12)
+    notes = [base + o for o in offsets] + [base + 12 + min(offsets)]
+    return min(notes, key=lambda c: (abs(m - c), c))
+
+
+@pytest.mark.parametrize("mode", sorted(MODES))
+@pytest.mark.parametrize("tonic", [57, 62, 66])
+def test_quantize_matches_scalar(mode, tonic):
+    offsets = MODES[mode]
+    midi = np.concatenate([np.arange(30.0, 90.0, 0.25),                 # every tie and exact note
+                           np.random.default_rng(tonic).uniform(30, 90, 500),
+                           [np.nan]])
+    expected = [snap_one(m, tonic, offsets) for m in midi]
+    np.testing.assert_array_equal(quantize_to_scale(midi, tonic, offsets), expected)
+
+    out = np.empty(len(midi), dtype=np.float32)
+    got = quantize_to_scale(midi.astype(np.float32), tonic, offsets, out=out)
+    assert got is out
+    np.testing.assert_array_equal(out, np.float32(expected))
+
+
+def test_quantize_scalar_input():
+    assert quantize_to_scale(61.0, 60, MODES["ionian"]) == 60.0      # C# ties down to C
+    assert quantize_to_scale(71.6, 60, MODES["ionian"]) == 72.0      # B+ up across the octave
+    assert np.isnan(quantize_to_scale(np.nan, 60, MODES["ionian"]))